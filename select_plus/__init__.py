@@ -1,4 +1,5 @@
 from select_plus.ssp import SSP, BaseEngine
 from select_plus.src.engine.parallel_engine import ParallelEngine
 from select_plus.src.engine.sequential_engine import SequentialEngine
+from select_plus.src.engine.threaded_engine import ThreadedEngine
 from select_plus.src.models import models as serializer
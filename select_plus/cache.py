@@ -0,0 +1,3 @@
+from select_plus.src.cache.listing_cache import ListingCache
+from select_plus.src.cache.result_cache import BaseResultCache, DirectoryResultCache, SQLiteResultCache
+from select_plus.src.cache.checkpoint import Checkpoint
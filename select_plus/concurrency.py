@@ -0,0 +1 @@
+from select_plus.src.utils.concurrency import ConcurrencyLimiter
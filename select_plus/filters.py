@@ -0,0 +1 @@
+from select_plus.src.utils.filters import ObjectFilter, AllFilters
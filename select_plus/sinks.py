@@ -0,0 +1 @@
+from select_plus.src.sinks.sinks import BaseSink, DirectorySink, ParquetSink
@@ -1,15 +1,57 @@
-from typing import Any
+import os
+import codecs
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator, Optional
 import boto3
 from botocore.config import Config
 
+from select_plus.src.utils.parsers import record_delimiter
+from select_plus.src.cache.listing_cache import ListingCache
+
+# Retries of the S3 client on errors and throttling
+MAX_ATTEMPTS = 10
+
 
 class S3:
 
-    def __init__(self, client: boto3.session.Session.client = None):
+    # Clients cached per process and connection pool size. boto3 clients are thread safe, but creating them is not.
+    _clients = {}
+    _clients_lock = threading.Lock()
+
+    def __init__(self, client: boto3.session.Session.client = None, max_pool_connections: int = 10,
+                 max_attempts: int = MAX_ATTEMPTS):
+        """
+        With max_attempts=0, the client does not retry: used when a ConcurrencyLimiter retries the throttled requests
+        itself.
+        """
         self.config = Config(
-            retries=dict(max_attempts=10)
+            retries=dict(max_attempts=max_attempts),
+            max_pool_connections=max_pool_connections,
+            tcp_keepalive=True
         )
-        self.client = client if client else boto3.client('s3', config=self.config)
+        self.client = client if client else self._get_client(self.config)
+
+    @classmethod
+    def _get_client(cls, config: Config) -> boto3.session.Session.client:
+        """
+        Creating a client loads the service model, resolves the endpoints and opens a new connection pool.
+        The client is therefore created once per process (a forked worker gets its own) and reused afterwards,
+        which also keeps the open connections alive between queries.
+        """
+        cache_key = (os.getpid(), config.max_pool_connections, config.retries['max_attempts'])
+        with cls._clients_lock:
+            if cache_key not in cls._clients:
+                cls._clients[cache_key] = boto3.client('s3', config=config)
+            return cls._clients[cache_key]
+
+    @classmethod
+    def clear_clients(cls):
+        """
+        Drops all the cached clients. The next S3 instance without a client will create a new one.
+        """
+        with cls._clients_lock:
+            cls._clients.clear()
 
     def put_object(self, bucket_name: str, key: str, body: Any):
         """
@@ -17,7 +59,8 @@ class S3:
         """
         self.client.put_object(Body=str(body).encode(), Bucket=bucket_name, Key=key)
 
-    def list_objects(self, bucket_name: str, prefix: str):
+    def list_objects(self, bucket_name: str, prefix: str, list_concurrency: Optional[int] = None,
+                     listing_cache: Optional[ListingCache] = None, prefix_filter: Optional[callable] = None):
         """
         Lists all objects in S3 with a prefix.
         """
@@ -25,34 +68,200 @@ class S3:
         total_files = 0
         total_file_size = 0
         keys = []
+        objects = []
 
-        paginator = self.client.get_paginator('list_objects_v2')
-
-        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
-            total_files += page['KeyCount']
-
-            if total_files == 0:
-                raise RuntimeError(f'No files found in prefix {prefix}')
-
-            for content in page['Contents']:
-                keys.append(content['Key'])
-                total_file_size += content['Size']
+        for page in self.iter_objects(bucket_name=bucket_name, prefix=prefix, list_concurrency=list_concurrency,
+                                      listing_cache=listing_cache, prefix_filter=prefix_filter):
+            total_files += len(page)
+            for s3_object in page:
+                keys.append(s3_object['key'])
+                objects.append(s3_object)
+                total_file_size += s3_object['size']
 
         response = {
             "total_files": total_files,
             "total_file_size": total_file_size,
-            "keys": keys
+            "keys": keys,
+            "objects": objects
         }
         return response
 
+    def iter_objects(self, bucket_name: str, prefix: str, list_concurrency: Optional[int] = None,
+                     listing_cache: Optional[ListingCache] = None,
+                     prefix_filter: Optional[callable] = None) -> Iterator[list]:
+        """
+        Lists the objects in S3 with a prefix, yielding each page of the listing (up to 1000 objects, each
+        {"key": key, "size": size, "etag": etag, "last_modified": datetime}) as soon as it is received, so the objects
+        can be queried while the next pages are fetched.
+        With a list_concurrency, the sub-prefixes ("folders") of the prefix are listed in parallel by up to that many
+        threads. The objects are yielded in the same order either way.
+        With a listing_cache, a listing of the prefix still in the cache is used instead of listing again, and a new
+        listing is added to the cache once it is complete.
+        With a list_concurrency, the sub-prefixes for which prefix_filter(sub_prefix) is false are not listed. The
+        prefix_filter is not used with a listing_cache, which only holds complete listings.
+        """
+        if listing_cache is not None:
+            objects = listing_cache.get(bucket_name=bucket_name, prefix=prefix)
+            if objects is not None:
+                for start in range(0, len(objects), 1000):
+                    yield objects[start:start + 1000]
+                return
+
+        pruned = []
+        if list_concurrency and list_concurrency > 1:
+            if prefix_filter is not None and listing_cache is None:
+                def keep_prefix(name: str) -> bool:
+                    keep = prefix_filter(name)
+                    if not keep:
+                        pruned.append(name)
+                    return keep
+            else:
+                keep_prefix = None
+            pages = self._iter_pages_by_prefix(bucket_name=bucket_name, prefix=prefix,
+                                               list_concurrency=list_concurrency, prefix_filter=keep_prefix)
+        else:
+            pages = self._iter_pages(bucket_name=bucket_name, prefix=prefix)
+
+        total_files = 0
+        # The listing is only kept in memory to be added to the cache
+        objects = [] if listing_cache is not None else None
+        for page in pages:
+            if page:
+                total_files += len(page)
+                if objects is not None:
+                    objects.extend(page)
+                yield page
+
+        if total_files == 0 and not pruned:
+            raise RuntimeError(f'No files found in prefix {prefix}')
+
+        if listing_cache is not None:
+            listing_cache.put(bucket_name=bucket_name, prefix=prefix, objects=objects)
+
+    def _iter_pages(self, bucket_name: str, prefix: str) -> Iterator[list]:
+        paginator = self.client.get_paginator('list_objects_v2')
+
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+            yield [self._make_object(content) for content in page.get('Contents', [])]
+
+    @staticmethod
+    def _make_object(content: dict) -> dict:
+        return {
+            "key": content['Key'],
+            "size": content['Size'],
+            "etag": content.get('ETag', '').strip('"') or None,
+            "last_modified": content.get('LastModified')
+        }
+
+    def _list_pages(self, bucket_name: str, prefix: str) -> list:
+        return list(self._iter_pages(bucket_name=bucket_name, prefix=prefix))
+
+    def _list_level(self, bucket_name: str, prefix: str) -> list:
+        """
+        Lists one level of the prefix with the "/" delimiter: (key, object) for the objects directly under the prefix
+        and (sub-prefix, None) for each sub-prefix, sorted in the order of a full listing.
+        """
+        entries = []
+        paginator = self.client.get_paginator('list_objects_v2')
+
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix, Delimiter='/'):
+            for content in page.get('Contents', []):
+                entries.append((content['Key'], self._make_object(content)))
+            for common_prefix in page.get('CommonPrefixes', []):
+                entries.append((common_prefix['Prefix'], None))
+
+        return sorted(entries, key=lambda entry: entry[0])
+
+    def _iter_pages_by_prefix(self, bucket_name: str, prefix: str, list_concurrency: int,
+                              prefix_filter: Optional[callable] = None) -> Iterator[list]:
+        """
+        Finds the sub-prefixes of the prefix (going down while there is a single one, e.g. "data" -> "data/") and
+        lists each of them in a pool of threads. The pages of a sub-prefix are yielded once it is fully listed, in
+        order, while the next sub-prefixes are still being listed.
+        """
+        entries = self._list_level(bucket_name=bucket_name, prefix=prefix)
+        while len(entries) == 1 and entries[0][1] is None:
+            entries = self._list_level(bucket_name=bucket_name, prefix=entries[0][0])
+
+        if prefix_filter is not None:
+            entries = [(name, s3_object) for name, s3_object in entries
+                       if s3_object is not None or prefix_filter(name)]
+
+        executor = ThreadPoolExecutor(max_workers=list_concurrency)
+        futures = {name: executor.submit(self._list_pages, bucket_name, name)
+                   for name, s3_object in entries if s3_object is None}
+        try:
+            page = []
+            for name, s3_object in entries:
+                if s3_object is not None:
+                    page.append(s3_object)
+                    if len(page) == 1000:
+                        yield page
+                        page = []
+                    continue
+
+                if page:
+                    yield page
+                    page = []
+                yield from futures[name].result()
+
+            if page:
+                yield page
+        finally:
+            for future in futures.values():
+                future.cancel()
+            executor.shutdown(wait=True)
+
     def select(self,
                bucket_name: str,
                key: str,
                sql_string: str,
                input_serialization: dict,
-               output_serialization: dict
+               output_serialization: dict,
+               scan_range: Optional[dict] = None
                ) -> dict:
 
+        full_content = []
+        stats = {
+            "bytes_scanned": None,
+            "bytes_processed": None,
+            "bytes_returned": None,
+        }
+
+        for event in self.select_iter(bucket_name=bucket_name, key=key, sql_string=sql_string,
+                                      input_serialization=input_serialization,
+                                      output_serialization=output_serialization, scan_range=scan_range):
+            if "payload" in event:
+                full_content.append(event['payload'])
+            if "stats" in event:
+                stats = event['stats']
+
+        content = {
+            "payload": ''.join(full_content),
+            "stats": stats
+        }
+
+        return content
+
+    def select_iter(self,
+                    bucket_name: str,
+                    key: str,
+                    sql_string: str,
+                    input_serialization: dict,
+                    output_serialization: dict,
+                    scan_range: Optional[dict] = None
+                    ) -> Iterator[dict]:
+        """
+        Streaming variant of "select". The event stream is consumed as it arrives and the following are yielded:
+            {"payload": "<records>"} - for each batch of complete records decoded from the "Records" events
+            {"stats": {...}} - once the "Stats" event arrives
+        A record split across two "Records" events is held back until the rest of it arrives.
+        With a scan_range ({"Start": ..., "End": ...}), only the records starting within that byte range are queried.
+        """
+        params = {}
+        if scan_range:
+            params['ScanRange'] = scan_range
+
         response = self.client.select_object_content(
             Bucket=bucket_name,
             Key=key,
@@ -62,31 +271,38 @@ class S3:
                 'Enabled': True
             },
             InputSerialization=input_serialization,
-            OutputSerialization=output_serialization
+            OutputSerialization=output_serialization,
+            **params
         )
 
-        payload = list(response['Payload'])
+        delimiter = record_delimiter(output_serialization)
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        remainder = ''
 
-        full_content = []
-        bytes_scanned = None
-        bytes_processed = None
-        bytes_returned = None
-
-        for item in payload:
-            if "Records" in item.keys():
-                full_content.append(item['Records']['Payload'].decode())
-            if "Stats" in item.keys():
-                bytes_scanned = item['Stats']['Details']['BytesScanned']
-                bytes_processed = item['Stats']['Details']['BytesProcessed']
-                bytes_returned = item['Stats']['Details']['BytesReturned']
+        for event in response['Payload']:
+            if "Records" in event:
+                chunk = remainder + decoder.decode(event['Records']['Payload'])
+                last_delimiter = chunk.rfind(delimiter)
+                if last_delimiter == -1:
+                    remainder = chunk
+                    continue
+                split_at = last_delimiter + len(delimiter)
+                remainder = chunk[split_at:]
+                yield {"payload": chunk[:split_at]}
+            if "Stats" in event:
+                # All the records are sent before the statistics
+                remainder += decoder.decode(b'', final=True)
+                if remainder:
+                    yield {"payload": remainder}
+                    remainder = ''
+                yield {"stats": {
+                    "bytes_scanned": event['Stats']['Details']['BytesScanned'],
+                    "bytes_processed": event['Stats']['Details']['BytesProcessed'],
+                    "bytes_returned": event['Stats']['Details']['BytesReturned'],
+                }}
+            if "End" in event:
+                break
 
-        content = {
-            "payload": ''.join(full_content),
-            "stats": {
-                "bytes_scanned": bytes_scanned,
-                "bytes_processed": bytes_processed,
-                "bytes_returned": bytes_returned,
-            }
-        }
-
-        return content
+        remainder += decoder.decode(b'', final=True)
+        if remainder:
+            yield {"payload": remainder}
@@ -0,0 +1,59 @@
+import os
+import json
+import threading
+from datetime import datetime
+from typing import Iterable, Optional
+
+
+class Checkpoint:
+    """
+    Keeps, in a JSON file, the version (ETag and LastModified) of each object processed by the previous queries, so
+    the next query only processes the objects added or changed since.
+    The checkpoint only moves forward once a query succeeds: a failed query is run again in full on the next run.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.objects = self._load()
+
+    def is_processed(self, s3_object: dict) -> bool:
+        """
+        True if this version of the object was processed by a previous query.
+        """
+        version = self.objects.get(s3_object['key'])
+        return version is not None and version == self._version(s3_object)
+
+    def commit(self, objects: Iterable[dict]):
+        """
+        Saves the listed objects as processed. Objects that are no longer listed (deleted) are removed.
+        """
+        self.objects = {s3_object['key']: self._version(s3_object) for s3_object in objects}
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.objects, f)
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        """
+        Forgets the processed objects, so the next query processes all of them again.
+        """
+        self.objects = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _version(s3_object: dict) -> dict:
+        last_modified: Optional[datetime] = s3_object.get('last_modified')
+        return {
+            "etag": s3_object.get('etag'),
+            "last_modified": last_modified.isoformat() if last_modified else None
+        }
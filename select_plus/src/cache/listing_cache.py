@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+
+class ListingCache:
+    """
+    Keeps the listings of prefixes (key, size, ETag and LastModified of each object) for ttl seconds, so a prefix
+    listed by "estimate_cost" is not listed again by "select".
+    Up to max_entries listings are kept in memory, the least recently used being dropped first. With a path, the
+    listings are also written to that directory and can be used by other processes and later runs.
+    Objects added, changed or deleted in S3 are only seen once the listing expires or is invalidated.
+    """
+
+    def __init__(self, ttl: float = 300, max_entries: int = 128, path: Optional[str] = None):
+        if ttl <= 0:
+            raise RuntimeError('ListingCache ttl must be greater than 0')
+        if max_entries < 1:
+            raise RuntimeError('ListingCache max_entries must be at least 1')
+
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    def __getstate__(self):
+        # Listings are only read where the objects are listed, so the copies sent to the workers are left empty
+        state = self.__dict__.copy()
+        state.pop('_lock')
+        state['_entries'] = OrderedDict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get(self, bucket_name: str, prefix: str) -> Optional[list]:
+        """
+        Returns the objects of the listing of the prefix, or None if it is not in the cache or has expired.
+        """
+        cache_key = (bucket_name, prefix)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and not self._expired(entry['listed_at']):
+                self._entries.move_to_end(cache_key)
+                return list(entry['objects'])
+            self._entries.pop(cache_key, None)
+
+        if not self.path:
+            return None
+
+        entry = self._read_file(bucket_name, prefix)
+        if entry is None:
+            return None
+
+        with self._lock:
+            self._add(cache_key, entry)
+        return list(entry['objects'])
+
+    def put(self, bucket_name: str, prefix: str, objects: list):
+        """
+        Adds the listing of the prefix to the cache.
+        """
+        entry = {"listed_at": time.time(), "objects": list(objects)}
+        with self._lock:
+            self._add((bucket_name, prefix), entry)
+
+        if self.path:
+            self._write_file(bucket_name, prefix, entry)
+
+    def invalidate(self, bucket_name: Optional[str] = None, prefix: Optional[str] = None):
+        """
+        Removes the listing of the prefix from the cache, or all the listings if no prefix is given.
+        """
+        with self._lock:
+            if bucket_name is None or prefix is None:
+                self._entries.clear()
+            else:
+                self._entries.pop((bucket_name, prefix), None)
+
+        if not self.path:
+            return
+
+        if bucket_name is None or prefix is None:
+            for file_name in os.listdir(self.path):
+                if file_name.endswith('.json'):
+                    self._remove(os.path.join(self.path, file_name))
+        else:
+            self._remove(self._file_path(bucket_name, prefix))
+
+    def _add(self, cache_key: tuple, entry: dict):
+        self._entries[cache_key] = entry
+        self._entries.move_to_end(cache_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _expired(self, listed_at: float) -> bool:
+        return time.time() - listed_at > self.ttl
+
+    def _file_path(self, bucket_name: str, prefix: str) -> str:
+        name = hashlib.sha256(f'{bucket_name}/{prefix}'.encode()).hexdigest()
+        return os.path.join(self.path, f'{name}.json')
+
+    def _read_file(self, bucket_name: str, prefix: str) -> Optional[dict]:
+        file_path = self._file_path(bucket_name, prefix)
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if entry.get('bucket_name') != bucket_name or entry.get('prefix') != prefix or \
+                self._expired(entry['listed_at']):
+            self._remove(file_path)
+            return None
+
+        # Used recently: the least recently used files are removed first
+        os.utime(file_path)
+        for s3_object in entry['objects']:
+            if s3_object.get('last_modified'):
+                s3_object['last_modified'] = datetime.fromisoformat(s3_object['last_modified'])
+        return {"listed_at": entry['listed_at'], "objects": entry['objects']}
+
+    def _write_file(self, bucket_name: str, prefix: str, entry: dict):
+        objects = []
+        for s3_object in entry['objects']:
+            last_modified = s3_object.get('last_modified')
+            objects.append({**s3_object, "last_modified": last_modified.isoformat() if last_modified else None})
+
+        file_path = self._file_path(bucket_name, prefix)
+        tmp_path = f'{file_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"bucket_name": bucket_name, "prefix": prefix, "listed_at": entry['listed_at'],
+                       "objects": objects}, f)
+        os.replace(tmp_path, file_path)
+
+        files = [os.path.join(self.path, file_name) for file_name in os.listdir(self.path)
+                 if file_name.endswith('.json')]
+        if len(files) > self.max_entries:
+            files.sort(key=self._mtime)
+            for old_file in files[:len(files) - self.max_entries]:
+                self._remove(old_file)
+
+    @staticmethod
+    def _mtime(file_path: str) -> float:
+        try:
+            return os.path.getmtime(file_path)
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _remove(file_path: str):
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
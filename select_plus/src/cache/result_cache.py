@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional
+
+
+class BaseResultCache(ABC):
+    """
+    Keeps the responses of S3 Select (records and statistics) per object version, SQL query and serialization, so
+    unchanged objects are not queried again. The cached response is the one returned by S3, before the extra
+    function, Arrow or the sink, so those still run on a cached response.
+    A result cache is sent to every worker, so it must be picklable.
+    """
+
+    @staticmethod
+    def make_key(bucket_name: str, key: str, etag: str, sql_query: str, input_serialization: dict,
+                 output_serialization: dict, scan_range: Optional[dict] = None) -> str:
+        """
+        The ETag of an object changes with its content, so a new version of the object gets a new cache key.
+        """
+        fields = [bucket_name, key, etag, sql_query, input_serialization, output_serialization, scan_range]
+        return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+    @abstractmethod
+    def get(self, cache_key: str) -> Optional[dict]:
+        """
+        Returns the cached response {"payload": ..., "stats": {...}}, or None.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def put(self, cache_key: str, response: dict):
+        """
+        Adds a response to the cache.
+        """
+        raise NotImplementedError
+
+
+class DirectoryResultCache(BaseResultCache):
+    """
+    Keeps each response as a file in a local directory. When the files take more than max_size bytes, the least
+    recently used are removed. The directory can be shared by the worker processes and by later runs.
+    """
+
+    def __init__(self, path: str, max_size: int = 1024 ** 3):
+        self.path = path
+        self.max_size = max_size
+        self._size = None
+        os.makedirs(path, exist_ok=True)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_size'] = None
+        return state
+
+    def get(self, cache_key: str) -> Optional[dict]:
+        file_path = self._file_path(cache_key)
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                response = json.load(f)
+            # Used recently: the least recently used files are removed first
+            os.utime(file_path)
+        except (OSError, ValueError):
+            return None
+        return response
+
+    def put(self, cache_key: str, response: dict):
+        file_path = self._file_path(cache_key)
+        tmp_path = f'{file_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"payload": response['payload'], "stats": response['stats']}, f)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, file_path)
+
+        # The size of the directory is only measured again once this process may have filled it
+        if self._size is None:
+            self._size = self._directory_size()
+        else:
+            self._size += size
+        if self._size > self.max_size:
+            self._evict()
+
+    def _file_path(self, cache_key: str) -> str:
+        return os.path.join(self.path, f'{cache_key}.json')
+
+    def _entries(self) -> list:
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.json'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _directory_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        size = sum(size for _, size, _ in entries)
+        for _, file_size, file_path in entries:
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+            size -= file_size
+        self._size = size
+
+
+class SQLiteResultCache(BaseResultCache):
+    """
+    Keeps the responses in a SQLite file. When the responses take more than max_size bytes, the least recently used
+    are removed. The file can be shared by the worker processes and by later runs.
+    """
+
+    def __init__(self, path: str, max_size: int = 1024 ** 3):
+        self.path = path
+        self.max_size = max_size
+        self._connection = None
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._connect()
+
+    def __getstate__(self):
+        # Each process opens its own connection
+        state = self.__dict__.copy()
+        state.pop('_lock')
+        state['_connection'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get(self, cache_key: str) -> Optional[dict]:
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute('SELECT payload, stats FROM results WHERE cache_key = ?',
+                                     (cache_key,)).fetchone()
+            if row is None:
+                return None
+            with connection:
+                connection.execute('UPDATE results SET last_used = ? WHERE cache_key = ?', (time.time(), cache_key))
+        return {"payload": row[0], "stats": json.loads(row[1])}
+
+    def put(self, cache_key: str, response: dict):
+        stats = json.dumps(response['stats'])
+        size = len(response['payload'].encode()) + len(stats)
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                                   (cache_key, response['payload'], stats, size, time.time()))
+                total_size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+                if total_size > self.max_size:
+                    self._evict(connection, total_size)
+
+    def _evict(self, connection: sqlite3.Connection, total_size: int):
+        evicted = []
+        for cache_key, size in connection.execute('SELECT cache_key, size FROM results ORDER BY last_used'):
+            if total_size <= self.max_size:
+                break
+            evicted.append((cache_key,))
+            total_size -= size
+        connection.executemany('DELETE FROM results WHERE cache_key = ?', evicted)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            with self._connection:
+                self._connection.execute('CREATE TABLE IF NOT EXISTS results (cache_key TEXT PRIMARY KEY, '
+                                         'payload TEXT, stats TEXT, size INTEGER, last_used REAL)')
+                self._connection.execute('CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)')
+        return self._connection
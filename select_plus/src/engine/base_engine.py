@@ -1,18 +1,57 @@
+import heapq
+import threading
 from abc import ABC, abstractmethod
-from typing import Optional, Union
+from typing import Iterator, Optional, Union
 import boto3
 
-from select_plus.src.aws.s3 import S3
+from select_plus.src.aws.s3 import S3, MAX_ATTEMPTS
 from select_plus.src.models.models import InputSerialization, OutputSerialization
+from select_plus.src.utils.arrow import to_arrow_table, to_batch, serialize_table
+from select_plus.src.utils.parsers import record_count, can_split
+from select_plus.src.sinks.sinks import BaseSink
+from select_plus.src.cache.listing_cache import ListingCache
+from select_plus.src.cache.result_cache import BaseResultCache
+from select_plus.src.utils.budget import Budget
+from select_plus.src.utils.map_reduce import MapReduce
+from select_plus.src.utils.concurrency import ConcurrencyLimiter
+
+# Fixed cost of a request, as a number of bytes, used to balance many small objects against large ones
+REQUEST_COST_BYTES = 256 * 1024
 
 
 class BaseEngine(ABC):
 
-    def __init__(self, bucket_name: str, prefix: str, threads: int, verbose: bool):
+    def __init__(self, bucket_name: str, prefix: str, threads: int, verbose: bool, max_pool_connections: int = 10,
+                 list_concurrency: Optional[int] = None, listing_cache: Optional[ListingCache] = None):
         self.bucket_name = bucket_name
         self.prefix = prefix
         self.verbose = verbose
         self.threads = threads
+        self.max_pool_connections = max_pool_connections
+        self.list_concurrency = list_concurrency
+        self.listing_cache = listing_cache
+
+        # Session state: workers kept alive across queries between "start" and "shutdown"
+        self._session_lock = threading.Lock()
+        self._session_started = False
+        self._workers = None
+        self._idle_timeout = None
+        self._idle_timer = None
+        self._active_queries = 0
+
+    def __getstate__(self):
+        # The workers and the session belong to the process that started them
+        state = self.__dict__.copy()
+        for attr in ['_session_lock', '_workers', '_idle_timer']:
+            state.pop(attr, None)
+        state['_session_started'] = False
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._session_lock = threading.Lock()
+        self._workers = None
+        self._idle_timer = None
 
     @abstractmethod
     def execute(self,
@@ -21,10 +60,249 @@ class BaseEngine(ABC):
                 output_serialization: Union[OutputSerialization, dict],
                 extra_func: Optional[callable] = None,
                 extra_func_args: Optional[dict] = None,
-                s3_client: Optional[boto3.session.Session.client] = None
+                s3_client: Optional[boto3.session.Session.client] = None,
+                scan_range_size: Optional[int] = None,
+                object_filter: Optional[callable] = None,
+                budget: Optional[Budget] = None,
+                map_reduce: Optional[MapReduce] = None,
+                **select_options
                 ):
+        """
+        Runs the query on all the keys. The select_options are passed to "select_s3" for each key.
+        With a scan_range_size (bytes), the objects that support it are split into ranges of that size.
+        With an object_filter, only the listed objects for which object_filter(s3_object) is true are queried.
+        With a budget, no new object is queried once the budget is reached (see "Budget.allow") and the results of
+        the tasks that were not sent are None.
+        With a map_reduce, each worker folds the results of its objects into its own accumulator, added to
+        "map_reduce.accumulators" once the query is done, and the results returned have no payload.
+        """
         raise NotImplementedError
 
+    def _list_tasks(self, s3: S3, input_serialization: dict, scan_range_size: Optional[int] = None,
+                    object_filter: Optional[callable] = None) -> list:
+        """
+        Gets the list of tasks to be processed: {"key": key, "size": size} for each object, or one
+        {"key": key, "size": size, "scan_range": {"Start": ..., "End": ...}} per part for the objects split by
+        scan range.
+        """
+        tasks = []
+        for page_tasks in self._iter_tasks(s3, input_serialization, scan_range_size, object_filter):
+            tasks.extend(page_tasks)
+        return tasks
+
+    def _iter_tasks(self, s3: S3, input_serialization: dict, scan_range_size: Optional[int] = None,
+                    object_filter: Optional[callable] = None) -> Iterator[list]:
+        """
+        Yields the tasks of each page of the listing as soon as the page is received, so the engines can start
+        querying while the next pages are fetched. All the parts of an object split by scan range are in the same
+        page. The objects rejected by the object_filter are left out before any task is made, and the sub-prefixes
+        it rejects (see "ObjectFilter.match_prefix") are not listed.
+        """
+        prefix_filter = getattr(object_filter, 'match_prefix', None)
+        for page in s3.iter_objects(bucket_name=self.bucket_name, prefix=self.prefix,
+                                    list_concurrency=self.list_concurrency, listing_cache=self.listing_cache,
+                                    prefix_filter=prefix_filter):
+            if object_filter is not None:
+                page = [s3_object for s3_object in page if object_filter(s3_object)]
+                if not page:
+                    continue
+            yield self._make_tasks(page, input_serialization, scan_range_size)
+
+    @staticmethod
+    def _make_tasks(objects: list, input_serialization: dict, scan_range_size: Optional[int] = None) -> list:
+        """
+        Objects larger than scan_range_size are split into byte ranges queried as independent tasks.
+        S3 Select processes a record in the range where the record starts, so contiguous ranges return each record
+        exactly once.
+        The ETag of the object, when listed, is kept in its tasks (see "result_cache").
+        The folder markers (empty objects whose key ends with "/") hold no records and are left out.
+        """
+        split = scan_range_size and can_split(input_serialization)
+
+        tasks = []
+        for s3_object in objects:
+            if s3_object['key'].endswith('/') and not s3_object['size']:
+                continue
+            task = {"key": s3_object['key'], "size": s3_object['size']}
+            if s3_object.get('etag'):
+                task['etag'] = s3_object['etag']
+
+            if not split or s3_object['size'] <= scan_range_size:
+                tasks.append(task)
+                continue
+            for start in range(0, s3_object['size'], scan_range_size):
+                end = min(start + scan_range_size, s3_object['size']) - 1
+                tasks.append({**task, "size": end - start + 1, "scan_range": {"Start": start, "End": end}})
+        return tasks
+
+    @staticmethod
+    def _schedule(tasks: list, batches: int) -> list:
+        """
+        Groups the tasks into batches of similar total size, returned largest first, as lists of task indices.
+        The largest tasks are assigned first, each one to the batch with the least work so far (longest processing
+        time first). A large object at the end of the listing is therefore started first instead of last, and
+        small objects are packed together. Each task also counts for REQUEST_COST_BYTES, the fixed cost of a request.
+        """
+        order = sorted(range(len(tasks)), key=lambda i: tasks[i]['size'], reverse=True)
+        heap = [(0, batch, []) for batch in range(min(batches, len(tasks)))]
+        for i in order:
+            load, batch, indices = heapq.heappop(heap)
+            indices.append(i)
+            heapq.heappush(heap, (load + tasks[i]['size'] + REQUEST_COST_BYTES, batch, indices))
+
+        heap.sort(key=lambda item: (item[0], -item[1]), reverse=True)
+        return [indices for _, _, indices in heap]
+
+    def _select_task(self, task: dict, query_context: dict) -> dict:
+        return self.select_s3(key=task['key'], scan_range=task.get('scan_range'), etag=task.get('etag'),
+                              **query_context)
+
+    def _stitch_results(self, tasks: list, results: list, query_context: dict,
+                        map_reduce: Optional[MapReduce] = None) -> list:
+        """
+        Joins back, in order, the parts of the objects split by scan range and processes each joined object
+        (extra function, arrow, sink) the same way a single task would. With a map_reduce, the joined objects are
+        folded here (see "MapReduce.fold_remaining").
+        The tasks without result (not sent because of the budget) are left out. An object is either queried whole or
+        not at all.
+        """
+        stitched = []
+        for task, result in zip(tasks, results):
+            if result is None:
+                continue
+            if 'scan_range' not in task:
+                stitched.append(result)
+                continue
+
+            if task['scan_range']['Start'] == 0:
+                stitched.append({"key": task['key'], "parts": [result]})
+            else:
+                stitched[-1]['parts'].append(result)
+
+        stitched = [self._join_parts(item, query_context) if 'parts' in item else item for item in stitched]
+        return map_reduce.fold_remaining(stitched) if map_reduce is not None else stitched
+
+    def _join_parts(self, item: dict, query_context: dict) -> dict:
+        """
+        Joins the parts of an object split by scan range. Each part is a request, billed on its own: their number is
+        kept in the "requests" of the stats.
+        """
+        stats = {}
+        for part in item['parts']:
+            for name, value in part['stats'].items():
+                stats[name] = stats.get(name, 0) + (value or 0)
+        stats['requests'] = len(item['parts'])
+
+        response = {
+            "payload": ''.join(part['payload'] for part in item['parts']),
+            "stats": stats
+        }
+        # The object only counts as read from the cache when all its parts were
+        if all(part.get('cache_hit') for part in item['parts']):
+            response['cache_hit'] = True
+        return self._process_response(key=item['key'], response=response,
+                                      output_serialization=query_context['output_serialization'],
+                                      extra_func=query_context['extra_func'],
+                                      extra_func_args=query_context['extra_func_args'],
+                                      arrow=query_context.get('arrow', False),
+                                      sink=query_context.get('sink'),
+                                      batch_format=query_context.get('batch_format'))
+
+    def start(self, idle_timeout: Optional[float] = None):
+        """
+        Keeps the workers of the engine (and their S3 clients) alive across queries until "shutdown" is called.
+        With an idle_timeout, the workers are released after that many seconds without a query and are started
+        again by the next query.
+        """
+        with self._session_lock:
+            self._session_started = True
+            self._idle_timeout = idle_timeout
+            if self._workers is None:
+                self._workers = self._create_workers()
+            self._reset_idle_timer()
+
+    def shutdown(self):
+        """
+        Stops the workers started by "start".
+        """
+        with self._session_lock:
+            self._session_started = False
+            self._cancel_idle_timer()
+            self._release_workers()
+
+    def _create_workers(self):
+        """
+        Engines with workers to keep alive across queries return them here (e.g. a process pool).
+        """
+        return None
+
+    def _close_workers(self, workers):
+        """
+        Stops the workers returned by "_create_workers".
+        """
+
+    def _acquire_workers(self):
+        """
+        Returns the workers of the session for a query, or None if no session is started.
+        """
+        with self._session_lock:
+            if not self._session_started:
+                return None
+            self._cancel_idle_timer()
+            if self._workers is None:
+                self._workers = self._create_workers()
+            self._active_queries += 1
+            return self._workers
+
+    def _return_workers(self):
+        with self._session_lock:
+            self._active_queries -= 1
+            self._reset_idle_timer()
+
+    def _release_workers(self):
+        if self._workers is not None:
+            self._close_workers(self._workers)
+            self._workers = None
+
+    def _reset_idle_timer(self):
+        self._cancel_idle_timer()
+        if self._idle_timeout is not None and self._active_queries == 0:
+            self._idle_timer = threading.Timer(self._idle_timeout, self._on_idle)
+            self._idle_timer.daemon = True
+            self._idle_timer.start()
+
+    def _cancel_idle_timer(self):
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+
+    def _on_idle(self):
+        with self._session_lock:
+            # A query may have started (or finished and started a new timer) while this one was waiting on the lock
+            if self._idle_timer is threading.current_thread() and self._active_queries == 0:
+                self._idle_timer = None
+                self._release_workers()
+
+    @staticmethod
+    def _make_query_context(sql_query: str, extra_func: callable, extra_func_args: dict, s3_client,
+                            input_serialization, output_serialization, **select_options) -> dict:
+        """
+        Arguments of "select_s3" shared by all keys of the query.
+        """
+        limiter = select_options.get('limiter')
+        if limiter is not None and ConcurrencyLimiter.client_retries(s3_client):
+            raise RuntimeError('The S3 client retries the throttled requests before the limiter sees them: create it '
+                               'with Config(retries={"max_attempts": 0}) to use it with a limiter')
+        return {
+            "sql_query": sql_query,
+            "extra_func": extra_func,
+            "extra_func_args": extra_func_args,
+            "s3_client": s3_client,
+            "input_serialization": input_serialization,
+            "output_serialization": output_serialization,
+            **select_options
+        }
+
     def select_s3(self,
                   key: str,
                   sql_query: str,
@@ -32,33 +310,105 @@ class BaseEngine(ABC):
                   output_serialization: dict,
                   extra_func: callable,
                   extra_func_args: Optional[dict],
-                  s3_client: Optional[boto3.session.Session.client] = None
+                  s3_client: Optional[boto3.session.Session.client] = None,
+                  scan_range: Optional[dict] = None,
+                  arrow: bool = False,
+                  sink: Optional[BaseSink] = None,
+                  etag: Optional[str] = None,
+                  result_cache: Optional[BaseResultCache] = None,
+                  count_records: bool = False,
+                  batch_format: Optional[str] = None,
+                  limiter: Optional[ConcurrencyLimiter] = None
                   ):
-        s3 = S3(client=s3_client)
-        response = s3.select(bucket_name=self.bucket_name, key=key, sql_string=sql_query,
-                             input_serialization=input_serialization, output_serialization=output_serialization)
+        """
+        With a result_cache, the response of an object already queried with the same SQL and serialization is read
+        from the cache as long as the object did not change (same ETag), and is marked with "cache_hit".
+        With count_records, the number of records returned is added to the stats as "records", before the extra
+        function, arrow or the sink process them (see "Budget.max_records").
+        With a batch_format, the extra function receives the records parsed into that format (see "to_batch").
+        With a limiter, the request waits for the limiter to allow it and the throttled attempts are retried by the
+        limiter, and counted in the stats as "throttles".
+        """
+        cache_key = None
+        response = None
+        if result_cache is not None and etag:
+            cache_key = result_cache.make_key(bucket_name=self.bucket_name, key=key, etag=etag, sql_query=sql_query,
+                                              input_serialization=input_serialization,
+                                              output_serialization=output_serialization, scan_range=scan_range)
+            response = result_cache.get(cache_key)
+
+        if response is not None:
+            response['cache_hit'] = True
+        else:
+            s3 = S3(client=s3_client, max_pool_connections=self.max_pool_connections,
+                    max_attempts=0 if limiter is not None else MAX_ATTEMPTS)
+            if limiter is None:
+                response = s3.select(bucket_name=self.bucket_name, key=key, sql_string=sql_query,
+                                     input_serialization=input_serialization,
+                                     output_serialization=output_serialization, scan_range=scan_range)
+            else:
+                response, throttles = limiter.call(s3.select, bucket_name=self.bucket_name, key=key,
+                                                   sql_string=sql_query, input_serialization=input_serialization,
+                                                   output_serialization=output_serialization, scan_range=scan_range)
+                if throttles:
+                    response['stats']['throttles'] = throttles
+            if cache_key is not None:
+                result_cache.put(cache_key, response)
+
+        if count_records:
+            response['stats']['records'] = record_count(response['payload'], output_serialization)
+
+        if scan_range:
+            # The parts of an object are stitched together before they are processed (see "_stitch_results")
+            return response
+
+        return self._process_response(key=key, response=response, output_serialization=output_serialization,
+                                      extra_func=extra_func, extra_func_args=extra_func_args, arrow=arrow, sink=sink,
+                                      batch_format=batch_format)
+
+    def _process_response(self, key: str, response: dict, output_serialization: dict, extra_func: callable,
+                          extra_func_args: Optional[dict], arrow: bool = False, sink: Optional[BaseSink] = None,
+                          batch_format: Optional[str] = None):
         if extra_func:
-            response = self._apply_extra_func(response, extra_func, extra_func_args)
+            response = self._apply_extra_func(response, extra_func, extra_func_args,
+                                              output_serialization=output_serialization, batch_format=batch_format)
+
+        if arrow and isinstance(response['payload'], str):
+            # Parsed in the worker and sent back as an Arrow IPC stream
+            table = to_arrow_table(response['payload'], output_serialization)
+            response['payload'] = serialize_table(table)
+
+        if sink:
+            response['payload'] = sink.write(key, response['payload'], output_serialization)
 
         return response
 
     @staticmethod
-    def _apply_extra_func(response: dict, extra_func, extra_func_args):
+    def _apply_extra_func(response: dict, extra_func, extra_func_args, output_serialization: Optional[dict] = None,
+                          batch_format: Optional[str] = None):
         """
         A user has the possibility of adding an additional function at each thread level to process each chunk of data
         before it merges the results from all threads.
         Allow the function to access only the payload but not the statistics.
         This way, the cost can be computed in the compilation of the results after the proceses have ended.
+        With a batch_format, the payload is parsed once according to the output serialization and the function
+        receives the records as columns (Arrow table, pandas DataFrame or NumPy arrays) instead of a string.
         """
 
         block_response = {
             "stats": response['stats'],
             "payload": None
         }
+        if response.get('cache_hit'):
+            block_response['cache_hit'] = True
+
+        payload = response['payload']
+        if batch_format is not None:
+            payload = to_batch(payload, output_serialization, batch_format)
 
         if extra_func_args:
-            func_response = extra_func(response['payload'], **extra_func_args)
+            func_response = extra_func(payload, **extra_func_args)
         else:
-            func_response = extra_func(response['payload'])
+            func_response = extra_func(payload)
         block_response['payload'] = func_response
         return block_response
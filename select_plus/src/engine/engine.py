@@ -1,9 +1,17 @@
-from typing import Optional, Union
+import itertools
+from typing import Iterator, Optional, Union
 
 from select_plus.src.engine.base_engine import BaseEngine
+from select_plus.src.sinks.sinks import BaseSink
 from select_plus.src.utils.cost import Cost
+from select_plus.src.utils.parsers import record_count, take_records, serialize_records
+from select_plus.src.utils.map_reduce import MapReduce
+from select_plus.src.utils.post_processing import ClientSideQuery, partial_results
 from select_plus.src.models.models import EngineResults, EngineResultsStats, InputSerialization, OutputSerialization
 
+# Records per block of the payload of a client side query
+BLOCK_RECORDS = 10000
+
 
 class EngineWrapper:
 
@@ -14,20 +22,64 @@ class EngineWrapper:
             extra_func_args: Optional[dict],
             engine: BaseEngine,
             input_serialization: Union[InputSerialization, dict],
-            output_serialization: Union[OutputSerialization, dict]
+            output_serialization: Union[OutputSerialization, dict],
+            client_side_query: Optional[ClientSideQuery] = None,
+            **select_options
     ) -> EngineResults:
+        """
+        With a client_side_query (GROUP BY, ORDER BY, DISTINCT), S3 Select runs the rest of the query, the workers
+        reduce the records of each object and the partial results are merged here. The merged records are written in
+        blocks with the output serialization, to the sink if there is one. The groups of a GROUP BY are merged by
+        each worker before they are sent back (see "MapReduce").
+        With a map_reduce, the value reduced from the accumulators of the workers is returned as "results.value".
+        With a limiter, its decisions are added to the stats (see "ConcurrencyLimiter").
+        """
 
         dict_input_serialization = self.deserialize(input_serialization)
         dict_output_serialization = self.deserialize(output_serialization)
 
+        sink = select_options.get('sink')
+        engine_output_serialization = dict_output_serialization
+        if client_side_query is not None:
+            sql_query = client_side_query.s3_query
+            extra_func = partial_results
+            extra_func_args = {"query": client_side_query}
+            engine_output_serialization = {'JSON': {}}
+            # The workers return partial results: the sink only receives the merged records
+            select_options = {name: value for name, value in select_options.items() if name != 'sink'}
+            if client_side_query.grouped:
+                select_options['map_reduce'] = MapReduce(combine_func=client_side_query.combine_groups)
+        map_reduce = select_options.get('map_reduce')
+
         response = engine.execute(
             sql_query=sql_query,
             extra_func=extra_func,
             extra_func_args=extra_func_args,
             input_serialization=dict_input_serialization,
-            output_serialization=dict_output_serialization
+            output_serialization=engine_output_serialization,
+            **select_options
         )
-        compiled_result = self._compile_results(response)
+        compiled_result = self._compile_results(response, output_serialization=dict_output_serialization,
+                                                sink=sink)
+        if client_side_query is not None:
+            partials = [map_reduce.result()] if map_reduce is not None else compiled_result.payload
+            compiled_result.payload = self._write_blocks(client_side_query.merge(partials),
+                                                         dict_output_serialization, sink)
+        elif map_reduce is not None:
+            compiled_result.value = map_reduce.result()
+            compiled_result.payload = []
+        limiter = select_options.get('limiter')
+        if limiter is not None and limiter.requests:
+            compiled_result.stats.concurrency_limit = limiter.limit
+            compiled_result.stats.concurrency_increases = limiter.increases
+            compiled_result.stats.concurrency_decreases = limiter.decreases
+            compiled_result.stats.max_in_flight = limiter.max_in_flight
+        budget = select_options.get('budget')
+        if budget is not None:
+            compiled_result.stats.truncated = budget.truncated
+            if budget.max_records is not None:
+                compiled_result.payload = self._limit_payload(compiled_result.payload, budget.max_records,
+                                                              dict_output_serialization)
 
         return compiled_result
 
@@ -45,7 +97,47 @@ class EngineWrapper:
             return obj
 
     @staticmethod
-    def _compile_results(response: list) -> EngineResults:
+    def _write_blocks(records: Iterator[dict], output_serialization: dict, sink: Optional[BaseSink] = None) -> list:
+        """
+        Serializes the records in blocks of BLOCK_RECORDS, written to the sink (as "part-00000", ...) as they
+        are merged, so they are never all held in memory.
+        """
+        blocks = []
+        records = iter(records)
+        while True:
+            block_records = list(itertools.islice(records, BLOCK_RECORDS))
+            if not block_records and blocks:
+                break
+            block = serialize_records(block_records, output_serialization)
+            blocks.append(sink.write_merged(f'part-{len(blocks):05d}', block, output_serialization) if sink else block)
+            if len(block_records) < BLOCK_RECORDS:
+                break
+        return blocks
+
+    @staticmethod
+    def _limit_payload(payload: list, limit: int, output_serialization: dict) -> list:
+        """
+        Keeps the first "limit" records of the payload, in the order of the listing: S3 Select applies the LIMIT of
+        the query to each file, so the files in flight when the limit was reached may return more.
+        The files after the limit keep an empty block. A payload processed by an extra function, arrow or a sink is
+        returned as is.
+        """
+        if not all(isinstance(block, str) for block in payload):
+            return payload
+
+        limited = []
+        for block in payload:
+            records = record_count(block, output_serialization)
+            if records > limit:
+                block = take_records(block, limit, output_serialization)
+                records = limit
+            limited.append(block)
+            limit -= records
+        return limited
+
+    @staticmethod
+    def _compile_results(response: list, output_serialization: Optional[dict] = None,
+                         sink: Optional[BaseSink] = None) -> EngineResults:
         cost = Cost()
 
         payload = []
@@ -53,17 +145,38 @@ class EngineWrapper:
         bytes_processed = 0
         bytes_returned = 0
         files_processed = 0
+        # An object split by scan range is one request per part
+        requests = 0
+        cached_requests = 0
+        cache_hits = 0
+        cached_bytes_scanned = 0
+        cached_bytes_returned = 0
+        throttles = 0
 
         for record in response:
             payload.append(record['payload'])
+            files_processed += 1
+            if record.get('cache_hit'):
+                cache_hits += 1
+                cached_requests += record['stats'].get('requests', 1)
+                cached_bytes_scanned += record['stats']['bytes_scanned']
+                cached_bytes_returned += record['stats']['bytes_returned']
+                continue
             bytes_scanned += record['stats']['bytes_scanned']
             bytes_processed += record['stats']['bytes_processed']
             bytes_returned += record['stats']['bytes_returned']
-            files_processed += 1
+            throttles += record['stats'].get('throttles', 0)
+            requests += record['stats'].get('requests', 1)
+
+        cost_saved = 0.0
+        if cache_hits:
+            cost_saved = cost.compute_block(data_scanned=cached_bytes_scanned,
+                                            data_returned=cached_bytes_returned,
+                                            files_requested=cached_requests)
 
         cost = cost.compute_block(data_scanned=bytes_scanned,
                                   data_returned=bytes_returned,
-                                  files_requested=files_processed)
+                                  files_requested=requests)
 
         model = EngineResults(
             payload=payload,
@@ -72,8 +185,13 @@ class EngineWrapper:
                 files_processed=files_processed,
                 bytes_scanned=bytes_scanned,
                 bytes_returned=bytes_returned,
-                bytes_processed=bytes_processed
-            )
+                bytes_processed=bytes_processed,
+                cache_hits=cache_hits,
+                cost_saved=cost_saved,
+                throttles=throttles
+            ),
+            output_serialization=output_serialization,
+            sink=sink
         )
 
         return model
@@ -1,10 +1,70 @@
-from typing import Optional
-from multiprocessing import Pool
+import os
+import threading
+import uuid
+from typing import Iterable, Optional
+from multiprocessing import Barrier, Pool
 import tqdm
 import boto3
 
 from select_plus.src.engine.base_engine import BaseEngine
 from select_plus.src.aws.s3 import S3
+from select_plus.src.utils.budget import Budget
+from select_plus.src.utils.concurrency import COUNTERS
+from select_plus.src.utils.map_reduce import MapReduce
+
+# Query shared by all the tasks of a worker process. It is set once per worker by the pool initializer.
+_worker_query = {}
+# The accumulators of the queries of a session are collected one query at a time (see "_flush_accumulator")
+_flush_lock = threading.Lock()
+
+
+def _init_worker(engine: BaseEngine, query_context: dict, map_reduce: Optional[MapReduce] = None,
+                 barrier: Optional[Barrier] = None):
+    _worker_query['engine'] = engine
+    _worker_query['context'] = query_context
+    _worker_query['map_reduce'] = map_reduce
+    _worker_query['barrier'] = barrier
+    _worker_query['accumulators'] = {}
+
+
+def _select_batch(tasks: list) -> tuple:
+    return _run_batch(_worker_query['context'], tasks, _worker_query['map_reduce'], query_id=None)
+
+
+def _init_session_worker(engine: BaseEngine, barrier: Optional[Barrier] = None):
+    # The worker outlives the query, so only the engine is installed and the S3 client is created upfront
+    _worker_query['engine'] = engine
+    _worker_query['barrier'] = barrier
+    _worker_query['accumulators'] = {}
+    S3(max_pool_connections=engine.max_pool_connections)
+
+
+def _select_session_batch(batch: tuple) -> tuple:
+    query_context, tasks, map_reduce, query_id = batch
+    return _run_batch(query_context, tasks, map_reduce, query_id)
+
+
+def _run_batch(query_context: dict, tasks: list, map_reduce: Optional[MapReduce], query_id: Optional[str]) -> tuple:
+    limiter = query_context.get('limiter')
+    before = limiter.counters() if limiter is not None else None
+    results = [_worker_query['engine']._select_task(task, query_context) for task in tasks]
+    # The decisions of the copy of the limiter in this process go back with the batch (see "ConcurrencyLimiter.merge")
+    limiter_counters = None
+    if limiter is not None:
+        after = limiter.counters()
+        limiter_counters = (os.getpid(), {**after, **{name: after[name] - before[name] for name in COUNTERS}})
+    if map_reduce is None:
+        return results, limiter_counters
+    # Only the stats go back with the batch, the payloads are folded into the accumulator of the process
+    accumulator, results = map_reduce.fold_tasks(tasks, results, _worker_query['accumulators'].get(query_id))
+    _worker_query['accumulators'][query_id] = accumulator
+    return results, limiter_counters
+
+
+def _flush_accumulator(query_id: Optional[str]) -> Optional[tuple]:
+    # A process waits here until every process took one of the flush tasks, so none can take two
+    _worker_query['barrier'].wait()
+    return _worker_query['accumulators'].pop(query_id, None)
 
 
 class ParallelEngine(BaseEngine):
@@ -16,59 +76,181 @@ class ParallelEngine(BaseEngine):
                 extra_func: Optional[callable] = None,
                 extra_func_args: Optional[dict] = None,
                 s3_client: Optional[boto3.session.Session.client] = None,
+                scan_range_size: Optional[int] = None,
+                object_filter: Optional[callable] = None,
+                budget: Optional[Budget] = None,
+                map_reduce: Optional[MapReduce] = None,
+                *,
+                schedule: str = 'size',
+                **select_options
                 ) -> list:
+        """
+        Runs the query on all the keys in a pool of processes.
+        The tasks are sent to the processes in batches, made for each page of the listing as soon as the page is
+        received, so the processes start querying while the next pages are fetched. With schedule='size', the batches
+        of a page have a similar total size and the largest are sent first. With schedule='listing', the batches
+        follow the order of the listing.
+        With a budget, at most one batch per process is sent at a time, so the budget is checked against the
+        responses received before each new batch is sent.
+        With a limiter, each process uses its own copy, whose decisions are sent back with each batch and merged into
+        the limiter (see "ConcurrencyLimiter.merge").
+        With a map_reduce, each process folds the results of its batches into its own accumulator and the batches
+        only send back the stats. Once all the batches are done, one flush task per process sends back its
+        accumulator, so only one accumulator per process crosses the process boundary.
+        """
+        if schedule not in ('size', 'listing'):
+            raise RuntimeError(f'Schedule {schedule} must be size | listing')
 
-        function_args = self._make_func_args(sql_query=sql_query, extra_func=extra_func,
-                                             extra_func_args=extra_func_args, s3_client=s3_client,
-                                             input_serialization=input_serialization,
-                                             output_serialization=output_serialization)
+        s3 = S3(client=s3_client, max_pool_connections=self.max_pool_connections)
+        query_context = self._make_query_context(sql_query=sql_query, extra_func=extra_func,
+                                                 extra_func_args=extra_func_args, s3_client=s3_client,
+                                                 input_serialization=input_serialization,
+                                                 output_serialization=output_serialization,
+                                                 **select_options)
 
-        results = self.execute_callable(self._wrapper_func, function_args)
-        return results
+        tasks = []
+        batches = []
+        window = threading.Semaphore(self.threads) if budget is not None else None
+        stopped = threading.Event()
 
-    def execute_callable(self, func: callable, args: list = None) -> list:
+        def iter_batches():
+            # Consumed by the pool in a background thread, so the listing goes on while the processes query
+            for page_tasks in self._iter_tasks(s3, input_serialization=input_serialization,
+                                               scan_range_size=scan_range_size, object_filter=object_filter):
+                if budget is not None and budget.stopped:
+                    return
+                offset = len(tasks)
+                tasks.extend(page_tasks)
+                for batch in self._make_batches(page_tasks, schedule):
+                    if budget is not None:
+                        window.acquire()
+                        if stopped.is_set():
+                            return
+                        batch = [i for i in batch if budget.allow(page_tasks[i])]
+                        if not batch:
+                            window.release()
+                            continue
+                    batches.append([offset + i for i in batch])
+                    yield [page_tasks[i] for i in batch]
+
+        def on_result(batch_result: tuple):
+            for result in batch_result[0]:
+                budget.add(result)
+            window.release()
+
+        def on_finish():
+            # Unblocks the listing if a batch failed while it was waiting for a process, before the pool is
+            # terminated (which waits for the listing)
+            stopped.set()
+            window.release()
+
+        # The callbacks only track the budget
+        callbacks = {"on_result": on_result, "on_finish": on_finish} if budget is not None else {}
+
+        pool = self._acquire_workers()
+        if pool is None:
+            if map_reduce is None:
+                batch_results = self.execute_callable(_select_batch, iter_batches(), initializer=_init_worker,
+                                                      initargs=(self, query_context), chunksize=1, **callbacks)
+            else:
+                # The pool is kept until the accumulators of its processes are collected
+                with Pool(self.threads, initializer=_init_worker,
+                          initargs=(self, query_context, map_reduce, Barrier(self.threads))) as pool:
+                    batch_results = self._map(pool, _select_batch, iter_batches(), chunksize=1, **callbacks)
+                    self._collect_accumulators(pool, map_reduce, query_id=None)
+        else:
+            query_id = uuid.uuid4().hex if map_reduce is not None else None
+            try:
+                # The workers of a session outlive the query, so the context is sent with each batch instead
+                batch_results = self._map(pool, _select_session_batch,
+                                          ((query_context, batch, map_reduce, query_id) for batch in iter_batches()),
+                                          chunksize=1, **callbacks)
+                if map_reduce is not None:
+                    with _flush_lock:
+                        self._collect_accumulators(pool, map_reduce, query_id)
+            finally:
+                self._return_workers()
+
+        limiter = select_options.get('limiter')
+        if limiter is not None:
+            limiter.merge([limiter_counters for _, limiter_counters in batch_results if limiter_counters is not None])
+
+        # Back to the order of the listing
+        results = [None] * len(tasks)
+        for batch, (batch_result, _) in zip(batches, batch_results):
+            for i, result in zip(batch, batch_result):
+                results[i] = result
+
+        return self._stitch_results(tasks, results, query_context, map_reduce)
+
+    def _collect_accumulators(self, pool: Pool, map_reduce: MapReduce, query_id: Optional[str]):
         """
-        Generic parallel executor for a function with a list of arguments.
-        The args must be of format [(arg1, arg2, arg3...), (arg1, arg2, arg3...)]
+        Sends one flush task to each process of the pool (see "_flush_accumulator") and adds the accumulators they
+        return to the map_reduce.
         """
-        with Pool(self.threads) as pool:
-            if self.verbose:
-                print(f'Running with {self.threads} processes')
-                result = list(tqdm.tqdm(pool.imap(func, args), total=len(args)))
-            else:
-                result = []
-                partial_result = pool.imap(func, args)
-                for i in partial_result:
-                    result.append(i)
-            return result
-
-    def _make_func_args(self, sql_query: str, extra_func: callable, extra_func_args: dict, s3_client,
-                        input_serialization, output_serialization) -> list:
+        for accumulator in pool.map(_flush_accumulator, [query_id] * self.threads, chunksize=1):
+            map_reduce.add(accumulator)
+
+    def _make_batches(self, tasks: list, schedule: str) -> list:
         """
-        Gets a list of all keys to be processed
+        Batches of task indices, about 4 per process, so a slow batch can still be balanced by the other processes.
         """
-        s3 = S3(client=s3_client)
-        s3_keys = s3.list_objects(bucket_name=self.bucket_name, prefix=self.prefix)
-        keys = s3_keys['keys']
-        func_args = []
-        for key in keys:
-            func_args.append({
-                "key": key,
-                "sql_query": sql_query,
-                "extra_func": extra_func,
-                "extra_func_args": extra_func_args,
-                "s3_client": s3_client,
-                "input_serialization": input_serialization,
-                "output_serialization": output_serialization
-            })
-
-        return func_args
-
-    def _wrapper_func(self, args):
+        if schedule == 'size':
+            return self._schedule(tasks, batches=self.threads * 4)
+        if schedule == 'listing':
+            chunksize = self._chunksize(len(tasks))
+            return [list(range(i, min(i + chunksize, len(tasks)))) for i in range(0, len(tasks), chunksize)]
+        raise RuntimeError(f'Schedule {schedule} must be size | listing')
+
+    def execute_callable(self, func: callable, args: Iterable = None, initializer: Optional[callable] = None,
+                         initargs: tuple = (), chunksize: Optional[int] = None,
+                         on_result: Optional[callable] = None, on_finish: Optional[callable] = None) -> list:
         """
-        This is a wrapper for the function to be executed inside the thread.
-        The reason why this exists, is because if the tqdm bar is to exist, then tqdm doesn't work with "pool.starmap".
-        As result, one cannot pass multiple parameters to the function.
+        Generic parallel executor for a function with a list of arguments.
+        The args must be of format [(arg1, arg2, arg3...), (arg1, arg2, arg3...)]
+        The args can also be a generator, consumed while the processes run. A chunksize must be given in that case.
+        Anything shared by all the calls should be sent once per process through the initializer and its initargs.
+        The on_result function, if any, is called with each result as it is received, in order, and on_finish once
+        all the results are received or the execution failed.
         """
-        result = self.select_s3(**args)
+        if chunksize is None:
+            chunksize = self._chunksize(len(args))
+
+        with Pool(self.threads, initializer=initializer, initargs=initargs) as pool:
+            return self._map(pool, func, args, chunksize, on_result, on_finish)
+
+    def _map(self, pool: Pool, func: callable, args: Iterable, chunksize: int,
+             on_result: Optional[callable] = None, on_finish: Optional[callable] = None) -> list:
+        partial_result = pool.imap(func, args, chunksize=chunksize)
+        if self.verbose:
+            print(f'Running with {self.threads} processes')
+            total = len(args) if hasattr(args, '__len__') else None
+            partial_result = tqdm.tqdm(partial_result, total=total)
+
+        result = []
+        try:
+            for i in partial_result:
+                if on_result is not None:
+                    on_result(i)
+                result.append(i)
+        finally:
+            if on_finish is not None:
+                on_finish()
         return result
+
+    def _create_workers(self) -> Pool:
+        return Pool(self.threads, initializer=_init_session_worker, initargs=(self, Barrier(self.threads)))
+
+    def _close_workers(self, workers: Pool):
+        workers.close()
+        workers.join()
+
+    def _chunksize(self, tasks: int) -> int:
+        """
+        Sends the tasks to the processes in batches to reduce the communication between processes.
+        Each process gets about 4 batches, so a slow batch can still be balanced by the other processes.
+        """
+        chunksize, extra = divmod(tasks, self.threads * 4)
+        if extra:
+            chunksize += 1
+        return max(chunksize, 1)
@@ -3,6 +3,8 @@ import tqdm
 import boto3
 from select_plus.src.aws.s3 import S3
 from select_plus.src.engine.base_engine import BaseEngine
+from select_plus.src.utils.budget import Budget
+from select_plus.src.utils.map_reduce import MapReduce
 
 
 class SequentialEngine(BaseEngine):
@@ -13,23 +15,52 @@ class SequentialEngine(BaseEngine):
                 output_serialization: dict,
                 extra_func: Optional[callable] = None,
                 extra_func_args: Optional[dict] = None,
-                s3_client: Optional[boto3.session.Session.client] = None) -> list:
-        s3 = S3(client=s3_client)
-        s3_keys = s3.list_objects(bucket_name=self.bucket_name, prefix=self.prefix)
-        keys = s3_keys['keys']
+                s3_client: Optional[boto3.session.Session.client] = None,
+                scan_range_size: Optional[int] = None,
+                object_filter: Optional[callable] = None,
+                budget: Optional[Budget] = None,
+                map_reduce: Optional[MapReduce] = None,
+                **select_options) -> list:
+        """
+        Runs the query on each key in turn, starting with the first page of the listing while the next pages are
+        fetched. With a budget, the listing stops at the first page after the budget is reached.
+        With a map_reduce, the results are folded into one accumulator as they are received.
+        """
+        s3 = S3(client=s3_client, max_pool_connections=self.max_pool_connections)
+        query_context = self._make_query_context(sql_query=sql_query, extra_func=extra_func,
+                                                 extra_func_args=extra_func_args, s3_client=s3_client,
+                                                 input_serialization=input_serialization,
+                                                 output_serialization=output_serialization,
+                                                 **select_options)
 
+        tasks = []
         result = []
-        if self.verbose:
-            itt = tqdm.tqdm(keys)
-        else:
-            itt = keys
+        accumulator = None
+        progress = tqdm.tqdm() if self.verbose else None
 
-        for key in itt:
-            response = self.select_s3(key=key, sql_query=sql_query, extra_func=extra_func,
-                                      extra_func_args=extra_func_args, s3_client=s3_client,
-                                      input_serialization=input_serialization,
-                                      output_serialization=output_serialization
-                                      )
-            result.append(response)
+        for page_tasks in self._iter_tasks(s3, input_serialization=input_serialization,
+                                           scan_range_size=scan_range_size, object_filter=object_filter):
+            if budget is not None and budget.stopped:
+                break
+            tasks.extend(page_tasks)
+            if progress is not None:
+                progress.total = len(tasks)
+            for task in page_tasks:
+                if budget is not None and not budget.allow(task):
+                    result.append(None)
+                    continue
+                response = self._select_task(task, query_context)
+                if budget is not None:
+                    budget.add(response)
+                if map_reduce is not None and 'scan_range' not in task:
+                    accumulator, response = map_reduce.fold(accumulator, response)
+                result.append(response)
+                if progress is not None:
+                    progress.update()
 
-        return result
+        if progress is not None:
+            progress.close()
+
+        if map_reduce is not None:
+            map_reduce.add(accumulator)
+        return self._stitch_results(tasks, result, query_context, map_reduce)
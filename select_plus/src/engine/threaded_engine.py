@@ -0,0 +1,144 @@
+import threading
+from typing import Iterator, Optional
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+import tqdm
+import boto3
+
+from select_plus.src.engine.base_engine import BaseEngine
+from select_plus.src.aws.s3 import S3
+from select_plus.src.utils.budget import Budget
+from select_plus.src.utils.map_reduce import MapReduce
+
+
+class ThreadedEngine(BaseEngine):
+    """
+    Queries each file in a separate thread of the same process.
+    Each query is spent almost entirely waiting on the network, so threads allow hundreds of requests in flight
+    without the cost of spawning processes and pickling the arguments and the results.
+    All the threads share one S3 client with a connection pool large enough for every thread.
+    """
+
+    def execute(self,
+                sql_query: str,
+                input_serialization: dict,
+                output_serialization: dict,
+                extra_func: Optional[callable] = None,
+                extra_func_args: Optional[dict] = None,
+                s3_client: Optional[boto3.session.Session.client] = None,
+                scan_range_size: Optional[int] = None,
+                object_filter: Optional[callable] = None,
+                budget: Optional[Budget] = None,
+                map_reduce: Optional[MapReduce] = None,
+                *,
+                schedule: str = 'size',
+                **select_options
+                ) -> list:
+        """
+        Runs the query on all the keys in a pool of threads.
+        The tasks of each page of the listing are started as soon as the page is received, while the next pages are
+        fetched. With schedule='size', the largest tasks of a page are started first. With schedule='listing', the
+        tasks are started in the order of the listing.
+        With a budget, at most one task per thread is submitted at a time, so the budget is checked against the
+        responses received before each new task is sent.
+        With a map_reduce, each thread folds the results of its tasks into its own accumulator.
+        """
+        if schedule not in ('size', 'listing'):
+            raise RuntimeError(f'Schedule {schedule} must be size | listing')
+
+        s3 = S3(client=s3_client, max_pool_connections=max(self.threads, self.max_pool_connections))
+        # With a limiter, the throttled requests are retried by the limiter instead of the client (see "select_s3")
+        select_client = s3.client
+        if select_options.get('limiter') is not None:
+            select_client = S3(client=s3_client, max_pool_connections=max(self.threads, self.max_pool_connections),
+                               max_attempts=0).client
+        query_context = self._make_query_context(sql_query=sql_query, extra_func=extra_func,
+                                                 extra_func_args=extra_func_args, s3_client=select_client,
+                                                 input_serialization=input_serialization,
+                                                 output_serialization=output_serialization,
+                                                 **select_options)
+        task_pages = self._iter_tasks(s3, input_serialization=input_serialization, scan_range_size=scan_range_size,
+                                      object_filter=object_filter)
+
+        executor = self._acquire_workers()
+        if executor is None:
+            with ThreadPoolExecutor(max_workers=self.threads) as executor:
+                tasks, results = self._run(executor, task_pages, query_context, schedule, budget, map_reduce)
+        else:
+            try:
+                tasks, results = self._run(executor, task_pages, query_context, schedule, budget, map_reduce)
+            finally:
+                self._return_workers()
+
+        return self._stitch_results(tasks, results, query_context, map_reduce)
+
+    def _run(self, executor: ThreadPoolExecutor, task_pages: Iterator[list], query_context: dict,
+             schedule: str, budget: Optional[Budget] = None, map_reduce: Optional[MapReduce] = None) -> tuple:
+        """
+        Submits the tasks page by page and returns all the tasks with their results, in the order of the listing.
+        The tasks refused by the budget have no future and their result is None.
+        """
+        tasks = []
+        futures = {}
+        # Accumulator of each thread, by thread id: a thread only updates its own
+        accumulators = {}
+        window = threading.Semaphore(self.threads) if budget is not None else None
+
+        def on_done(future: Future):
+            try:
+                if not future.cancelled() and future.exception() is None:
+                    budget.add(future.result())
+            finally:
+                window.release()
+
+        try:
+            for page_tasks in task_pages:
+                if budget is not None and budget.stopped:
+                    break
+                offset = len(tasks)
+                tasks.extend(page_tasks)
+                if schedule == 'size':
+                    order = sorted(range(len(page_tasks)), key=lambda i: page_tasks[i]['size'], reverse=True)
+                else:
+                    order = range(len(page_tasks))
+                for i in order:
+                    if budget is not None:
+                        window.acquire()
+                        if not budget.allow(page_tasks[i]):
+                            window.release()
+                            continue
+                    if map_reduce is not None:
+                        futures[offset + i] = executor.submit(self._select_and_fold, page_tasks[i], query_context,
+                                                              map_reduce, accumulators)
+                    else:
+                        futures[offset + i] = executor.submit(self._select_task, page_tasks[i], query_context)
+                    if budget is not None:
+                        futures[offset + i].add_done_callback(on_done)
+        except BaseException:
+            for future in futures.values():
+                future.cancel()
+            raise
+
+        if self.verbose:
+            print(f'Running with {self.threads} threads')
+            for _ in tqdm.tqdm(as_completed(futures.values()), total=len(futures)):
+                pass
+
+        results = [futures[i].result() if i in futures else None for i in range(len(tasks))]
+        if map_reduce is not None:
+            for accumulator in accumulators.values():
+                map_reduce.add(accumulator)
+        return tasks, results
+
+    def _select_and_fold(self, task: dict, query_context: dict, map_reduce: MapReduce, accumulators: dict) -> dict:
+        response = self._select_task(task, query_context)
+        if 'scan_range' in task:
+            return response
+        thread = threading.get_ident()
+        accumulators[thread], response = map_reduce.fold(accumulators.get(thread), response)
+        return response
+
+    def _create_workers(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(max_workers=self.threads)
+
+    def _close_workers(self, workers: ThreadPoolExecutor):
+        workers.shutdown(wait=True)
@@ -1,6 +1,10 @@
-from typing import Optional, Union
+from typing import Any, Iterator, Optional, Union
 from dataclasses import dataclass
 
+from select_plus.src.utils.parsers import JSONParser, CSVParser, record_delimiter
+from select_plus.src.utils.arrow import require_pyarrow, to_arrow_table, deserialize_table, concat_tables, \
+    is_arrow_table
+
 
 @dataclass
 class EngineResultsStats:
@@ -9,40 +13,128 @@ class EngineResultsStats:
     bytes_scanned: int
     bytes_returned: int
     bytes_processed: int
+    # Files read from the result cache: they are not part of the cost and bytes above, which are billed by S3
+    cache_hits: int = 0
+    cost_saved: float = 0.0
+    # Files listed but not queried, e.g. already processed according to a checkpoint
+    files_skipped: int = 0
+    # True when the budget of the query (max_cost, max_bytes_scanned) was reached before all the files were queried
+    truncated: bool = False
+    # Requests throttled by S3 (SlowDown, 503) and retried with a ConcurrencyLimiter, and the decisions of the limiter:
+    # its final limit on the requests in flight, how many times it raised or lowered it and the most requests in flight.
+    # With the ParallelEngine, the decisions of the copies of the limiter in the processes are added up. The decisions
+    # are None when the limiter made no request (e.g. all the files were read from the result cache)
+    throttles: int = 0
+    concurrency_limit: Optional[int] = None
+    concurrency_increases: Optional[int] = None
+    concurrency_decreases: Optional[int] = None
+    max_in_flight: Optional[int] = None
+
+
+@dataclass
+class AggregateResults:
+    """
+    Values of the aggregates of a query over all the files: {name: value}, named by their alias or position (_1, ...).
+    """
+    values: dict
+    stats: EngineResultsStats
+
+
+@dataclass
+class CostEstimate:
+    """
+    Estimate of the cost (dollars) and bytes of a query, with bounds at the given confidence.
+    Without sampled files, the bytes scanned and returned are bounded by the size of the files.
+    """
+    cost: float
+    cost_lower: float
+    cost_upper: float
+    files: int
+    total_size: int
+    bytes_scanned: float
+    bytes_returned: float
+    sampled_files: int = 0
+    sample_cost: float = 0.0
+    confidence: float = 0.95
 
 
 @dataclass
 class EngineResults:
     payload: list
     stats: EngineResultsStats
+    output_serialization: Optional[dict] = None
+    sink: Optional[Any] = None
+    # The reduced value of a map-reduce query (see "SSP.select"), whose payload is empty
+    value: Optional[Any] = None
+
+    def iter_payload(self) -> Iterator:
+        """
+        Yields the results of each object. When the results were written to a sink, the payload only holds the
+        references to them and they are read from the sink one object at a time.
+        """
+        for block in self.payload:
+            yield self.sink.read(block) if self.sink else block
 
     @property
     def payload_dict(self) -> list:
-        payload_dict = []
-        dict_repr = []
-        for item in self.payload:
-            sub_item = item.replace('\n', ',')
-            record = list(eval(sub_item))
-            dict_repr.append(record)
-
-        for block in dict_repr:
-            payload_dict += block
+        return list(self.iter_dict())
 
-        return payload_dict
+    def iter_dict(self) -> Iterator:
+        """
+        Parses the JSON records of the payload one block at a time.
+        """
+        parser = JSONParser(delimiter=record_delimiter(self.output_serialization))
+        return parser.iter_records(self.iter_payload())
 
     @property
-    def payload_csv(self):
-        # CSV Parser
+    def payload_csv(self) -> list:
+        parser = CSVParser.from_output_serialization(self.output_serialization)
         payload_csv = []
-        for item in self.payload:
-            sub_item = item.split('\n')
-
-            for row in sub_item:
-                if len(row) > 0:
-                    payload_csv.append(row.split(','))
-
+        for block in self.iter_payload():
+            payload_csv += parser.parse(block)
         return payload_csv
 
+    def iter_csv(self) -> Iterator:
+        """
+        Parses the CSV records of the payload one block at a time, using the delimiters and quote character of the
+        output serialization.
+        """
+        parser = CSVParser.from_output_serialization(self.output_serialization)
+        return parser.iter_records(self.iter_payload())
+
+    def payload_columns(self, header: bool = False) -> dict:
+        """
+        Parses the CSV records of the payload into columns: {column_name: [values]}.
+        If header is set, the first record holds the names of the columns.
+        """
+        parser = CSVParser.from_output_serialization(self.output_serialization)
+        return parser.parse_columns(self.iter_payload(), header=header)
+
+    def to_arrow(self) -> 'pyarrow.Table':
+        """
+        Returns all the records as one Arrow table (requires pyarrow).
+        The payload of a query executed with arrow=True is already parsed by the workers. Otherwise, the records are
+        parsed here according to the output serialization.
+        """
+        require_pyarrow()
+        tables = []
+        for block in self.iter_payload():
+            if isinstance(block, bytes):
+                tables.append(deserialize_table(block))
+            elif is_arrow_table(block):
+                tables.append(block)
+            elif isinstance(block, str):
+                tables.append(to_arrow_table(block, self.output_serialization))
+            else:
+                raise RuntimeError(f'Payload of type {type(block).__name__} cannot be converted to Arrow')
+        return concat_tables(tables)
+
+    def to_pandas(self) -> 'pandas.DataFrame':
+        """
+        Returns all the records as one pandas DataFrame (requires pyarrow and pandas).
+        """
+        return self.to_arrow().to_pandas()
+
 
 @dataclass
 class CompressionTypes:
@@ -150,7 +242,7 @@ class CSVOutputSerialization:
         params = {}
         if self.quote_fields:
             params['QuoteFields'] = self.quote_fields
-        if self.quote_character:
+        if self.quote_escape_character:
             params['QuoteEscapeCharacter'] = self.quote_escape_character
         if self.record_delimiter:
             params['RecordDelimiter'] = self.record_delimiter
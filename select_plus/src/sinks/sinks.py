@@ -0,0 +1,121 @@
+import os
+from abc import ABC, abstractmethod
+from typing import Any
+from urllib.parse import quote
+
+from select_plus.src.utils.arrow import require_pyarrow, to_arrow_table, deserialize_table
+
+
+class BaseSink(ABC):
+    """
+    Writes the results of each object where the workers run, so that only a reference to them (e.g. a file path)
+    is kept in the results instead of the records.
+    A sink is sent to every worker, so it must be picklable.
+    """
+
+    @abstractmethod
+    def write(self, key: str, payload: Any, output_serialization: dict) -> str:
+        """
+        Writes the results of one object and returns the reference to them.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def read(self, reference: str) -> Any:
+        """
+        Reads the results written by "write".
+        """
+        raise NotImplementedError
+
+    def write_merged(self, name: str, payload: Any, output_serialization: dict) -> str:
+        """
+        Writes a block of the records merged from all the objects (e.g. "part-00000" of an ORDER BY), apart from the
+        results of the objects.
+        """
+        return self.write(f'results/{name}', payload, output_serialization)
+
+
+class DirectorySink(BaseSink):
+    """
+    Writes the results of each object as a file in a local directory, following the key of the object. The parts of
+    the key are encoded, and the directories end with "%2F" (an encoded "/"), so every key has its own file: e.g.
+    "data/a" is written to "data%2F/a.json" and "data/a/b.json" to "data%2F/a%2F/b.json.json".
+    Text results (records) are written as they are returned by S3 Select, with the ".json" or ".csv" extension of the
+    output serialization. Arrow results are written as Arrow IPC streams, with the ".arrow" extension.
+    The merged records (see "write_merged") are written to the "results" sub-directory, which no key can reach.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, key: str, payload: Any, output_serialization: dict) -> str:
+        return self._write_file(self._file_path(key), payload, output_serialization)
+
+    def write_merged(self, name: str, payload: Any, output_serialization: dict) -> str:
+        return self._write_file(os.path.join(self.path, 'results', name), payload, output_serialization)
+
+    def _write_file(self, file_path: str, payload: Any, output_serialization: dict) -> str:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        if isinstance(payload, str):
+            file_path += '.csv' if 'CSV' in (output_serialization or {}) else '.json'
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(payload)
+        elif isinstance(payload, bytes):
+            file_path += '.arrow'
+            with open(file_path, 'wb') as f:
+                f.write(payload)
+        else:
+            raise RuntimeError(f'DirectorySink cannot write a payload of type {type(payload).__name__}')
+        return file_path
+
+    def read(self, reference: str) -> Any:
+        if reference.endswith('.arrow'):
+            with open(reference, 'rb') as f:
+                return f.read()
+        with open(reference, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def _file_path(self, key: str) -> str:
+        """
+        The path of the file of a key, without its extension. An encoded part never holds "/" or "%2F", and ".."
+        cannot be a directory, so the files of two keys never collide and stay in the directory.
+        """
+        *directories, name = key.split('/')
+        return os.path.join(self.path, *[quote(directory, safe='') + '%2F' for directory in directories],
+                            quote(name, safe=''))
+
+
+class ParquetSink(DirectorySink):
+    """
+    Writes the results of each object as a Parquet file in a local directory (requires pyarrow).
+    """
+
+    def __init__(self, path: str, compression: str = 'snappy'):
+        require_pyarrow()
+        super().__init__(path=path)
+        self.compression = compression
+
+    def write(self, key: str, payload: Any, output_serialization: dict) -> str:
+        return self._write_table(self._file_path(key), payload, output_serialization)
+
+    def write_merged(self, name: str, payload: Any, output_serialization: dict) -> str:
+        return self._write_table(os.path.join(self.path, 'results', name), payload, output_serialization)
+
+    def _write_table(self, file_path: str, payload: Any, output_serialization: dict) -> str:
+        import pyarrow.parquet  # pylint: disable=import-outside-toplevel
+
+        if isinstance(payload, str):
+            table = to_arrow_table(payload, output_serialization)
+        elif isinstance(payload, bytes):
+            table = deserialize_table(payload)
+        else:
+            raise RuntimeError(f'ParquetSink cannot write a payload of type {type(payload).__name__}')
+
+        file_path += '.parquet'
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        pyarrow.parquet.write_table(table, file_path, compression=self.compression)
+        return file_path
+
+    def read(self, reference: str) -> Any:
+        import pyarrow.parquet  # pylint: disable=import-outside-toplevel
+        return pyarrow.parquet.read_table(reference)
@@ -0,0 +1,134 @@
+import re
+from typing import Optional
+
+from select_plus.src.utils.parsers import JSONParser
+from select_plus.src.utils.sql import split_items
+
+SELECT_PATTERN = re.compile(r'^\s*SELECT\s+(.*?)\s+(FROM\s+.*)$', re.IGNORECASE | re.DOTALL)
+AGGREGATE_PATTERN = re.compile(r'^(COUNT|SUM|MIN|MAX|AVG)\s*\((.*)\)(?:\s+(?:AS\s+)?([A-Za-z_][A-Za-z0-9_]*))?$',
+                               re.IGNORECASE | re.DOTALL)
+# Partial aggregates each function is computed from
+PARTIALS = {
+    "COUNT": ['COUNT'],
+    "SUM": ['SUM'],
+    "MIN": ['MIN'],
+    "MAX": ['MAX'],
+    "AVG": ['SUM', 'COUNT']
+}
+
+
+class AggregateQuery:
+    """
+    A query made only of decomposable aggregates (COUNT, SUM, MIN, MAX, AVG), e.g.
+    "SELECT COUNT(*), SUM(s.x) AS total, AVG(s.y) FROM s3object s WHERE ...".
+    Each object is queried for the partial aggregates ("partial_query", with AVG as SUM and COUNT), the partials of
+    all the objects are merged (see "merge") and the final values are computed from them (see "finalize").
+    The values are named by their alias or, like S3 Select does, by their position: _1, _2, ...
+    """
+
+    def __init__(self, sql_query: str):
+        match = SELECT_PATTERN.match(sql_query.strip().rstrip(';'))
+        if match is None:
+            raise RuntimeError(f'Query {sql_query} is not a SELECT ... FROM ... query')
+        items, from_clause = match.groups()
+
+        self.names = []
+        self.functions = []
+        self.partials = []
+        partial_expressions = []
+        for position, item in enumerate(split_items(items)):
+            aggregate = AGGREGATE_PATTERN.match(item)
+            if aggregate is None or not self._balanced(aggregate.group(2)):
+                raise RuntimeError(f'{item} is not one of the aggregates COUNT, SUM, MIN, MAX, AVG')
+            function, argument, alias = aggregate.groups()
+            function = function.upper()
+            if re.match(r'\s*DISTINCT\b', argument, re.IGNORECASE):
+                raise RuntimeError(f'{item} cannot be merged across objects')
+
+            self.names.append(alias or f'_{position + 1}')
+            self.functions.append(function)
+            for partial in PARTIALS[function]:
+                self.partials.append(partial)
+                partial_expressions.append(f'{partial}({argument})')
+
+        self.partial_query = f'SELECT {", ".join(partial_expressions)} {from_clause}'
+
+    def merge(self, left: Optional[list], right: Optional[list]) -> Optional[list]:
+        """
+        Merges the partial aggregates of two sets of objects. The aggregates of no record (null) are ignored.
+        """
+        if left is None or right is None:
+            return left if right is None else right
+        return [merge_value(partial, a, b) for partial, a, b in zip(self.partials, left, right)]
+
+    def finalize(self, partial: Optional[list]) -> dict:
+        """
+        The value of each aggregate, from the merged partial aggregates of all the objects.
+        """
+        return dict(zip(self.names, final_values(self.functions, partial or [None] * len(self.partials))))
+
+    @staticmethod
+    def _balanced(argument: str) -> bool:
+        """
+        False if the argument closes the parenthesis of the aggregate, as in "SUM(a) + SUM(b)".
+        """
+        depth = 0
+        for char in argument:
+            depth += {'(': 1, ')': -1}.get(char, 0)
+            if depth < 0:
+                return False
+        return depth == 0
+
+
+def merge_value(partial: str, a, b):
+    """
+    Merges two values of a partial aggregate. The aggregate of no record (null) is ignored.
+    """
+    if a is None or b is None:
+        return a if b is None else b
+    if partial in ('COUNT', 'SUM'):
+        return a + b
+    function = min if partial == 'MIN' else max
+    try:
+        return function(a, b)
+    except TypeError:
+        # Values of different types (e.g. a number and a text CSV field) are ordered by the name of their type
+        return function(a, b, key=lambda value: type(value).__name__)
+
+
+def final_values(functions: list, partial: list) -> list:
+    """
+    The value of each aggregate function from the values of its partial aggregates (see "PARTIALS").
+    """
+    values = iter(partial)
+    result = []
+    for function in functions:
+        if function == 'AVG':
+            total, count = next(values), next(values)
+            result.append(total / count if count else None)
+        elif function == 'COUNT':
+            result.append(next(values) or 0)
+        else:
+            result.append(next(values))
+    return result
+
+
+def parse_partial(payload: str, query: AggregateQuery) -> Optional[list]:
+    """
+    Extra function run by the workers on the response of each object: the JSON record(s) of the partial aggregates
+    (one per part of an object split by scan range), merged into one list of values.
+    """
+    partial = None
+    for record in JSONParser().parse(payload):
+        values = [record.get(f'_{i + 1}') for i in range(len(query.partials))]
+        partial = query.merge(partial, values)
+    return partial
+
+
+def tree_reduce(items: list, merge: callable):
+    """
+    Merges the items pairwise, level by level, which keeps the rounding errors of float sums small.
+    """
+    while len(items) > 1:
+        items = [merge(items[i], items[i + 1]) if i + 1 < len(items) else items[i] for i in range(0, len(items), 2)]
+    return items[0] if items else None
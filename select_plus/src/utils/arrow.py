@@ -0,0 +1,142 @@
+import io
+from typing import Any, Optional
+
+from select_plus.src.utils.parsers import JSONParser, CSVParser, record_delimiter
+
+try:
+    import pyarrow
+    import pyarrow.csv
+    import pyarrow.ipc
+    import pyarrow.json
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+# Formats of the records passed to a vectorized extra function (see "to_batch")
+BATCH_FORMATS = ('arrow', 'pandas', 'numpy')
+# pyarrow 14 replaced the "promote" of concat_tables by "promote_options", which also promotes int to double
+PERMISSIVE_PROMOTION = pyarrow is not None and int(pyarrow.__version__.split('.')[0]) >= 14
+
+
+def require_pyarrow():
+    if pyarrow is None:
+        raise RuntimeError('The Arrow results require pyarrow. Install it with "pip install pyarrow"')
+
+
+def is_arrow_table(obj: Any) -> bool:
+    return pyarrow is not None and isinstance(obj, pyarrow.Table)
+
+
+def to_arrow_table(payload: str, output_serialization: Optional[dict]) -> 'pyarrow.Table':
+    """
+    Parses the records returned by S3 Select for one object into an Arrow table.
+    The Arrow readers are used for new line delimited records. Other record delimiters are not supported by the
+    Arrow readers, so the records are parsed with the parsers of the package instead.
+    CSV columns are named the way S3 Select names them: _1, _2, ...
+    """
+    require_pyarrow()
+    output_serialization = output_serialization or {}
+    delimiter = record_delimiter(output_serialization)
+
+    if not payload.strip():
+        return pyarrow.table({})
+
+    if 'CSV' in output_serialization:
+        parser = CSVParser.from_output_serialization(output_serialization)
+        if delimiter != '\n':
+            return pyarrow.table(parser.parse_columns([payload]))
+        table = pyarrow.csv.read_csv(
+            io.BytesIO(payload.encode()),
+            read_options=pyarrow.csv.ReadOptions(autogenerate_column_names=True),
+            parse_options=pyarrow.csv.ParseOptions(
+                delimiter=parser.dialect['delimiter'],
+                quote_char=parser.dialect['quotechar'],
+                double_quote=parser.dialect['doublequote'],
+                escape_char=parser.dialect['escapechar'] or False,
+                newlines_in_values=True
+            )
+        )
+        return table.rename_columns([f'_{i + 1}' for i in range(table.num_columns)])
+
+    if delimiter != '\n':
+        return pyarrow.Table.from_pylist(JSONParser(delimiter=delimiter).parse(payload))
+    return pyarrow.json.read_json(io.BytesIO(payload.encode()))
+
+
+def to_batch(payload: str, output_serialization: Optional[dict], batch_format: str):
+    """
+    Parses the records of one object once, for a vectorized extra function: an Arrow table ('arrow'), a pandas
+    DataFrame ('pandas', requires pandas) or a dict of NumPy arrays by column name ('numpy').
+    """
+    if batch_format not in BATCH_FORMATS:
+        raise RuntimeError(f'Batch format {batch_format} must be {" | ".join(BATCH_FORMATS)}')
+    table = to_arrow_table(payload, output_serialization)
+    if batch_format == 'pandas':
+        return table.to_pandas()
+    if batch_format == 'numpy':
+        return {name: column.to_numpy() for name, column in zip(table.column_names, table.columns)}
+    return table
+
+
+def serialize_table(table: 'pyarrow.Table') -> bytes:
+    """
+    Writes the table as an Arrow IPC stream, to be sent from a worker to the main process.
+    """
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def deserialize_table(buffer: bytes) -> 'pyarrow.Table':
+    """
+    Reads an Arrow IPC stream without copying the buffer.
+    """
+    return pyarrow.ipc.open_stream(pyarrow.py_buffer(buffer)).read_all()
+
+
+def concat_tables(tables: list) -> 'pyarrow.Table':
+    """
+    Concatenates the tables of all the objects. Columns missing from an object are filled with nulls and
+    types inferred differently per object (e.g. int and double) are promoted. The columns whose types cannot be
+    promoted (e.g. int and string) are read as strings.
+    """
+    tables = [table for table in tables if table.num_columns > 0]
+    if not tables:
+        return pyarrow.table({})
+    conflicts = _conflicting_columns(tables)
+    if conflicts:
+        tables = [_cast_to_string(table, conflicts) for table in tables]
+    if PERMISSIVE_PROMOTION:
+        return pyarrow.concat_tables(tables, promote_options='permissive')
+    return pyarrow.concat_tables(tables, promote=True)
+
+
+def _conflicting_columns(tables: list) -> set:
+    """
+    The names of the columns whose types differ between the tables and cannot be promoted to one type.
+    """
+    fields = {}
+    for table in tables:
+        for field in table.schema:
+            fields.setdefault(field.name, []).append(field)
+
+    conflicts = set()
+    for name, same_name in fields.items():
+        if len({field.type for field in same_name}) == 1:
+            continue
+        schemas = [pyarrow.schema([field]) for field in same_name]
+        try:
+            if PERMISSIVE_PROMOTION:
+                pyarrow.unify_schemas(schemas, promote_options='permissive')
+            else:
+                pyarrow.unify_schemas(schemas)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            conflicts.add(name)
+    return conflicts
+
+
+def _cast_to_string(table: 'pyarrow.Table', names: set) -> 'pyarrow.Table':
+    for i, name in enumerate(table.column_names):
+        if name in names and table.schema.field(i).type != pyarrow.string():
+            table = table.set_column(i, name, table.column(i).cast(pyarrow.string()))
+    return table
@@ -0,0 +1,78 @@
+import threading
+from typing import Optional
+
+from select_plus.src.utils.cost import Cost
+
+
+class Budget:
+    """
+    Running cost and bytes scanned of a query, updated as the responses are received. Once max_cost (dollars) or
+    max_bytes_scanned is reached, no new object is queried: the engines only finish the objects already started (all
+    the parts of an object split by scan range) and the query is marked as truncated.
+    The responses read from the result cache are not billed, so they do not count.
+    With max_records (the LIMIT of the query), no new object is queried once that many records were received (see
+    "records" in the stats of the responses). The results then hold all the records asked for, so they are not
+    marked as truncated.
+    """
+
+    def __init__(self, max_cost: Optional[float] = None, max_bytes_scanned: Optional[int] = None,
+                 max_records: Optional[int] = None, cost: Optional[Cost] = None):
+        self.max_cost = max_cost
+        self.max_bytes_scanned = max_bytes_scanned
+        self.max_records = max_records
+        self.cost = cost or Cost()
+
+        self.bytes_scanned = 0
+        self.bytes_returned = 0
+        self.requests = 0
+        self.records = 0
+        # Keys of the objects started, whether an object was refused and whether it was because of max_cost or
+        # max_bytes_scanned
+        self.keys = set()
+        self.stopped = False
+        self.truncated = False
+        self._lock = threading.Lock()
+
+    @property
+    def spent(self) -> float:
+        return self.cost.compute_block(data_scanned=self.bytes_scanned, data_returned=self.bytes_returned,
+                                       files_requested=self.requests)
+
+    @property
+    def exceeded(self) -> bool:
+        if self.max_bytes_scanned is not None and self.bytes_scanned >= self.max_bytes_scanned:
+            return True
+        return self.max_cost is not None and self.spent >= self.max_cost
+
+    @property
+    def limit_reached(self) -> bool:
+        return self.max_records is not None and self.records >= self.max_records
+
+    def allow(self, task: dict) -> bool:
+        """
+        True if the task can be sent: it is part of an object already started, or the budget is not reached yet.
+        """
+        with self._lock:
+            if task['key'] in self.keys:
+                return True
+            if self.limit_reached:
+                self.stopped = True
+                return False
+            if self.exceeded:
+                self.stopped = True
+                self.truncated = True
+                return False
+            self.keys.add(task['key'])
+            return True
+
+    def add(self, response: dict):
+        """
+        Adds the statistics of the response of a task.
+        """
+        with self._lock:
+            self.records += response['stats'].get('records') or 0
+            if response.get('cache_hit'):
+                return
+            self.bytes_scanned += response['stats'].get('bytes_scanned') or 0
+            self.bytes_returned += response['stats'].get('bytes_returned') or 0
+            self.requests += 1
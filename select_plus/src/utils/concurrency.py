@@ -0,0 +1,193 @@
+import random
+import threading
+import time
+from typing import Optional
+
+from botocore.client import BaseClient
+from botocore.exceptions import ClientError
+
+# Error codes S3 (and AWS in general) return when it throttles the requests
+THROTTLING_CODES = {'SlowDown', 'Throttling', 'ThrottlingException', 'RequestLimitExceeded', 'TooManyRequestsException',
+                    'ServiceUnavailable', 'RequestThrottled'}
+# Errors retried without being a sign of throttling
+RETRYABLE_CODES = {'InternalError'}
+# Counts of a limiter, added up across the copies of a limiter (see "ConcurrencyLimiter.merge")
+COUNTERS = ('requests', 'increases', 'decreases', 'throttles', 'retries')
+
+
+class ConcurrencyLimiter:
+    """
+    Adaptive limit on the requests in flight (AIMD, like TCP congestion control), shared by the threads of a process.
+    Each healthy response adds 1 / limit to the limit: the limit grows by one per round of "limit" healthy responses,
+    as long as the limit is what keeps more requests from being sent. A response is healthy while the short term
+    average latency stays within latency_tolerance times the long term average.
+    A throttled request (SlowDown, 503) multiplies the limit by decrease_factor, once per burst: only the requests sent
+    after the last decrease can decrease it again. Throttled requests (and S3 internal errors) are retried after an
+    exponential backoff with jitter, up to max_retries times.
+    The limit, the number of increases and decreases, the throttles and the retries are kept for the stats of the
+    query. Each process of the ParallelEngine gets its own copy, which only backs off, as a process sends one request
+    at a time. The counts of the copies are sent back with the batches and merged into the limiter of the caller.
+    """
+
+    def __init__(self, initial_limit: int = 8, min_limit: int = 1, max_limit: int = 256,
+                 decrease_factor: float = 0.5, latency_tolerance: float = 2.0, max_retries: int = 10,
+                 backoff_base: float = 0.1, backoff_max: float = 20.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.limit = min(max(initial_limit, min_limit), max_limit)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # Calls made through this instance (not through its copies in other processes)
+        self.requests = 0
+        self.increases = 0
+        self.decreases = 0
+        self.throttles = 0
+        self.retries = 0
+        # Short and long term moving averages of the latency of the healthy responses (seconds)
+        self.latency = None
+        self.baseline_latency = None
+        self._credit = 0.0
+        self._last_decrease = float('-inf')
+        self._condition = threading.Condition()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_condition')
+        # A copy only counts its own requests in flight
+        state['in_flight'] = 0
+        state['max_in_flight'] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._condition = threading.Condition()
+
+    def call(self, func: callable, *args, **kwargs) -> tuple:
+        """
+        Calls func once the limit allows one more request in flight, and retries it when it is throttled.
+        Returns the result of func and the number of times it was throttled.
+        """
+        attempt = 0
+        throttles = 0
+        while True:
+            started = self._acquire()
+            try:
+                result = func(*args, **kwargs)
+            except ClientError as error:
+                throttled = self.is_throttling(error)
+                self._release(started, throttled=throttled)
+                if not (throttled or self.is_retryable(error)) or attempt >= self.max_retries:
+                    raise
+                throttles += throttled
+                attempt += 1
+                with self._condition:
+                    self.retries += 1
+                time.sleep(self._backoff(attempt))
+                continue
+            except BaseException:
+                self._release(started)
+                raise
+            self._release(started, latency=time.monotonic() - started)
+            return result, throttles
+
+    def counters(self) -> dict:
+        """
+        The counts of the limiter, with its current limit and the most requests it had in flight.
+        """
+        with self._condition:
+            counters = {name: getattr(self, name) for name in COUNTERS}
+            counters['limit'] = self.limit
+            counters['max_in_flight'] = self.max_in_flight
+            return counters
+
+    def merge(self, copies: list):
+        """
+        Adds the decisions of the copies of the limiter used by other processes: a list of (process, counters), with
+        the counts of one batch of requests and the limit and max_in_flight of the copy once the batch was done.
+        The counts are added up. The processes run side by side, so the limit becomes the sum of the last limit of
+        each process, and max_in_flight the sum of the max_in_flight of each process.
+        """
+        limits = {}
+        max_in_flight = {}
+        with self._condition:
+            for process, counters in copies:
+                if not counters['requests']:
+                    continue
+                for name in COUNTERS:
+                    setattr(self, name, getattr(self, name) + counters[name])
+                limits[process] = counters['limit']
+                max_in_flight[process] = max(max_in_flight.get(process, 0), counters['max_in_flight'])
+            if limits:
+                self.limit = sum(limits.values())
+                self.max_in_flight = max(self.max_in_flight, sum(max_in_flight.values()))
+
+    @staticmethod
+    def is_throttling(error: ClientError) -> bool:
+        code = error.response.get('Error', {}).get('Code')
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        return code in THROTTLING_CODES or status == 503
+
+    @staticmethod
+    def client_retries(client) -> bool:
+        """
+        True if a botocore client retries the failed requests itself, which hides the throttles from the limiter.
+        The clients created by the package for a limiter do not (see "S3"); a client passed in must be created with
+        Config(retries={"max_attempts": 0}).
+        """
+        if not isinstance(client, BaseClient):
+            return False
+        retries = client.meta.config.retries or {}
+        if 'total_max_attempts' in retries:
+            return retries['total_max_attempts'] > 1
+        # Without a number of attempts, botocore retries by default
+        return retries.get('max_attempts', 1) > 0
+
+    @staticmethod
+    def is_retryable(error: ClientError) -> bool:
+        return error.response.get('Error', {}).get('Code') in RETRYABLE_CODES
+
+    def _acquire(self) -> float:
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.requests += 1
+            return time.monotonic()
+
+    def _release(self, started: float, latency: Optional[float] = None, throttled: bool = False):
+        with self._condition:
+            # The limit is only raised when it held requests back
+            limited = self.in_flight >= self.limit
+            self.in_flight -= 1
+            if throttled:
+                self.throttles += 1
+                if started > self._last_decrease:
+                    self.limit = max(self.min_limit, int(self.limit * self.decrease_factor))
+                    self.decreases += 1
+                    self._credit = 0.0
+                    self._last_decrease = time.monotonic()
+            elif latency is not None and self._healthy(latency) and limited and self.limit < self.max_limit:
+                self._credit += 1 / self.limit
+                if self._credit >= 1:
+                    self._credit = 0.0
+                    self.limit += 1
+                    self.increases += 1
+            self._condition.notify_all()
+
+    def _healthy(self, latency: float) -> bool:
+        if self.latency is None:
+            self.latency = self.baseline_latency = latency
+        else:
+            self.latency = 0.7 * self.latency + 0.3 * latency
+            self.baseline_latency = 0.95 * self.baseline_latency + 0.05 * latency
+        return self.latency <= self.baseline_latency * self.latency_tolerance
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
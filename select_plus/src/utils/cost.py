@@ -12,7 +12,7 @@ class Cost:
         Creates an estimate of the cost for a single file.
         """
         data_returned_cost = self.returned_cost * data_returned
-        data_request_cost = self.returned_cost * files_requested
+        data_request_cost = self.request_cost * files_requested
         data_scanned_cost = self.scan_cost * data_scanned
 
         total_cost = data_returned_cost + data_request_cost + data_scanned_cost
@@ -0,0 +1,140 @@
+import math
+import random
+import statistics
+from typing import Optional
+
+from select_plus.src.aws.s3 import S3
+from select_plus.src.utils.cost import Cost
+from select_plus.src.models.models import CostEstimate
+from select_plus.src.utils.parsers import can_split
+
+# z scores of the usual confidence levels, for the Python versions without "statistics.NormalDist"
+Z_SCORES = {0.8: 1.2816, 0.9: 1.6449, 0.95: 1.96, 0.99: 2.5758}
+
+
+class CostEstimator:
+    """
+    Estimates the cost of a query on a list of files by running it on a random sample of them.
+    The bytes scanned and returned per byte of file measured on the sample are extrapolated to all the files. They
+    are measured over all the bytes sampled, so a small file weighs less than a large one.
+    Uncompressed CSV and JSON LINES files larger than sample_bytes are only sampled on their first sample_bytes (with
+    a Scan Range). Other files (Parquet, compressed) are sampled whole.
+    """
+
+    def __init__(self, s3: S3, bucket_name: str, cost: Optional[Cost] = None):
+        self.s3 = s3
+        self.bucket_name = bucket_name
+        self.cost = cost or Cost()
+
+    def estimate(self,
+                 objects: list,
+                 sql_query: Optional[str] = None,
+                 input_serialization: Optional[dict] = None,
+                 output_serialization: Optional[dict] = None,
+                 sample_size: int = 5,
+                 sample_bytes: int = 1024 * 1024,
+                 confidence: float = 0.95,
+                 seed: Optional[int] = None) -> CostEstimate:
+        files = len(objects)
+        total_size = sum(s3_object['size'] for s3_object in objects)
+        candidates = [s3_object for s3_object in objects if s3_object['size'] > 0]
+
+        if not sql_query or sample_size < 1 or not candidates:
+            return self._estimate_without_sample(files, total_size, input_serialization or {}, confidence)
+
+        z_score = self._z_score(confidence)
+        sample = random.Random(seed).sample(candidates, min(sample_size, len(candidates)))
+        split = can_split(input_serialization or {})
+
+        sampled_sizes = []
+        scanned = []
+        returned = []
+        partial = False
+        for s3_object in sample:
+            scan_range = None
+            sampled_size = s3_object['size']
+            if split and s3_object['size'] > sample_bytes:
+                scan_range = {"Start": 0, "End": sample_bytes - 1}
+                sampled_size = sample_bytes
+                partial = True
+
+            response = self.s3.select(bucket_name=self.bucket_name, key=s3_object['key'], sql_string=sql_query,
+                                      input_serialization=input_serialization,
+                                      output_serialization=output_serialization, scan_range=scan_range)
+            bytes_scanned = response['stats']['bytes_scanned'] or 0
+            bytes_returned = response['stats']['bytes_returned'] or 0
+            sampled_sizes.append(sampled_size)
+            scanned.append(bytes_scanned)
+            returned.append(bytes_returned)
+
+        # Without partial files, sampling all the files measures them exactly (finite population correction)
+        correction = 1.0
+        if not partial:
+            remaining = len(candidates) - len(sample)
+            correction = math.sqrt(remaining / (len(candidates) - 1)) if remaining else 0.0
+
+        scan_ratio, scan_margin = self._ratio_and_margin(scanned, sampled_sizes, z_score, correction)
+        return_ratio, return_margin = self._ratio_and_margin(returned, sampled_sizes, z_score, correction)
+
+        return CostEstimate(
+            cost=self.cost.compute_block(data_scanned=scan_ratio * total_size,
+                                         data_returned=return_ratio * total_size,
+                                         files_requested=files),
+            cost_lower=self.cost.compute_block(data_scanned=max(0.0, scan_ratio - scan_margin) * total_size,
+                                               data_returned=max(0.0, return_ratio - return_margin) * total_size,
+                                               files_requested=files),
+            cost_upper=self.cost.compute_block(data_scanned=(scan_ratio + scan_margin) * total_size,
+                                               data_returned=(return_ratio + return_margin) * total_size,
+                                               files_requested=files),
+            files=files,
+            total_size=total_size,
+            bytes_scanned=scan_ratio * total_size,
+            bytes_returned=return_ratio * total_size,
+            sampled_files=len(sample),
+            sample_cost=self.cost.compute_block(data_scanned=sum(scanned), data_returned=sum(returned),
+                                                files_requested=len(sample)),
+            confidence=confidence
+        )
+
+    def _estimate_without_sample(self, files: int, total_size: int, input_serialization: dict,
+                                 confidence: float) -> CostEstimate:
+        """
+        CSV and JSON files are scanned whole, while a Parquet query only scans the columns it selects. The data
+        returned is taken to be at most the size of the files.
+        """
+        scanned_lower = 0 if 'Parquet' in input_serialization else total_size
+        return CostEstimate(
+            cost=self.cost.compute_block(data_scanned=total_size, data_returned=total_size, files_requested=files),
+            cost_lower=self.cost.compute_block(data_scanned=scanned_lower, data_returned=0, files_requested=files),
+            cost_upper=self.cost.compute_block(data_scanned=total_size, data_returned=total_size,
+                                               files_requested=files),
+            files=files,
+            total_size=total_size,
+            bytes_scanned=total_size,
+            bytes_returned=total_size,
+            confidence=confidence
+        )
+
+    @staticmethod
+    def _ratio_and_margin(values: list, sizes: list, z_score: float, correction: float) -> tuple:
+        """
+        Bytes per byte sampled (the sum of the values over the sum of the sizes), with the margin of a ratio
+        estimator: the spread of the values around ratio * size, over the mean size.
+        """
+        ratio = sum(values) / sum(sizes)
+        if len(values) < 2:
+            # No spread can be measured on a single file, so it is taken to be as large as the ratio
+            return ratio, ratio * correction
+        residuals = [value - ratio * size for value, size in zip(values, sizes)]
+        spread = math.sqrt(sum(residual ** 2 for residual in residuals) / (len(values) - 1))
+        return ratio, z_score * spread / (math.sqrt(len(values)) * statistics.mean(sizes)) * correction
+
+    @staticmethod
+    def _z_score(confidence: float) -> float:
+        if not 0 < confidence < 1:
+            raise RuntimeError(f'Confidence {confidence} must be between 0 and 1')
+        if hasattr(statistics, 'NormalDist'):
+            return statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+        if confidence not in Z_SCORES:
+            raise RuntimeError(f'Confidence {confidence} must be one of {sorted(Z_SCORES)}')
+        return Z_SCORES[confidence]
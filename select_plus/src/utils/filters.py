@@ -0,0 +1,120 @@
+import re
+import fnmatch
+from datetime import datetime, timezone
+from typing import Optional, Union
+from urllib.parse import unquote
+
+
+class ObjectFilter:
+    """
+    Selects the objects to query from their key, size and LastModified, before anything is sent to the workers:
+    - glob: pattern(s) the key must match (e.g. "*.json"), where "*" also matches "/"
+    - regex: regular expression searched in the key
+    - min_size / max_size: bounds in bytes, inclusive (min_size=1 leaves out empty objects such as "_SUCCESS")
+    - modified_after / modified_before: bounds of LastModified, inclusive (naive datetimes are taken as UTC)
+    - partitions: values of the Hive partitions ("name=value/" in the key), each either a value, a list of values
+      or a function of the value returning True to keep the partition. Objects without the partition are left out.
+    All the conditions must be true for an object to be queried.
+    """
+
+    def __init__(self,
+                 glob: Optional[Union[str, list]] = None,
+                 regex: Optional[str] = None,
+                 min_size: Optional[int] = None,
+                 max_size: Optional[int] = None,
+                 modified_after: Optional[datetime] = None,
+                 modified_before: Optional[datetime] = None,
+                 partitions: Optional[dict] = None):
+        self.globs = [glob] if isinstance(glob, str) else glob
+        self.regex = re.compile(regex) if regex else None
+        self.min_size = min_size
+        self.max_size = max_size
+        self.modified_after = self._utc(modified_after)
+        self.modified_before = self._utc(modified_before)
+        self.partitions = partitions or {}
+
+    def __call__(self, s3_object: dict) -> bool:
+        key = s3_object['key']
+
+        if self.globs and not any(fnmatch.fnmatchcase(key, glob) for glob in self.globs):
+            return False
+        if self.regex and not self.regex.search(key):
+            return False
+
+        if self.min_size is not None and s3_object['size'] < self.min_size:
+            return False
+        if self.max_size is not None and s3_object['size'] > self.max_size:
+            return False
+
+        if self.modified_after or self.modified_before:
+            last_modified = s3_object.get('last_modified')
+            if last_modified is None:
+                return False
+            if self.modified_after and last_modified < self.modified_after:
+                return False
+            if self.modified_before and last_modified > self.modified_before:
+                return False
+
+        if self.partitions:
+            values = self._partition_values(key)
+            for name in self.partitions:
+                if name not in values or not self._match_partition(name, values[name]):
+                    return False
+
+        return True
+
+    def __and__(self, other: callable) -> callable:
+        return AllFilters(self, other)
+
+    def match_prefix(self, prefix: str) -> bool:
+        """
+        False if no object under the prefix can match the partitions, so the prefix does not need to be listed.
+        """
+        values = self._partition_values(prefix)
+        return all(self._match_partition(name, value) for name, value in values.items() if name in self.partitions)
+
+    def _match_partition(self, name: str, value: str) -> bool:
+        expected = self.partitions[name]
+        if callable(expected):
+            return bool(expected(value))
+        if isinstance(expected, (list, tuple, set, frozenset)):
+            return value in {str(item) for item in expected}
+        return value == str(expected)
+
+    @staticmethod
+    def _partition_values(key: str) -> dict:
+        """
+        The "name=value" folders of the key. The file name (after the last "/") is not a partition.
+        """
+        values = {}
+        for segment in key.split('/')[:-1]:
+            name, separator, value = segment.partition('=')
+            if separator:
+                values[unquote(name)] = unquote(value)
+        return values
+
+    @staticmethod
+    def _utc(value: Optional[datetime]) -> Optional[datetime]:
+        if value is not None and value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value
+
+
+class AllFilters:
+    """
+    Object filter true when all the filters are, evaluated in order. A prefix is listed if all the filters that can
+    prune prefixes (see "ObjectFilter.match_prefix") keep it.
+    """
+
+    def __init__(self, *filters: callable):
+        self.filters = filters
+
+    def __call__(self, s3_object: dict) -> bool:
+        return all(object_filter(s3_object) for object_filter in self.filters)
+
+    def __and__(self, other: callable) -> callable:
+        return AllFilters(*self.filters, other)
+
+    def match_prefix(self, prefix: str) -> bool:
+        return all(object_filter.match_prefix(prefix) for object_filter in self.filters
+                   if hasattr(object_filter, 'match_prefix'))
@@ -0,0 +1,67 @@
+from typing import Optional
+
+from select_plus.src.utils.aggregates import tree_reduce
+
+
+class MapReduce:
+    """
+    Folds the results of all the objects of a query into one value where the objects are queried.
+    The payload of each object, mapped by the extra function of the query (map_func), is folded into the accumulator
+    of the worker (process or thread) with combine_func(accumulator, value). Only the accumulators, one per worker,
+    are sent back and they are merged pairwise with reduce_func(accumulator, accumulator), combine_func by default.
+    An accumulator is None before the first object, then a 1-tuple holding the value, which can itself be None.
+    """
+
+    def __init__(self, combine_func: callable, reduce_func: Optional[callable] = None):
+        self.combine_func = combine_func
+        self.reduce_func = reduce_func or combine_func
+        # Accumulators sent back by the workers of the query
+        self.accumulators = []
+
+    def fold(self, accumulator: Optional[tuple], response: dict) -> tuple:
+        """
+        Folds the mapped payload of a response into the accumulator. Returns the accumulator and the response without
+        its payload, marked as "combined", which keeps the stats of the object.
+        """
+        value = response['payload']
+        accumulator = (value,) if accumulator is None else (self.combine_func(accumulator[0], value),)
+
+        combined = {"payload": None, "stats": response['stats'], "combined": True}
+        if response.get('cache_hit'):
+            combined['cache_hit'] = True
+        return accumulator, combined
+
+    def fold_tasks(self, tasks: list, results: list, accumulator: Optional[tuple] = None) -> tuple:
+        """
+        Folds the results of the tasks into the accumulator. The parts of the objects split by scan range are kept,
+        to be joined and mapped first (see "fold_remaining").
+        """
+        folded = []
+        for task, result in zip(tasks, results):
+            if result is not None and 'scan_range' not in task:
+                accumulator, result = self.fold(accumulator, result)
+            folded.append(result)
+        return accumulator, folded
+
+    def fold_remaining(self, results: list) -> list:
+        """
+        Folds the results that no worker combined (the objects joined from their parts) into one more accumulator.
+        """
+        accumulator = None
+        folded = []
+        for result in results:
+            if not result.get('combined'):
+                accumulator, result = self.fold(accumulator, result)
+            folded.append(result)
+        self.add(accumulator)
+        return folded
+
+    def add(self, accumulator: Optional[tuple]):
+        if accumulator is not None:
+            self.accumulators.append(accumulator)
+
+    def result(self):
+        """
+        The accumulators of all the workers reduced into one value, or None if no object was queried.
+        """
+        return tree_reduce([accumulator[0] for accumulator in self.accumulators], self.reduce_func)
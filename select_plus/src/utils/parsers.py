@@ -0,0 +1,216 @@
+import io
+import re
+import csv
+import json
+import itertools
+from typing import Iterable, Iterator, Optional
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def record_delimiter(output_serialization: Optional[dict]) -> str:
+    """
+    S3 Select terminates every record with the output RecordDelimiter (a new line by default).
+    """
+    for serialization in (output_serialization or {}).values():
+        if isinstance(serialization, dict) and serialization.get('RecordDelimiter'):
+            return serialization['RecordDelimiter']
+    return '\n'
+
+
+def can_split(input_serialization: dict) -> bool:
+    """
+    Scan ranges are supported for uncompressed CSV (without quoted record delimiters) and JSON LINES objects.
+    """
+    if input_serialization.get('CompressionType', 'NONE') != 'NONE':
+        return False
+    if 'CSV' in input_serialization:
+        return not input_serialization['CSV'].get('AllowQuotedRecordDelimiter', False)
+    if 'JSON' in input_serialization:
+        return input_serialization['JSON'].get('Type') == 'LINES'
+    return False
+
+
+def record_count(block: str, output_serialization: Optional[dict]) -> int:
+    """
+    The number of records of a block returned by S3 Select, each terminated by the record delimiter.
+    CSV records with quoted fields are parsed, as a quoted field may hold the record delimiter.
+    """
+    if 'CSV' in (output_serialization or {}):
+        parser = CSVParser.from_output_serialization(output_serialization)
+        if parser.quoted(block):
+            return len(parser.split_records(block))
+    return block.count(record_delimiter(output_serialization))
+
+
+def take_records(block: str, records: int, output_serialization: Optional[dict]) -> str:
+    """
+    The first records of a block returned by S3 Select.
+    """
+    if record_count(block, output_serialization) <= records:
+        return block
+
+    delimiter = record_delimiter(output_serialization)
+    lines = block.split(delimiter)
+    if 'CSV' in (output_serialization or {}):
+        parser = CSVParser.from_output_serialization(output_serialization)
+        if parser.quoted(block):
+            # A quoted field may hold the record delimiter
+            lines = parser.split_records(block)
+    return delimiter.join(lines[:records]) + delimiter if records else ''
+
+
+def serialize_records(records: Iterable[dict], output_serialization: Optional[dict]) -> str:
+    """
+    Writes records the way S3 Select returns them with the output serialization: one JSON value or one CSV row (the
+    values of the record, in order) per record delimiter.
+    """
+    delimiter = record_delimiter(output_serialization)
+    if 'CSV' not in (output_serialization or {}):
+        if orjson:
+            return ''.join(orjson.dumps(record).decode() + delimiter for record in records)
+        return ''.join(json.dumps(record, separators=(',', ':')) + delimiter for record in records)
+
+    parser = CSVParser.from_output_serialization(output_serialization)
+    quote_fields = output_serialization['CSV'].get('QuoteFields', 'ASNEEDED')
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator=delimiter,
+                        quoting=csv.QUOTE_ALL if quote_fields == 'ALWAYS' else csv.QUOTE_MINIMAL, **parser.dialect)
+    for record in records:
+        writer.writerow(record.values())
+    return output.getvalue()
+
+
+class JSONParser:
+    """
+    Parses the JSON records returned by S3 Select (one JSON value per record delimiter).
+    orjson is used when installed, otherwise the standard library json module.
+    """
+
+    def __init__(self, delimiter: str = '\n'):
+        self.delimiter = delimiter
+        self.loads = orjson.loads if orjson else json.loads
+        # Allowed between two JSON values of a block
+        self._separators = re.compile(rf'(?:\s|,|{re.escape(delimiter)})*')
+
+    def parse(self, block: str) -> list:
+        try:
+            return [self.loads(record) for record in block.split(self.delimiter) if record.strip()]
+        except ValueError:
+            # Delimiters inside strings or values spanning multiple records (e.g. formatted by an extra function)
+            return self._scan(block)
+
+    def iter_records(self, blocks: list) -> Iterator:
+        for block in blocks:
+            yield from self.parse(block)
+
+    def _scan(self, block: str) -> list:
+        """
+        Decodes consecutive JSON values separated by white spaces, commas or record delimiters.
+        """
+        decoder = json.JSONDecoder()
+        records = []
+        position = self._separators.match(block).end()
+        while position < len(block):
+            record, position = decoder.raw_decode(block, position)
+            records.append(record)
+            position = self._separators.match(block, position).end()
+        return records
+
+
+class CSVParser:
+    """
+    Parses the CSV records returned by S3 Select with the C reader of the csv module, which follows the quoting
+    rules of RFC-4180 (delimiters and new lines are allowed inside quoted fields).
+    """
+
+    def __init__(self,
+                 delimiter: str = '\n',
+                 field_delimiter: str = ',',
+                 quote_character: str = '"',
+                 quote_escape_character: str = '"'):
+        self.delimiter = delimiter
+        self.dialect = {
+            "delimiter": field_delimiter,
+            "quotechar": quote_character,
+            # By default, a quote is escaped by doubling it
+            "doublequote": quote_escape_character == quote_character,
+            "escapechar": None if quote_escape_character == quote_character else quote_escape_character
+        }
+        # The characters that split_records looks at: an escaped character, a quote or a record delimiter
+        escape = [re.escape(self.dialect['escapechar']) + '.'] if self.dialect['escapechar'] else []
+        self._tokens = re.compile('|'.join(escape + [re.escape(quote_character), re.escape(delimiter)]), re.DOTALL)
+
+    @classmethod
+    def from_output_serialization(cls, output_serialization: Optional[dict]):
+        csv_serialization = (output_serialization or {}).get('CSV') or {}
+        return cls(
+            delimiter=record_delimiter(output_serialization),
+            field_delimiter=csv_serialization.get('FieldDelimiter', ','),
+            quote_character=csv_serialization.get('QuoteCharacter', '"'),
+            quote_escape_character=csv_serialization.get('QuoteEscapeCharacter', '"')
+        )
+
+    def quoted(self, block: str) -> bool:
+        """
+        True if the block may hold quoted fields, in which the delimiters are not separators.
+        """
+        return self.dialect['quotechar'] in block or bool(self.dialect['escapechar'] and
+                                                          self.dialect['escapechar'] in block)
+
+    def split_records(self, block: str) -> list:
+        """
+        Splits a block into its records, without their delimiter. The record delimiters inside quoted fields (or
+        escaped) are kept in the records.
+        """
+        records = []
+        start = 0
+        in_quotes = False
+        for token in self._tokens.finditer(block):
+            if token.group() == self.dialect['quotechar']:
+                # A doubled quote inside a quoted field closes and reopens it
+                in_quotes = not in_quotes
+            elif token.group() == self.delimiter and not in_quotes:
+                records.append(block[start:token.start()])
+                start = token.end()
+        if start < len(block):
+            records.append(block[start:])
+        return records
+
+    def parse(self, block: str) -> list:
+        if not self.quoted(block):
+            # Without any quoted field, every delimiter is a separator
+            field_delimiter = self.dialect['delimiter']
+            return [record.split(field_delimiter) for record in block.split(self.delimiter) if record]
+
+        if self.delimiter in ['\n', '\r\n']:
+            lines = io.StringIO(block, newline='')
+        else:
+            # The csv module only recognises new lines as record delimiters
+            lines = self.split_records(block)
+        return [row for row in csv.reader(lines, **self.dialect) if row]
+
+    def iter_records(self, blocks: list) -> Iterator:
+        for block in blocks:
+            yield from self.parse(block)
+
+    def parse_columns(self, blocks: list, header: bool = False) -> dict:
+        """
+        Returns the records as columns: {column_name: [values]}.
+        Without a header, the columns are named the way S3 Select names them: _1, _2, ...
+        """
+        rows = []
+        for block in blocks:
+            rows += self.parse(block)
+
+        if header:
+            names = rows.pop(0) if rows else []
+        else:
+            names = [f'_{i + 1}' for i in range(len(rows[0]))] if rows else []
+
+        if not rows:
+            return {name: [] for name in names}
+        return {name: list(column) for name, column in zip(names, itertools.zip_longest(*rows))}
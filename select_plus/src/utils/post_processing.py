@@ -0,0 +1,488 @@
+import os
+import re
+import json
+import heapq
+import tempfile
+import itertools
+from typing import Iterable, Iterator, Optional
+
+from select_plus.src.utils.parsers import JSONParser
+from select_plus.src.utils.sql import LIMIT_PATTERN, split_items, find_clause
+from select_plus.src.utils.aggregates import AGGREGATE_PATTERN, PARTIALS, merge_value, final_values
+
+# Records kept in memory by a worker to sort. Each time the buffer is full, it is sorted and written to a temporary file
+# (a run), and the runs are merged from their files.
+SORT_BUFFER_RECORDS = 100000
+# Runs merged at once: each run file is open while it is merged
+MERGE_RUNS = 100
+
+DISTINCT_PATTERN = re.compile(r'^DISTINCT\s+(.*)$', re.IGNORECASE | re.DOTALL)
+SELECT_PATTERN = re.compile(r'^\s*SELECT\s+(.*?)\s+(FROM\s+.*)$', re.IGNORECASE | re.DOTALL)
+GROUP_BY_PATTERN = re.compile(r'GROUP\s+BY\s', re.IGNORECASE)
+ORDER_BY_PATTERN = re.compile(r'ORDER\s+BY\s', re.IGNORECASE)
+LIMIT_CLAUSE_PATTERN = re.compile(r'LIMIT\s', re.IGNORECASE)
+ALIAS_PATTERN = re.compile(r'^(.*?)\s+AS\s+([A-Za-z_][A-Za-z0-9_]*)$', re.IGNORECASE | re.DOTALL)
+DIRECTION_PATTERN = re.compile(r'^(.*?)(?:\s+(ASC|DESC))?$', re.IGNORECASE | re.DOTALL)
+PATH_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*$')
+DECIMAL_PATTERN = re.compile(r'^[+-]?(?:\d+(?:\.\d*)?|\.\d+)$')
+
+
+class SortKey:
+    """
+    Sort key of a record: the values of the ORDER BY expressions, each ascending or descending. Nulls come first in
+    ascending order, and values of different types are ordered by the name of their type.
+    """
+    __slots__ = ('values', 'descending')
+
+    def __init__(self, values: list, descending: list):
+        self.values = values
+        self.descending = descending
+
+    def __eq__(self, other) -> bool:
+        return self.values == other.values
+
+    def __lt__(self, other) -> bool:
+        for a, b, descending in zip(self.values, other.values, self.descending):
+            if a == b:
+                continue
+            return self._less(b, a) if descending else self._less(a, b)
+        return False
+
+    @staticmethod
+    def _less(a, b) -> bool:
+        if a is None or b is None:
+            return a is None
+        try:
+            return a < b
+        except TypeError:
+            return type(a).__name__ < type(b).__name__
+
+
+class ClientSideQuery:
+    """
+    A query with the clauses S3 Select does not support: GROUP BY (with COUNT, SUM, MIN, MAX, AVG), ORDER BY and
+    SELECT DISTINCT. S3 Select runs the query without them ("s3_query") and returns the values of each item as
+    "_1", "_2", ... The workers then reduce the records of each object (see "reduce"): a hash table of the partial
+    aggregates of each group, the distinct records, or the records sorted by the ORDER BY (cut to the LIMIT). The
+    partial results of all the objects are merged by the coordinator (see "merge").
+    The records are named by the alias of each item, the name of the field for a path (e.g. "s.a" is "a") or the
+    position of the item (_1, _2, ...).
+    With csv=True (CSV objects, whose fields are all strings), the decimal fields are summed, compared and sorted as
+    numbers.
+    """
+
+    def __init__(self, sql_query: str, csv: bool = False):
+        self.csv = csv
+        match = SELECT_PATTERN.match(sql_query.strip().rstrip(';'))
+        if match is None:
+            raise RuntimeError(f'Query {sql_query} is not a SELECT ... FROM ... query')
+        items, rest = match.groups()
+
+        distinct = DISTINCT_PATTERN.match(items)
+        self.distinct = distinct is not None
+        if distinct:
+            items = distinct.group(1)
+
+        clauses = self._split_clauses(rest)
+        self.from_clause = clauses['from']
+        self.limit = int(clauses['limit']) if clauses.get('limit') else None
+        self.star = items.strip() == '*'
+
+        # Expressions queried from S3, in the order of their "_1", "_2", ... names
+        self.columns = []
+        self.names = []
+        # For each item: ('column', index) or ('aggregate', function, argument column or None for COUNT(*))
+        self.items = []
+        self.grouped = 'group' in clauses
+        if not self.star:
+            for position, item in enumerate(split_items(items)):
+                self._add_item(position, item)
+
+        self.group_columns = []
+        if self.grouped:
+            if self.star:
+                raise RuntimeError('SELECT * cannot be grouped')
+            self._parse_group_by(clauses['group'])
+        elif any(item[0] == 'aggregate' for item in self.items):
+            raise RuntimeError('Aggregates without GROUP BY are computed by "SSP.aggregate"')
+
+        self.order_by = []
+        self.descending = []
+        if 'order' in clauses:
+            self._parse_order_by(clauses['order'])
+
+    @classmethod
+    def parse(cls, sql_query: str, csv: bool = False) -> Optional['ClientSideQuery']:
+        """
+        The client side query of the sql_query, or None if S3 Select runs the whole query.
+        """
+        statement = sql_query.strip()
+        match = SELECT_PATTERN.match(statement)
+        if match is None:
+            return None
+        if DISTINCT_PATTERN.match(match.group(1)) or find_clause(statement, GROUP_BY_PATTERN) != -1 or \
+                find_clause(statement, ORDER_BY_PATTERN) != -1:
+            return cls(sql_query, csv=csv)
+        return None
+
+    @property
+    def s3_query(self) -> str:
+        if self.star:
+            return f'SELECT * {self.from_clause}'
+        columns = ', '.join(f'{column} AS _{i + 1}' for i, column in enumerate(self.columns))
+        return f'SELECT {columns} {self.from_clause}'
+
+    def reduce(self, payload: str):
+        """
+        Reduces the records of one object:
+        - GROUP BY: {group key: [group values, partial aggregates]}
+        - ORDER BY: the path of the temporary file (a run) the [sort values, record] were sorted into: an external merge
+          sort, where each full buffer is sorted and written to a run and the runs are merged into one file. With a
+          LIMIT of at most SORT_BUFFER_RECORDS, the records of an object that fit in the buffer are returned as a
+          list instead, sorted and cut to the LIMIT
+        - DISTINCT: the distinct records, cut to the LIMIT
+        The LIMIT also holds with DISTINCT: the first "limit" distinct records of all the objects are among the first
+        "limit" distinct records of each object.
+        """
+        if self.grouped:
+            return self._reduce_groups(payload)
+
+        records = []
+        runs = []
+        seen = set()
+        try:
+            for record in JSONParser().parse(payload):
+                values = None if self.star else self._values(record)
+                output = record if self.star else self._record(values)
+                if self.distinct:
+                    record_key = self._record_key(output)
+                    if record_key in seen:
+                        continue
+                    seen.add(record_key)
+                records.append([self._sort_values(output, values), output] if self.order_by else output)
+                if self.order_by and len(records) >= SORT_BUFFER_RECORDS:
+                    runs.append(self._write_run(self._sort_run(records)))
+                    records = []
+
+            if not self.order_by:
+                return records[:self.limit] if self.limit is not None else records
+            if not runs and (not records or (self.limit is not None and self.limit <= SORT_BUFFER_RECORDS)):
+                return self._sort_run(records)
+            if records:
+                runs.append(self._write_run(self._sort_run(records)))
+            return runs[0] if len(runs) == 1 else self._merge_runs(runs)
+        except BaseException:
+            self._remove_runs(runs)
+            raise
+
+    def _reduce_groups(self, payload: str) -> dict:
+        kinds = self._partial_kinds()
+        aggregates = [item for item in self.items if item[0] == 'aggregate']
+        groups = {}
+        for record in JSONParser().parse(payload):
+            values = self._values(record)
+            group_values = [values[column] for column in self.group_columns]
+            partial = []
+            for _, function, column in aggregates:
+                value = None if column is None else values[column]
+                for kind in PARTIALS[function]:
+                    if kind == 'COUNT':
+                        partial.append(int(column is None or value is not None))
+                        continue
+                    number = self._number(value)
+                    # A SUM ignores the values that are not numbers, MIN and MAX compare them by type
+                    partial.append(None if kind == 'SUM' and isinstance(number, str) else number)
+
+            group_key = self._record_key(group_values)
+            if group_key in groups:
+                groups[group_key][1] = [merge_value(kind, a, b) for kind, a, b in
+                                        zip(kinds, groups[group_key][1], partial)]
+            else:
+                groups[group_key] = [group_values, partial]
+        return groups
+
+    def merge(self, partials: list) -> Iterator[dict]:
+        """
+        Merges the partial results of the objects, in the order of the listing, and yields the records of the query.
+        The sorted runs are merged as streams, including the ones written to files, which are removed once read. With
+        more than MERGE_RUNS runs, consecutive runs are first merged into run files, MERGE_RUNS at a time.
+        """
+        files = [partial for partial in partials if isinstance(partial, str)]
+        streams = []
+        try:
+            if self.grouped:
+                records = self._merge_groups(partials)
+            elif self.order_by:
+                runs = self._merge_passes([partial for partial in partials if partial], files)
+                streams = [self._read_run(run) if isinstance(run, str) else run for run in runs]
+                records = (record for _, record in heapq.merge(*streams, key=self._sort_key))
+            else:
+                records = (record for partial in partials if partial is not None for record in partial)
+
+            seen = set()
+            count = 0
+            for record in records:
+                if self.limit is not None and count >= self.limit:
+                    break
+                if self.distinct and not self.grouped:
+                    record_key = self._record_key(record)
+                    if record_key in seen:
+                        continue
+                    seen.add(record_key)
+                count += 1
+                yield record
+        finally:
+            # Also removes the runs left unread because of the LIMIT, an error or a consumer that stopped early
+            self._remove_runs(files, streams=streams)
+
+    def combine_groups(self, groups: Optional[dict], partial: Optional[dict]) -> Optional[dict]:
+        """
+        Merges the groups of a partial result into the groups (updated in place) of other objects.
+        """
+        if groups is None or partial is None:
+            return groups if partial is None else partial
+        kinds = self._partial_kinds()
+        for group_key, (group_values, aggregates) in partial.items():
+            if group_key in groups:
+                groups[group_key][1] = [merge_value(kind, a, b) for kind, a, b in
+                                        zip(kinds, groups[group_key][1], aggregates)]
+            else:
+                groups[group_key] = [group_values, aggregates]
+        return groups
+
+    def _merge_groups(self, partials: list) -> list:
+        groups = {}
+        for partial in partials:
+            groups = self.combine_groups(groups, partial)
+
+        records = [self._group_record(group_values, aggregates) for group_values, aggregates in groups.values()]
+        if self.order_by:
+            records.sort(key=lambda record: SortKey([self._number(record[name]) for name in self.order_by],
+                                                    self.descending))
+        return records
+
+    def _group_record(self, group_values: list, aggregates: list) -> dict:
+        functions = [item[1] for item in self.items if item[0] == 'aggregate']
+        values = iter(final_values(functions, aggregates))
+        record = {}
+        for name, item in zip(self.names, self.items):
+            record[name] = group_values[self.group_columns.index(item[1])] if item[0] == 'column' else next(values)
+        return record
+
+    def _partial_kinds(self) -> list:
+        return [kind for item in self.items if item[0] == 'aggregate' for kind in PARTIALS[item[1]]]
+
+    def _add_item(self, position: int, item: str):
+        aggregate = AGGREGATE_PATTERN.match(item)
+        if aggregate:
+            function, argument, alias = aggregate.groups()
+            if re.match(r'\s*DISTINCT\b', argument, re.IGNORECASE):
+                raise RuntimeError(f'{item} cannot be merged across objects')
+            column = None if argument.strip() == '*' else self._column(argument)
+            self.items.append(('aggregate', function.upper(), column))
+            self.names.append(alias or f'_{position + 1}')
+            return
+
+        alias = ALIAS_PATTERN.match(item)
+        expression = alias.group(1) if alias else item
+        if alias:
+            name = alias.group(2)
+        elif PATH_PATTERN.match(expression):
+            name = expression.split('.')[-1]
+        else:
+            name = f'_{position + 1}'
+        self.items.append(('column', self._column(expression)))
+        self.names.append(name)
+
+    def _parse_group_by(self, clause: str):
+        for expression in split_items(clause):
+            self.group_columns.append(self._resolve(expression))
+
+        for item in self.items:
+            if item[0] == 'column' and item[1] not in self.group_columns:
+                raise RuntimeError(f'{self.columns[item[1]]} must be in the GROUP BY or in an aggregate')
+
+    def _parse_order_by(self, clause: str):
+        for order in split_items(clause):
+            expression, direction = DIRECTION_PATTERN.match(order).groups()
+            expression = expression.strip()
+            self.descending.append(bool(direction) and direction.upper() == 'DESC')
+
+            if expression.isdigit() and 0 < int(expression) <= len(self.names):
+                self.order_by.append(self.names[int(expression) - 1])
+            elif expression in self.names:
+                self.order_by.append(expression)
+            elif self.star:
+                # Path in the record: "s.a.b" is the field "b" of the field "a"
+                self.order_by.append(expression.split('.')[1:] if '.' in expression else [expression])
+            elif self.grouped:
+                position = self._item_position(expression)
+                if position is None:
+                    raise RuntimeError(f'ORDER BY {expression} must be an item of the SELECT')
+                self.order_by.append(self.names[position])
+            else:
+                # Queried from S3 without being part of the records
+                self.order_by.append(self._column(expression))
+
+    def _resolve(self, expression: str) -> int:
+        """
+        The column of a GROUP BY expression: the position of an item, the name of an item or an expression.
+        """
+        expression = expression.strip()
+        if expression.isdigit() and 0 < int(expression) <= len(self.items):
+            item = self.items[int(expression) - 1]
+        elif expression in self.names:
+            item = self.items[self.names.index(expression)]
+        else:
+            return self._column(expression)
+        if item[0] != 'column':
+            raise RuntimeError(f'GROUP BY {expression} cannot be an aggregate')
+        return item[1]
+
+    def _item_position(self, expression: str) -> Optional[int]:
+        normalized = self._normalize(expression)
+        for position, item in enumerate(self.items):
+            if item[0] == 'column' and self._normalize(self.columns[item[1]]) == normalized:
+                return position
+        return None
+
+    def _column(self, expression: str) -> int:
+        normalized = self._normalize(expression)
+        for i, column in enumerate(self.columns):
+            if self._normalize(column) == normalized:
+                return i
+        self.columns.append(expression.strip())
+        return len(self.columns) - 1
+
+    @staticmethod
+    def _normalize(expression: str) -> str:
+        return ' '.join(expression.split()).lower()
+
+    @staticmethod
+    def _split_clauses(rest: str) -> dict:
+        """
+        Splits "FROM ... [WHERE ...] [GROUP BY ...] [ORDER BY ...] [LIMIT n]" into its clauses.
+        """
+        positions = []
+        for name, pattern in [('group', GROUP_BY_PATTERN), ('order', ORDER_BY_PATTERN)]:
+            position = find_clause(rest, pattern)
+            if position != -1:
+                positions.append((position, name))
+        limit = LIMIT_PATTERN.search(rest)
+        if limit and find_clause(rest, LIMIT_CLAUSE_PATTERN) != -1:
+            positions.append((limit.start(), 'limit'))
+        positions.sort()
+
+        clauses = {"from": rest[:positions[0][0]].strip() if positions else rest.strip()}
+        for i, (position, name) in enumerate(positions):
+            end = positions[i + 1][0] if i + 1 < len(positions) else len(rest)
+            text = rest[position:end].strip()
+            if name == 'limit':
+                clauses[name] = LIMIT_PATTERN.search(' ' + text).group(1)
+            else:
+                clauses[name] = re.sub(r'^\w+\s+BY\s+', '', text, flags=re.IGNORECASE)
+        return clauses
+
+    def _values(self, record: dict) -> list:
+        return [record.get(f'_{i + 1}') for i in range(len(self.columns))]
+
+    def _record(self, values: list) -> dict:
+        return {name: values[item[1]] for name, item in zip(self.names, self.items)}
+
+    def _sort_values(self, record: dict, values: Optional[list]) -> list:
+        sort_values = []
+        for order in self.order_by:
+            if isinstance(order, int):
+                value = values[order]
+            elif isinstance(order, list):
+                value = record
+                for field in order:
+                    value = value.get(field) if isinstance(value, dict) else None
+            else:
+                value = record[order]
+            sort_values.append(self._number(value))
+        return sort_values
+
+    def _number(self, value):
+        """
+        CSV fields are returned as strings: the decimal ones (e.g. "-12" or "2.5", not "NaN" or "1e5") are summed,
+        compared (MIN, MAX) and sorted as numbers. Other values, and all the values of other objects, are returned as
+        they are.
+        """
+        if not self.csv or not isinstance(value, str):
+            return value
+        if DECIMAL_PATTERN.match(value) is None:
+            return value
+        return float(value) if '.' in value else int(value)
+
+    @staticmethod
+    def _record_key(values) -> str:
+        return json.dumps(values, sort_keys=True, default=str)
+
+    def _sort_key(self, item: list) -> SortKey:
+        return SortKey(item[0], self.descending)
+
+    def _sort_run(self, records: list) -> list:
+        records.sort(key=self._sort_key)
+        return records[:self.limit] if self.limit is not None else records
+
+    def _merge_runs(self, runs: list) -> str:
+        """
+        Merges sorted runs (lists or run files) into one run file, cut to the LIMIT, reading each run as a stream.
+        The run files merged are removed.
+        """
+        streams = [self._read_run(run) if isinstance(run, str) else run for run in runs]
+        try:
+            return self._write_run(itertools.islice(heapq.merge(*streams, key=self._sort_key), self.limit))
+        finally:
+            self._remove_runs([run for run in runs if isinstance(run, str)], streams=streams)
+
+    def _merge_passes(self, runs: list, files: list) -> list:
+        """
+        Merges consecutive runs, MERGE_RUNS at a time, until at most MERGE_RUNS are left. The run files written are
+        added to "files", to be removed by the caller.
+        """
+        while len(runs) > MERGE_RUNS:
+            merged = []
+            for start in range(0, len(runs), MERGE_RUNS):
+                merged.append(self._merge_runs(runs[start:start + MERGE_RUNS]))
+                files.append(merged[-1])
+            runs = merged
+        return runs
+
+    @staticmethod
+    def _read_run(path: str) -> Iterator[list]:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    @staticmethod
+    def _write_run(run: Iterable) -> str:
+        descriptor, path = tempfile.mkstemp(prefix='ssp-run-', suffix='.jsonl')
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+                for item in run:
+                    f.write(json.dumps(item, default=str) + '\n')
+        except BaseException:
+            os.remove(path)
+            raise
+        return path
+
+    @staticmethod
+    def _remove_runs(paths: list, streams: Iterable = ()):
+        """
+        Closes the streams reading the runs, then removes the run files.
+        """
+        for stream in streams:
+            if hasattr(stream, 'close'):
+                stream.close()
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def partial_results(payload: str, query: ClientSideQuery):
+    """
+    Extra function run by the workers on the records of each object (see "ClientSideQuery.reduce").
+    """
+    return query.reduce(payload)
@@ -0,0 +1,72 @@
+import re
+from typing import Optional
+
+# S3 Select only accepts a LIMIT at the end of the query
+LIMIT_PATTERN = re.compile(r'\s+LIMIT\s+(\d+)\s*;?\s*$', re.IGNORECASE)
+
+
+def parse_limit(sql_query: str) -> Optional[int]:
+    """
+    The number of records of the LIMIT clause of the query, or None without one.
+    """
+    match = LIMIT_PATTERN.search(sql_query)
+    return int(match.group(1)) if match else None
+
+
+def with_limit(sql_query: str, limit: int) -> str:
+    """
+    The query with a LIMIT clause of at most limit records. S3 Select applies it to each object.
+    """
+    match = LIMIT_PATTERN.search(sql_query)
+    if match is None:
+        return f'{sql_query.rstrip().rstrip(";")} LIMIT {limit}'
+    if int(match.group(1)) <= limit:
+        return sql_query
+    return f'{sql_query[:match.start()]} LIMIT {limit}'
+
+
+def split_items(items: str, separator: str = ',') -> list:
+    """
+    Splits a list of SQL items on the separators outside of parentheses and quotes.
+    """
+    parts = []
+    depth = 0
+    quote = None
+    current = ''
+    for char in items:
+        if quote:
+            quote = None if char == quote else quote
+        elif char in '\'"':
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append(current.strip())
+            current = ''
+            continue
+        current += char
+    parts.append(current.strip())
+    return parts
+
+
+def find_clause(sql_query: str, pattern: re.Pattern) -> int:
+    """
+    The position of the first match of the pattern (e.g. "GROUP BY") outside of parentheses and quotes, after a
+    white space, or -1.
+    """
+    depth = 0
+    quote = None
+    for position, char in enumerate(sql_query):
+        if quote:
+            quote = None if char == quote else quote
+        elif char in '\'"':
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif depth == 0 and position and sql_query[position - 1].isspace() and pattern.match(sql_query, position):
+            return position
+    return -1
@@ -1,14 +1,29 @@
-from typing import Type, Union
+from typing import Iterator, Optional, Type, Union
 from multiprocessing import cpu_count
+import boto3
 
 from select_plus.src.aws.s3 import S3
 from select_plus.src.utils.cost import Cost
-from select_plus.src.models.models import EngineResults, InputSerialization, OutputSerialization, \
-    JSONInputSerialization, JSONOutputSerialization
+from select_plus.src.utils.budget import Budget
+from select_plus.src.utils.sql import parse_limit, with_limit
+from select_plus.src.utils.aggregates import AggregateQuery, parse_partial
+from select_plus.src.utils.map_reduce import MapReduce
+from select_plus.src.utils.concurrency import ConcurrencyLimiter
+from select_plus.src.utils.post_processing import ClientSideQuery
+from select_plus.src.utils.estimator import CostEstimator
+from select_plus.src.utils.arrow import BATCH_FORMATS, require_pyarrow
+from select_plus.src.models.models import AggregateResults, CostEstimate, EngineResults, InputSerialization, \
+    OutputSerialization, JSONInputSerialization, JSONOutputSerialization
 from select_plus.src.engine.base_engine import BaseEngine
 from select_plus.src.engine.sequential_engine import SequentialEngine
 from select_plus.src.engine.parallel_engine import ParallelEngine
+from select_plus.src.engine.threaded_engine import ThreadedEngine
 from select_plus.src.engine.engine import EngineWrapper
+from select_plus.src.sinks.sinks import BaseSink
+from select_plus.src.cache.listing_cache import ListingCache
+from select_plus.src.cache.result_cache import BaseResultCache
+from select_plus.src.cache.checkpoint import Checkpoint
+from select_plus.src.utils.filters import ObjectFilter
 
 
 class SSP:
@@ -16,31 +31,127 @@ class SSP:
     def __init__(self,
                  bucket_name: str,
                  prefix: str = '',
-                 engine: Union[Type[BaseEngine], ParallelEngine, SequentialEngine] = ParallelEngine,
-                 verbose: bool = False):
+                 engine: Union[Type[BaseEngine], ParallelEngine, SequentialEngine, ThreadedEngine] = ParallelEngine,
+                 verbose: bool = False,
+                 max_pool_connections: int = 10,
+                 list_concurrency: Optional[int] = None,
+                 listing_cache: Optional[ListingCache] = None,
+                 object_filter: Optional[ObjectFilter] = None):
+        """
+        With a list_concurrency, the sub-prefixes of the prefix (e.g. "prefix/part=1/", "prefix/part=2/") are listed
+        in parallel by up to that many threads instead of paging through the whole prefix one request at a time.
+        With a listing_cache (see ListingCache), the listing of the prefix is reused by "estimate_cost" and the
+        queries until it expires.
+        With an object_filter (see ObjectFilter), only the files matching it are queried and estimated.
+        """
         self.bucket_name = bucket_name
         self.prefix = prefix
         self.verbose = verbose
         self.engine = engine
+        self.max_pool_connections = max_pool_connections
+        self.list_concurrency = list_concurrency
+        self.listing_cache = listing_cache
+        self.object_filter = object_filter
 
         # Validate the engine is inheriting the BaseEngine
         if not issubclass(engine, BaseEngine):
             raise RuntimeError(f'Engine {engine.__name__} does not inherit BaseEngine')
 
         self.cost = Cost()
+        self._session_engine = None
+
+    def __enter__(self):
+        if self._session_engine is None:
+            self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
-    def estimate_cost(self) -> float:
+    def open(self, threads: int = cpu_count(), idle_timeout: Optional[float] = None):
         """
-        Estimates the cost of selecting from all files
+        Starts a session: the engine and its workers are kept alive and reused by every "select" until "close" is
+        called. With an idle_timeout (seconds), the workers are released while no query runs and are started again
+        by the next query.
+        Usage:
+            with SSP(bucket_name='bucket').open(threads=8, idle_timeout=300) as ssp:
+                ssp.select(...)
         """
-        s3 = S3()
-        s3_response = s3.list_objects(bucket_name=self.bucket_name, prefix=self.prefix)
-        estimate_cost = self.cost.compute_block(
-            data_scanned=s3_response['total_file_size'],
-            data_returned=s3_response['total_file_size'],
-            files_requested=s3_response['total_files']
-        )
-        return estimate_cost
+        if self._session_engine is not None:
+            raise RuntimeError('SSP session is already open')
+
+        self._session_engine = self._make_engine(threads=threads)
+        self._session_engine.start(idle_timeout=idle_timeout)
+        return self
+
+    def close(self):
+        """
+        Stops the workers of the session opened with "open".
+        """
+        if self._session_engine is not None:
+            self._session_engine.shutdown()
+            self._session_engine = None
+
+    def _make_engine(self, threads: int) -> BaseEngine:
+        return self.engine(bucket_name=self.bucket_name,
+                           prefix=self.prefix,
+                           threads=threads,
+                           verbose=self.verbose,
+                           max_pool_connections=self.max_pool_connections,
+                           list_concurrency=self.list_concurrency,
+                           listing_cache=self.listing_cache)
+
+    def estimate_cost(self,
+                      sql_query: Optional[str] = None,
+                      input_serialization: Union[InputSerialization, dict] = InputSerialization(
+                          json=JSONInputSerialization(Type='DOCUMENT')
+                      ),
+                      output_serialization: Union[OutputSerialization, dict] = OutputSerialization(
+                          json=JSONOutputSerialization()
+                      ),
+                      sample_size: int = 5) -> float:
+        """
+        Estimates the cost of selecting from all files.
+        Without a sql_query, all the files are taken to be scanned and returned. With a sql_query, the estimate is
+        measured on a sample of the files (see "estimate").
+        """
+        return self.estimate(sql_query=sql_query, input_serialization=input_serialization,
+                             output_serialization=output_serialization, sample_size=sample_size).cost
+
+    def estimate(self,
+                 sql_query: Optional[str] = None,
+                 input_serialization: Union[InputSerialization, dict] = InputSerialization(
+                     json=JSONInputSerialization(Type='DOCUMENT')
+                 ),
+                 output_serialization: Union[OutputSerialization, dict] = OutputSerialization(
+                     json=JSONOutputSerialization()
+                 ),
+                 sample_size: int = 5,
+                 sample_bytes: int = 1024 * 1024,
+                 confidence: float = 0.95,
+                 seed: Optional[int] = None,
+                 s3_client: Optional[boto3.session.Session.client] = None) -> CostEstimate:
+        """
+        Estimates the cost of the query, with lower and upper bounds at the given confidence.
+        The query is run on sample_size random files (only on the first sample_bytes of the large CSV and JSON LINES
+        files) and the bytes scanned and returned per byte of file are extrapolated to all the files. The cost of
+        the sample itself is in "sample_cost".
+        """
+        s3 = S3(client=s3_client)
+        s3_response = s3.list_objects(bucket_name=self.bucket_name, prefix=self.prefix,
+                                      list_concurrency=self.list_concurrency,
+                                      listing_cache=self.listing_cache,
+                                      prefix_filter=getattr(self.object_filter, 'match_prefix', None))
+        objects = s3_response['objects']
+        if self.object_filter is not None:
+            objects = [s3_object for s3_object in objects if self.object_filter(s3_object)]
+
+        estimator = CostEstimator(s3=s3, bucket_name=self.bucket_name, cost=self.cost)
+        return estimator.estimate(objects=objects, sql_query=sql_query,
+                                  input_serialization=EngineWrapper.deserialize(input_serialization),
+                                  output_serialization=EngineWrapper.deserialize(output_serialization),
+                                  sample_size=sample_size, sample_bytes=sample_bytes, confidence=confidence,
+                                  seed=seed)
 
     def select(
             self,
@@ -53,12 +164,138 @@ class SSP:
             ),
             output_serialization: Union[OutputSerialization, dict] = OutputSerialization(
                 json=JSONOutputSerialization()
-            )
+            ),
+            arrow: bool = False,
+            sink: Optional[BaseSink] = None,
+            scan_range_size: Optional[int] = None,
+            result_cache: Optional[BaseResultCache] = None,
+            checkpoint: Optional[Checkpoint] = None,
+            max_cost: Optional[float] = None,
+            max_bytes_scanned: Optional[int] = None,
+            limit: Optional[int] = None,
+            map_func: Optional[callable] = None,
+            combine_func: Optional[callable] = None,
+            reduce_func: Optional[callable] = None,
+            batch_format: Optional[str] = None,
+            limiter: Optional[ConcurrencyLimiter] = None,
+            schedule: Optional[str] = None
     ) -> EngineResults:
-        eng = self.engine(bucket_name=self.bucket_name,
-                          prefix=self.prefix,
-                          threads=threads,
-                          verbose=self.verbose)
+        """
+        Runs the query on all the files. Inside a session (see "open"), the workers of the session are used and
+        "threads" is ignored.
+        With arrow=True, the records of each file are parsed into Arrow by the workers (requires pyarrow) and can be
+        loaded with "results.to_arrow()" or "results.to_pandas()".
+        With a sink (e.g. DirectorySink), the workers write the results of each file to the sink and the payload of
+        the results only holds the references to them.
+        With a scan_range_size (bytes), uncompressed CSV and JSON LINES files larger than that are split into byte
+        ranges queried in parallel. The results of each file are joined back in order.
+        With a result_cache (e.g. DirectoryResultCache), files that did not change since they were queried with the
+        same SQL and serialization are read from the cache instead of S3. See "results.stats.cache_hits".
+        With a checkpoint, only the files added or changed since the last query with that checkpoint are queried
+        (the others are counted in "results.stats.files_skipped"), and the checkpoint is saved once the query
+        succeeds.
+        With a max_cost (dollars) or a max_bytes_scanned, the cost and bytes scanned are tracked as the responses are
+        received and no new file is queried once one of them is reached. The files already started are completed, so
+        the limit can be exceeded by the files in flight. The results of the files queried are returned with
+        "results.stats.truncated" set, and a checkpoint only saves those files.
+        With a LIMIT at the end of the sql_query or a limit, no new file is queried once that many records were
+        received, and the results hold the first "limit" records (unless processed by an extra function, arrow or a
+        sink, where each file returns at most "limit" records). The limit is added to the query sent to S3. Once the
+        limit is reached, a checkpoint does not save the files queried, as some of their records may be left out.
+        GROUP BY (with COUNT, SUM, MIN, MAX, AVG), ORDER BY and SELECT DISTINCT, which S3 Select does not support, are
+        run on the records returned: the workers group, sort or deduplicate the records of each file and the results
+        of all the files are merged (see ClientSideQuery). The records are named by the alias of each item.
+        With a map_func and a combine_func, the results of all the files are folded into one value, returned as
+        "results.value" (the payload is empty): the payload of each file is mapped with map_func(payload,
+        **extra_func_args) and each worker folds the values of its files into its own accumulator with
+        combine_func(accumulator, value). Only one accumulator per worker is sent back, and they are merged with
+        reduce_func(accumulator, accumulator), combine_func by default. The files are folded in no particular order.
+        With a batch_format ('arrow', 'pandas' or 'numpy'), the workers parse the records of each file once according
+        to the output serialization (requires pyarrow), and the extra_func or map_func receives them as an Arrow
+        table, a pandas DataFrame or a dict of NumPy arrays by column instead of a string.
+        With a limiter (ConcurrencyLimiter), the requests in flight are limited adaptively: the limit grows while the
+        responses are healthy and is cut when S3 throttles the requests (SlowDown, 503), which are retried after a
+        backoff. Best with the ThreadedEngine, whose threads share the limiter. The throttles and the decisions of the
+        limiter are added to "results.stats".
+        With a schedule ('size' or 'listing'), the ParallelEngine and the ThreadedEngine start the largest files of
+        each page of the listing first ('size', the default) or query the files in the order they are listed.
+        """
+        eng = self._session_engine if self._session_engine is not None else self._make_engine(threads=threads)
+
+        # Only the options that are set are passed, so engines that do not support them keep working
+        select_options = {}
+        if arrow:
+            require_pyarrow()
+            select_options['arrow'] = True
+        if sink:
+            select_options['sink'] = sink
+        if scan_range_size:
+            select_options['scan_range_size'] = scan_range_size
+        if result_cache is not None:
+            select_options['result_cache'] = result_cache
+        if limiter is not None:
+            select_options['limiter'] = limiter
+        if schedule is not None:
+            if not isinstance(eng, (ParallelEngine, ThreadedEngine)):
+                raise RuntimeError('schedule requires the ParallelEngine or the ThreadedEngine')
+            select_options['schedule'] = schedule
+
+        if map_func is not None or combine_func is not None or reduce_func is not None:
+            if map_func is None or combine_func is None:
+                raise RuntimeError('map_func and combine_func must be given together')
+            if extra_func or arrow or sink:
+                raise RuntimeError('extra_func, arrow and sink cannot be used with map_func')
+            extra_func = map_func
+            select_options['map_reduce'] = MapReduce(combine_func=combine_func, reduce_func=reduce_func)
+
+        if batch_format is not None:
+            if not extra_func:
+                raise RuntimeError('batch_format requires an extra_func or a map_func')
+            if batch_format not in BATCH_FORMATS:
+                raise RuntimeError(f'Batch format {batch_format} must be {" | ".join(BATCH_FORMATS)}')
+            require_pyarrow()
+            select_options['batch_format'] = batch_format
+
+        client_side_query = ClientSideQuery.parse(sql_query,
+                                                  csv='CSV' in EngineWrapper.deserialize(input_serialization))
+        if client_side_query is not None:
+            if extra_func or arrow:
+                raise RuntimeError('extra_func and arrow cannot be used with GROUP BY, ORDER BY or DISTINCT')
+            # The LIMIT applies to the merged records
+            if limit is not None and (client_side_query.limit is None or limit < client_side_query.limit):
+                client_side_query.limit = limit
+            select_options['client_side_query'] = client_side_query
+            limit = None
+        else:
+            sql_limit = parse_limit(sql_query)
+            if sql_limit is not None:
+                limit = sql_limit if limit is None else min(limit, sql_limit)
+            if limit is not None:
+                sql_query = with_limit(sql_query, limit)
+                select_options['count_records'] = True
+
+        budget = None
+        if max_cost is not None or max_bytes_scanned is not None or limit is not None:
+            budget = Budget(max_cost=max_cost, max_bytes_scanned=max_bytes_scanned, max_records=limit,
+                            cost=self.cost)
+            select_options['budget'] = budget
+
+        object_filter = self.object_filter
+        listed_objects = []
+        processed_keys = set()
+        if checkpoint is not None:
+            def checkpoint_filter(s3_object: dict) -> bool:
+                # Called for each listed object matching the object filter, where the objects are listed
+                listed_objects.append(s3_object)
+                if checkpoint.is_processed(s3_object):
+                    processed_keys.add(s3_object['key'])
+                    return False
+                return True
+
+            object_filter = object_filter & checkpoint_filter if object_filter is not None else checkpoint_filter
+
+        if object_filter is not None:
+            select_options['object_filter'] = object_filter
 
         eng_wrapper = EngineWrapper()
 
@@ -67,6 +304,84 @@ class SSP:
                                       extra_func_args=extra_func_args,
                                       engine=eng,
                                       input_serialization=input_serialization,
-                                      output_serialization=output_serialization)
+                                      output_serialization=output_serialization,
+                                      **select_options)
+
+        if checkpoint is not None:
+            if budget is not None and (budget.stopped or budget.limit_reached):
+                # The files that were not queried are left for the next query, and so are all the files queried once
+                # the limit is reached: the records left out by the limit are not lost
+                queried_keys = set() if budget.limit_reached else budget.keys
+                listed_objects = [s3_object for s3_object in listed_objects
+                                  if s3_object['key'] in processed_keys or s3_object['key'] in queried_keys]
+            checkpoint.commit(listed_objects)
+            results.stats.files_skipped = len(processed_keys)
 
         return results
+
+    def aggregate(
+            self,
+            sql_query: str,
+            threads: int = cpu_count(),
+            input_serialization: Union[InputSerialization, dict] = InputSerialization(
+                json=JSONInputSerialization(Type='DOCUMENT')
+            ),
+            scan_range_size: Optional[int] = None,
+            result_cache: Optional[BaseResultCache] = None,
+            max_cost: Optional[float] = None,
+            max_bytes_scanned: Optional[int] = None
+    ) -> AggregateResults:
+        """
+        Runs a query made only of COUNT, SUM, MIN, MAX and AVG over all the files and returns the value of each
+        aggregate, e.g. "SELECT COUNT(*), SUM(s.x) AS total FROM s3object s" returns {"_1": 10, "total": 123}.
+        S3 Select computes the partial aggregates of each file (AVG as SUM and COUNT), each worker parses and merges
+        the partial aggregates of its files and those of the workers are merged pairwise into the final values. See
+        "select" for the other arguments.
+        """
+        query = AggregateQuery(sql_query)
+        results = self.select(sql_query=query.partial_query,
+                              map_func=parse_partial,
+                              combine_func=query.merge,
+                              extra_func_args={"query": query},
+                              threads=threads,
+                              input_serialization=input_serialization,
+                              output_serialization=OutputSerialization(json=JSONOutputSerialization()),
+                              scan_range_size=scan_range_size,
+                              result_cache=result_cache,
+                              max_cost=max_cost,
+                              max_bytes_scanned=max_bytes_scanned)
+
+        return AggregateResults(values=query.finalize(results.value), stats=results.stats)
+
+    def select_iter(
+            self,
+            sql_query: str,
+            input_serialization: Union[InputSerialization, dict] = InputSerialization(
+                json=JSONInputSerialization(Type='DOCUMENT')
+            ),
+            output_serialization: Union[OutputSerialization, dict] = OutputSerialization(
+                json=JSONOutputSerialization()
+            ),
+            s3_client: Optional[boto3.session.Session.client] = None
+    ) -> Iterator[dict]:
+        """
+        Streams the results of the query object by object instead of buffering them into EngineResults.
+        Yields {"key": key, "payload": "<records>"} for each batch of records as it comes off the wire and
+        {"key": key, "stats": {...}} once the statistics of that object are received.
+        """
+        dict_input_serialization = EngineWrapper.deserialize(input_serialization)
+        dict_output_serialization = EngineWrapper.deserialize(output_serialization)
+
+        s3 = S3(client=s3_client)
+        for page in s3.iter_objects(bucket_name=self.bucket_name, prefix=self.prefix,
+                                    list_concurrency=self.list_concurrency, listing_cache=self.listing_cache,
+                                    prefix_filter=getattr(self.object_filter, 'match_prefix', None)):
+            for s3_object in page:
+                if self.object_filter is not None and not self.object_filter(s3_object):
+                    continue
+                key = s3_object['key']
+                for event in s3.select_iter(bucket_name=self.bucket_name, key=key, sql_string=sql_query,
+                                            input_serialization=dict_input_serialization,
+                                            output_serialization=dict_output_serialization):
+                    event['key'] = key
+                    yield event
@@ -21,5 +21,8 @@ setuptools.setup(
     install_requires=[
         'boto3>=1.24.75',
         'tqdm>=4.64.1'
-    ]
+    ],
+    extras_require={
+        'arrow': ['pyarrow>=8.0.0']
+    }
 )
\ No newline at end of file
@@ -0,0 +1,37 @@
+# Micro-benchmark of the overhead paid by every S3 instance before a request is sent.
+# Before: a new boto3 client was created for each key (service model loading, endpoint resolution, new connection pool)
+# After: the client is created once per process and reused for every key.
+# No requests are sent, so the benchmark does not need AWS credentials or network access.
+
+import time
+import boto3
+from tabulate import tabulate
+from select_plus.src.aws.s3 import S3
+
+
+def time_per_instance(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    end = time.perf_counter()
+    return (end - start) / iterations * 1000
+
+
+def new_client():
+    s3 = S3(client=boto3.client('s3', region_name='eu-west-1'))
+    return s3.client
+
+
+def cached_client():
+    s3 = S3()
+    return s3.client
+
+
+if __name__ == '__main__':
+    iterations = 200
+    S3.clear_clients()
+    results = [
+        ['new client per key', iterations, round(time_per_instance(new_client, iterations), 3)],
+        ['cached client', iterations, round(time_per_instance(cached_client, iterations), 3)]
+    ]
+    print(tabulate(tabular_data=results, headers=['case', 'keys', 'ms_per_key'], tablefmt="orgtbl"))
@@ -0,0 +1,48 @@
+# Benchmark of the listing of a partitioned prefix ("large_json/{partition}/file{i}.json", as in create_files.py).
+# The S3 client is simulated: each list_objects_v2 page takes a fixed time and holds up to 1000 keys, so the benchmark
+# does not need AWS credentials or network access.
+
+import time
+from tabulate import tabulate
+from select_plus.src.aws.s3 import S3
+
+SECONDS_PER_PAGE = 0.05
+PARTITIONS = 20
+FILES_PER_PARTITION = 2500
+
+
+class PartitionedS3Client:
+
+    def get_paginator(self, *args, **kwargs):
+        return self
+
+    @staticmethod
+    def paginate(Bucket: str, Prefix: str, Delimiter: str = None):
+        if Delimiter:
+            time.sleep(SECONDS_PER_PAGE)
+            prefixes = [f'large_json/{partition:02}/' for partition in range(PARTITIONS)]
+            yield {'CommonPrefixes': [{'Prefix': prefix} for prefix in prefixes if prefix.startswith(Prefix)]}
+            return
+
+        partitions = range(PARTITIONS) if Prefix == 'large_json/' else [int(Prefix.split('/')[1])]
+        keys = [f'large_json/{partition:02}/file{i}.json' for partition in partitions
+                for i in range(FILES_PER_PARTITION)]
+        for start in range(0, len(keys), 1000):
+            time.sleep(SECONDS_PER_PAGE)
+            yield {'Contents': [{'Key': key, 'Size': 1} for key in keys[start:start + 1000]]}
+
+
+def run(list_concurrency) -> float:
+    s3 = S3(client=PartitionedS3Client())
+    start = time.time()
+    s3.list_objects(bucket_name='bucket', prefix='large_json/', list_concurrency=list_concurrency)
+    return round(time.time() - start, 2)
+
+
+if __name__ == '__main__':
+    results = []
+    for list_concurrency in [None, 4, 16]:
+        results.append([list_concurrency or 1, PARTITIONS, PARTITIONS * FILES_PER_PARTITION, run(list_concurrency)])
+
+    print(tabulate(tabular_data=results, headers=['list_concurrency', 'partitions', 'files', 'time_taken_sec'],
+                   tablefmt="orgtbl"))
@@ -0,0 +1,70 @@
+# Benchmark of the payload parsing of EngineResults.payload_dict and EngineResults.payload_csv.
+# The records of tests/files/sample.json are returned the way S3 Select returns them (one JSON record per line)
+# and parsed with the previous implementation (eval) and with the current one (orjson / json).
+# The records of tests/files/sample.csv are parsed with the previous implementation (str.split) and with the
+# current one (csv module).
+
+import json
+import time
+from tabulate import tabulate
+from select_plus.src.models.models import EngineResults, EngineResultsStats
+
+
+def eval_payload_dict(payload: list) -> list:
+    payload_dict = []
+    for item in payload:
+        sub_item = item.replace('\n', ',')
+        payload_dict += list(eval(sub_item))
+    return payload_dict
+
+
+def split_payload_csv(payload: list) -> list:
+    payload_csv = []
+    for item in payload:
+        for row in item.split('\n'):
+            if len(row) > 0:
+                payload_csv.append(row.split(','))
+    return payload_csv
+
+
+def time_parser(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    end = time.perf_counter()
+    return (end - start) / iterations * 1000
+
+
+if __name__ == '__main__':
+    with open('tests/files/sample.json', 'r') as f:
+        records = json.load(f)
+    block = ''.join(json.dumps(record) + '\n' for record in records)
+    payload = [block] * 10
+
+    results = EngineResults(
+        payload=payload,
+        stats=EngineResultsStats(cost=0, files_processed=0, bytes_scanned=0, bytes_returned=0, bytes_processed=0)
+    )
+    assert results.payload_dict == eval_payload_dict(payload)
+
+    iterations = 5
+    table = [
+        ['eval', len(records) * len(payload), round(time_parser(lambda: eval_payload_dict(payload), iterations), 2)],
+        ['payload_dict', len(records) * len(payload), round(time_parser(lambda: results.payload_dict, iterations), 2)]
+    ]
+
+    with open('tests/files/sample.csv', 'r') as f:
+        csv_payload = [f.read()] * 10
+    csv_results = EngineResults(
+        payload=csv_payload,
+        stats=EngineResultsStats(cost=0, files_processed=0, bytes_scanned=0, bytes_returned=0, bytes_processed=0)
+    )
+    csv_records = len(csv_results.payload_csv)
+    assert csv_results.payload_csv == split_payload_csv(csv_payload)
+
+    table += [
+        ['str.split', csv_records, round(time_parser(lambda: split_payload_csv(csv_payload), iterations), 2)],
+        ['payload_csv', csv_records, round(time_parser(lambda: csv_results.payload_csv, iterations), 2)],
+        ['payload_columns', csv_records, round(time_parser(csv_results.payload_columns, iterations), 2)]
+    ]
+    print(tabulate(tabular_data=table, headers=['parser', 'records', 'ms'], tablefmt="orgtbl"))
@@ -0,0 +1,55 @@
+# Benchmark of the task scheduling of the engines on a skewed prefix.
+# Many small objects are listed before one large object. The S3 client is simulated: each select takes a time
+# proportional to the size of the object, so the benchmark does not need AWS credentials or network access.
+# The time taken is the time until the last object is returned (the tail latency of the query).
+
+import time
+from tabulate import tabulate
+from select_plus import ParallelEngine, ThreadedEngine
+
+SECONDS_PER_MB = 0.02
+MB = 1024 * 1024
+
+
+class SkewedPaginator:
+
+    @staticmethod
+    def paginate(Bucket: str, Prefix: str):
+        contents = [{"Key": f'small/file{i}.json', "Size": MB} for i in range(60)]
+        contents.append({"Key": 'large/file.json', "Size": 60 * MB})
+        return [{'KeyCount': len(contents), 'Contents': contents}]
+
+
+class SkewedS3Client:
+
+    @staticmethod
+    def select_object_content(Key: str, **kwargs):
+        time.sleep(SECONDS_PER_MB * (60 if Key.startswith('large') else 1))
+        payload = [
+            {"Records": {"Payload": Key.encode()}},
+            {"Stats": {"Details": {"BytesScanned": 1, "BytesProcessed": 1, "BytesReturned": 1}}}
+        ]
+        return {"Payload": payload}
+
+    @staticmethod
+    def get_paginator(*args, **kwargs):
+        return SkewedPaginator()
+
+
+def run(engine_class, schedule: str, threads: int) -> float:
+    engine = engine_class(bucket_name='bucket', prefix='', threads=threads, verbose=False)
+    start = time.time()
+    engine.execute(sql_query='', input_serialization={}, output_serialization={},
+                   s3_client=SkewedS3Client(), schedule=schedule)
+    return round(time.time() - start, 2)
+
+
+if __name__ == '__main__':
+    threads = 4
+    results = []
+    for engine_class in [ParallelEngine, ThreadedEngine]:
+        for schedule in ['listing', 'size']:
+            results.append([engine_class.__name__, schedule, threads, 61, run(engine_class, schedule, threads)])
+
+    print(tabulate(tabular_data=results, headers=['engine', 'schedule', 'threads', 'files', 'time_taken_sec'],
+                   tablefmt="orgtbl"))
@@ -0,0 +1,79 @@
+import unittest
+from moto import mock_s3
+
+from select_plus.ssp import SSP
+from select_plus.src.utils.aggregates import AggregateQuery, parse_partial, tree_reduce
+from tests.util.test_wrapper import TestWrapper, CountingClient, CountingEngine
+
+QUERY = 'SELECT COUNT(*), SUM(s.x) AS total, MIN(s.x), AVG(s.y) AS mean FROM s3object s WHERE s.a = \'1,2\''
+
+
+class AggregateClient(CountingClient):
+    """
+    Returns partial aggregates of QUERY for each file: test-key/file.json has 2 records and the others 1.
+    """
+
+    def __init__(self, client):
+        super().__init__(client)
+        self.expressions = []
+
+    def select_object_content(self, Key: str, **kwargs):
+        self.keys.append(Key)
+        self.expressions.append(kwargs['Expression'])
+        if Key == 'test-key/file.json':
+            record = '{"_1":2,"_2":10,"_3":4,"_4":3.0,"_5":2}\n'
+        else:
+            record = '{"_1":1,"_2":5,"_3":5,"_4":6.0,"_5":1}\n'
+        return {"Payload": [
+            {"Records": {"Payload": record.encode()}},
+            {"Stats": {"Details": {"BytesScanned": 1, "BytesProcessed": 1, "BytesReturned": 1}}}
+        ]}
+
+
+class TestAggregateQuery(unittest.TestCase):
+
+    def test_partial_query(self):
+        query = AggregateQuery(QUERY)
+        self.assertEqual(query.partial_query, 'SELECT COUNT(*), SUM(s.x), MIN(s.x), SUM(s.y), COUNT(s.y) '
+                                              'FROM s3object s WHERE s.a = \'1,2\'')
+        self.assertListEqual(query.names, ['_1', 'total', '_3', 'mean'])
+
+    def test_not_decomposable(self):
+        self.assertRaises(RuntimeError, AggregateQuery, 'SELECT s.x FROM s3object s')
+        self.assertRaises(RuntimeError, AggregateQuery, 'SELECT SUM(s.x) + SUM(s.y) FROM s3object s')
+        self.assertRaises(RuntimeError, AggregateQuery, 'SELECT COUNT(DISTINCT s.x) FROM s3object s')
+
+    def test_merge_and_finalize(self):
+        query = AggregateQuery(QUERY)
+        partials = [[2, 10, 4, 3.0, 2], [1, 5, 5, 6.0, 1], [0, None, None, None, 0]]
+
+        merged = tree_reduce(partials, query.merge)
+        self.assertListEqual(merged, [3, 15, 4, 9.0, 3])
+        self.assertDictEqual(query.finalize(merged), {"_1": 3, "total": 15, "_3": 4, "mean": 3.0})
+        # No file
+        self.assertDictEqual(query.finalize(tree_reduce([], query.merge)),
+                             {"_1": 0, "total": None, "_3": None, "mean": None})
+
+    def test_parse_partial_merges_parts(self):
+        query = AggregateQuery('SELECT COUNT(*), MAX(s.x) FROM s3object s')
+        self.assertListEqual(parse_partial('{"_1":2,"_2":7}\n{"_1":3,"_2":4}\n', query=query), [5, 7])
+
+    def test_tree_reduce(self):
+        self.assertEqual(tree_reduce(list(range(7)), lambda a, b: a + b), 21)
+        self.assertIsNone(tree_reduce([], lambda a, b: a + b))
+
+
+@mock_s3
+class TestSSPAggregate(TestWrapper):
+
+    def test_aggregate(self):
+        for name in ['file2.json', 'file3.json']:
+            self.s3.put_object(bucket_name='test-bucket', key=f'test-key/{name}', body='{"x": 5, "y": 6}')
+        CountingEngine.client = AggregateClient(self.client)
+        ssp = SSP(bucket_name='test-bucket', prefix='test-key', engine=CountingEngine)
+
+        results = ssp.aggregate(sql_query=QUERY)
+
+        self.assertDictEqual(results.values, {"_1": 4, "total": 20, "_3": 4, "mean": 3.75})
+        self.assertEqual(results.stats.files_processed, 3)
+        self.assertListEqual(CountingEngine.client.expressions, [AggregateQuery(QUERY).partial_query] * 3)
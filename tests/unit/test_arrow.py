@@ -0,0 +1,131 @@
+import unittest
+import warnings
+from moto import mock_s3
+
+from select_plus.ssp import SSP
+from select_plus.src.engine.sequential_engine import SequentialEngine
+from select_plus.src.models.models import EngineResults, EngineResultsStats
+from select_plus.src.utils.arrow import to_arrow_table, to_batch, serialize_table, deserialize_table, concat_tables
+from tests.util.test_wrapper import TestWrapper, MockS3Paginator
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class MockJSONLinesClient:
+
+    @staticmethod
+    def select_object_content(*args, **kwargs):
+        payload = [
+            {"Records": {"Payload": b'{"ticker":"VUSA.L","price":64.98}\n{"ticker":"VUSA.L","price":65}\n'}},
+            {"Stats": {"Details": {"BytesScanned": 1, "BytesProcessed": 2, "BytesReturned": 3}}}
+        ]
+        return {"Payload": payload}
+
+    @staticmethod
+    def get_paginator(*args, **kwargs):
+        return MockS3Paginator()
+
+
+def make_results(payload: list, output_serialization: dict = None) -> EngineResults:
+    return EngineResults(
+        payload=payload,
+        stats=EngineResultsStats(cost=0, files_processed=0, bytes_scanned=0, bytes_returned=0, bytes_processed=0),
+        output_serialization=output_serialization
+    )
+
+
+@unittest.skipUnless(pyarrow, 'pyarrow is not installed')
+@mock_s3
+class TestArrow(TestWrapper):
+
+    def test_to_arrow_table_json(self):
+        table = to_arrow_table('{"a":1,"b":"x"}\n{"a":2,"b":null}\n', {'JSON': {}})
+        self.assertDictEqual(table.to_pydict(), {'a': [1, 2], 'b': ['x', None]})
+
+    def test_to_arrow_table_json_record_delimiter(self):
+        table = to_arrow_table('{"a":1};{"a":2};', {'JSON': {'RecordDelimiter': ';'}})
+        self.assertDictEqual(table.to_pydict(), {'a': [1, 2]})
+
+    def test_to_arrow_table_csv(self):
+        table = to_arrow_table('1,"x,y"\n2,z\n', {'CSV': {}})
+        self.assertDictEqual(table.to_pydict(), {'_1': [1, 2], '_2': ['x,y', 'z']})
+
+    def test_to_arrow_table_empty(self):
+        self.assertEqual(to_arrow_table('', {'JSON': {}}).num_rows, 0)
+
+    def test_ipc_round_trip(self):
+        table = to_arrow_table('{"a":1}\n', {'JSON': {}})
+        self.assertTrue(deserialize_table(serialize_table(table)).equals(table))
+
+    def test_concat_tables_promotes_types(self):
+        tables = [to_arrow_table('{"a":1}\n', {'JSON': {}}), to_arrow_table('{"a":1.5,"b":"x"}\n', {'JSON': {}})]
+        self.assertDictEqual(concat_tables(tables).to_pydict(), {'a': [1.0, 1.5], 'b': [None, 'x']})
+
+    def test_concat_tables_reads_conflicting_types_as_strings(self):
+        tables = [to_arrow_table('1,a\n', {'CSV': {}}), to_arrow_table('x,c\n', {'CSV': {}})]
+        self.assertDictEqual(concat_tables(tables).to_pydict(), {'_1': ['1', 'x'], '_2': ['a', 'c']})
+
+        results = make_results(['{"a":1,"b":1}\n', '{"a":"x","b":2.5}\n'], {'JSON': {}})
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            self.assertDictEqual(results.to_arrow().to_pydict(), {'a': ['1', 'x'], 'b': [1.0, 2.5]})
+
+    def test_results_to_arrow_from_strings(self):
+        results = make_results(['{"a":1}\n', '{"a":2}\n'], {'JSON': {}})
+        self.assertDictEqual(results.to_arrow().to_pydict(), {'a': [1, 2]})
+
+    def test_results_to_pandas(self):
+        results = make_results(['{"a":1}\n', '{"a":2}\n'], {'JSON': {}})
+        self.assertListEqual(results.to_pandas()['a'].tolist(), [1, 2])
+
+    def test_results_to_arrow_raises_on_other_payloads(self):
+        results = make_results([{'a': 1}], {'JSON': {}})
+        self.assertRaises(RuntimeError, results.to_arrow)
+
+    def test_engine_parses_arrow_in_worker(self):
+        sequential_engine = SequentialEngine(bucket_name='test', prefix='test', threads=1, verbose=False)
+        response = sequential_engine.execute(
+            sql_query='',
+            s3_client=MockJSONLinesClient(),
+            input_serialization={},
+            output_serialization={'JSON': {}},
+            arrow=True
+        )
+
+        self.assertIsInstance(response[0]['payload'], bytes)
+        results = make_results([record['payload'] for record in response])
+        self.assertDictEqual(results.to_arrow().to_pydict(), {'ticker': ['VUSA.L', 'VUSA.L'], 'price': [64.98, 65.0]})
+
+    def test_to_batch(self):
+        payload = '{"a":1,"b":"x"}\n{"a":2,"b":null}\n'
+        self.assertDictEqual(to_batch(payload, {'JSON': {}}, 'arrow').to_pydict(), {'a': [1, 2], 'b': ['x', None]})
+        self.assertListEqual(to_batch(payload, {'JSON': {}}, 'pandas')['a'].tolist(), [1, 2])
+        columns = to_batch('1,x\n2,y\n', {'CSV': {}}, 'numpy')
+        self.assertListEqual(list(columns), ['_1', '_2'])
+        self.assertEqual(columns['_1'].sum(), 3)
+        self.assertRaises(RuntimeError, to_batch, payload, {'JSON': {}}, 'polars')
+
+    def test_engine_passes_batches_to_extra_func(self):
+        sequential_engine = SequentialEngine(bucket_name='test', prefix='test', threads=1, verbose=False)
+        for batch_format, extra_func in [('numpy', lambda batch: float(batch['price'].max())),
+                                         ('pandas', lambda batch, column: float(batch[column].max())),
+                                         ('arrow', lambda batch: batch.num_rows)]:
+            response = sequential_engine.execute(
+                sql_query='',
+                s3_client=MockJSONLinesClient(),
+                input_serialization={},
+                output_serialization={'JSON': {}},
+                extra_func=extra_func,
+                extra_func_args={"column": 'price'} if batch_format == 'pandas' else None,
+                batch_format=batch_format
+            )
+            self.assertEqual(response[0]['payload'], 2 if batch_format == 'arrow' else 65.0)
+
+    def test_select_batch_format_requires_extra_func(self):
+        ssp = SSP(bucket_name='test-bucket', prefix='test-key')
+        self.assertRaises(RuntimeError, ssp.select, sql_query='SELECT * FROM s3object s', batch_format='pandas')
+        self.assertRaises(RuntimeError, ssp.select, sql_query='SELECT * FROM s3object s', extra_func=len,
+                          batch_format='polars')
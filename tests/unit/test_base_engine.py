@@ -1,3 +1,4 @@
+import time
 from unittest.mock import patch
 
 from select_plus.src.engine.base_engine import BaseEngine
@@ -18,3 +19,128 @@ class TestBaseEngine(TestWrapper):
         test_engine = TestEngine(bucket_name='test', prefix='test', threads=1, verbose=False)
         self.assertRaises(NotImplementedError, test_engine.execute, sql_query='', input_serialization={},
                           output_serialization={})
+
+    @patch.multiple(BaseEngine, __abstractmethods__=set())
+    def test_session_workers(self):
+
+        class TestEngine(BaseEngine):
+            created = 0
+            closed = 0
+
+            def _create_workers(self):
+                TestEngine.created += 1
+                return 'workers'
+
+            def _close_workers(self, workers):
+                TestEngine.closed += 1
+
+        test_engine = TestEngine(bucket_name='test', prefix='test', threads=1, verbose=False)
+        self.assertIsNone(test_engine._acquire_workers())
+
+        test_engine.start()
+        self.assertEqual(test_engine._acquire_workers(), 'workers')
+        test_engine._return_workers()
+        self.assertEqual(test_engine._acquire_workers(), 'workers')
+        test_engine._return_workers()
+        test_engine.shutdown()
+
+        self.assertIsNone(test_engine._acquire_workers())
+        self.assertEqual(TestEngine.created, 1)
+        self.assertEqual(TestEngine.closed, 1)
+
+    @patch.multiple(BaseEngine, __abstractmethods__=set())
+    def test_session_idle_timeout(self):
+
+        class TestEngine(BaseEngine):
+            def _create_workers(self):
+                return 'workers'
+
+        test_engine = TestEngine(bucket_name='test', prefix='test', threads=1, verbose=False)
+        test_engine.start(idle_timeout=0.05)
+        time.sleep(0.3)
+        self.assertIsNone(test_engine._workers)
+
+        # The next query starts the workers again
+        self.assertEqual(test_engine._acquire_workers(), 'workers')
+        time.sleep(0.3)
+        self.assertEqual(test_engine._workers, 'workers')
+        test_engine._return_workers()
+        test_engine.shutdown()
+
+    @patch.multiple(BaseEngine, __abstractmethods__=set())
+    def test_engine_pickles_without_session(self):
+
+        class TestEngine(BaseEngine):
+            pass
+
+        test_engine = TestEngine(bucket_name='test', prefix='test', threads=1, verbose=False)
+        test_engine.start()
+        state = test_engine.__getstate__()
+        self.assertNotIn('_session_lock', state)
+        self.assertFalse(state['_session_started'])
+        test_engine.shutdown()
+
+    def test_make_tasks_splits_large_objects(self):
+        objects = [{'key': 'small.json', 'size': 10}, {'key': 'large.json', 'size': 25}]
+        tasks = BaseEngine._make_tasks(objects, {'CompressionType': 'NONE', 'JSON': {'Type': 'LINES'}}, 10)
+
+        expected_tasks = [
+            {'key': 'small.json', 'size': 10},
+            {'key': 'large.json', 'size': 10, 'scan_range': {'Start': 0, 'End': 9}},
+            {'key': 'large.json', 'size': 10, 'scan_range': {'Start': 10, 'End': 19}},
+            {'key': 'large.json', 'size': 5, 'scan_range': {'Start': 20, 'End': 24}}
+        ]
+        self.assertListEqual(tasks, expected_tasks)
+
+    def test_make_tasks_without_scan_range_size(self):
+        objects = [{'key': 'large.json', 'size': 25}]
+        tasks = BaseEngine._make_tasks(objects, {'JSON': {'Type': 'LINES'}}, None)
+        self.assertListEqual(tasks, [{'key': 'large.json', 'size': 25}])
+
+    def test_make_tasks_skips_folder_markers(self):
+        objects = [{'key': 'data/', 'size': 0}, {'key': 'data/a.json', 'size': 0}, {'key': 'odd/', 'size': 3}]
+        self.assertListEqual([task['key'] for task in BaseEngine._make_tasks(objects, {})], ['data/a.json', 'odd/'])
+
+    def test_schedule_largest_first(self):
+        mb = 1024 * 1024
+        tasks = [{'key': f'small{i}.json', 'size': mb} for i in range(6)] + [{'key': 'large.json', 'size': 8 * mb}]
+        batches = BaseEngine._schedule(tasks, batches=3)
+
+        self.assertListEqual(batches[0], [6])
+        self.assertListEqual(sorted(i for batch in batches for i in batch), list(range(7)))
+        self.assertListEqual(sorted(len(batch) for batch in batches[1:]), [3, 3])
+
+    def test_schedule_more_batches_than_tasks(self):
+        tasks = [{'key': 'a.json', 'size': 1}, {'key': 'b.json', 'size': 2}]
+        self.assertListEqual(BaseEngine._schedule(tasks, batches=8), [[1], [0]])
+        self.assertListEqual(BaseEngine._schedule([], batches=8), [])
+
+    @patch.multiple(BaseEngine, __abstractmethods__=set())
+    def test_stitch_results(self):
+
+        class TestEngine(BaseEngine):
+            pass
+
+        test_engine = TestEngine(bucket_name='test', prefix='test', threads=1, verbose=False)
+        tasks = [
+            {'key': 'a.json'},
+            {'key': 'b.json', 'scan_range': {'Start': 0, 'End': 9}},
+            {'key': 'b.json', 'scan_range': {'Start': 10, 'End': 19}}
+        ]
+        results = [
+            {'payload': 'a', 'stats': {'bytes_scanned': 1, 'bytes_processed': 1, 'bytes_returned': 1}},
+            {'payload': 'b1\n', 'stats': {'bytes_scanned': 2, 'bytes_processed': 2, 'bytes_returned': 2}},
+            {'payload': 'b2\n', 'stats': {'bytes_scanned': 3, 'bytes_processed': 3, 'bytes_returned': 3}}
+        ]
+        query_context = test_engine._make_query_context(sql_query='', extra_func=str.upper, extra_func_args=None,
+                                                        s3_client=None, input_serialization={},
+                                                        output_serialization={})
+
+        stitched = test_engine._stitch_results(tasks, results, query_context)
+
+        expected_results = [
+            {'payload': 'a', 'stats': {'bytes_scanned': 1, 'bytes_processed': 1, 'bytes_returned': 1}},
+            {'payload': 'B1\nB2\n', 'stats': {'bytes_scanned': 5, 'bytes_processed': 5, 'bytes_returned': 5,
+                                              'requests': 2}}
+        ]
+        self.assertListEqual(stitched, expected_results)
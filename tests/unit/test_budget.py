@@ -0,0 +1,162 @@
+import os
+import tempfile
+import unittest
+from moto import mock_s3
+
+from select_plus.ssp import SSP
+from select_plus.src.utils.budget import Budget
+from select_plus.src.utils.cost import Cost
+from select_plus.src.engine.threaded_engine import ThreadedEngine
+from select_plus.src.engine.parallel_engine import ParallelEngine
+from select_plus.src.cache.checkpoint import Checkpoint
+from select_plus.src.engine.engine import EngineWrapper
+from tests.util.test_wrapper import TestWrapper, CountingClient, CountingEngine, MockPagedS3Client
+
+RESPONSE = {"payload": '', "stats": {"bytes_scanned": 10, "bytes_returned": 5, "bytes_processed": 10}}
+
+
+class TestBudget(unittest.TestCase):
+
+    def test_max_bytes_scanned(self):
+        budget = Budget(max_bytes_scanned=15)
+        self.assertTrue(budget.allow({"key": 'a'}))
+        budget.add(RESPONSE)
+        self.assertTrue(budget.allow({"key": 'b'}))
+        budget.add(RESPONSE)
+
+        self.assertTrue(budget.exceeded)
+        self.assertFalse(budget.allow({"key": 'c'}))
+        self.assertTrue(budget.truncated)
+        # The parts of an object already started are still sent
+        self.assertTrue(budget.allow({"key": 'b', "scan_range": {"Start": 10, "End": 19}}))
+
+    def test_max_cost(self):
+        budget = Budget(max_cost=Cost().compute_block(data_scanned=20, data_returned=10, files_requested=2))
+        budget.add(RESPONSE)
+        self.assertFalse(budget.exceeded)
+        budget.add(RESPONSE)
+        self.assertTrue(budget.exceeded)
+        self.assertEqual(budget.spent, budget.max_cost)
+
+    def test_max_records(self):
+        budget = Budget(max_records=3)
+        budget.add({**RESPONSE, "stats": {**RESPONSE['stats'], "records": 2}})
+        self.assertTrue(budget.allow({"key": 'a'}))
+        budget.add({**RESPONSE, "cache_hit": True, "stats": {**RESPONSE['stats'], "records": 1}})
+
+        self.assertFalse(budget.allow({"key": 'b'}))
+        self.assertTrue(budget.stopped)
+        # The limit is reached with all the records asked for
+        self.assertFalse(budget.truncated)
+
+    def test_limit_payload(self):
+        payload = ['{"a":1}\n{"a":2}\n', '', '{"a":3}\n{"a":4}\n', '{"a":5}\n']
+        self.assertListEqual(EngineWrapper._limit_payload(payload, 3, {'JSON': {}}),
+                             ['{"a":1}\n{"a":2}\n', '', '{"a":3}\n', ''])
+        # Processed by an extra function
+        self.assertListEqual(EngineWrapper._limit_payload([1, 2], 1, {'JSON': {}}), [1, 2])
+
+    def test_cache_hits_are_not_counted(self):
+        budget = Budget(max_bytes_scanned=10)
+        budget.add({**RESPONSE, "cache_hit": True})
+        self.assertFalse(budget.exceeded)
+        self.assertEqual(budget.requests, 0)
+
+
+@mock_s3
+class TestBudgetSelect(TestWrapper):
+
+    def setUp(self) -> None:
+        super().setUp()
+        for name in ['file2.json', 'file3.json']:
+            self.s3.put_object(bucket_name='test-bucket', key=f'test-key/{name}', body='{"test": 1}')
+
+    def test_select_stops_at_max_bytes_scanned(self):
+        CountingEngine.client = CountingClient(self.client)
+        ssp = SSP(bucket_name='test-bucket', prefix='test-key', engine=CountingEngine)
+
+        results = ssp.select(sql_query='SELECT * FROM s3object s', max_bytes_scanned=2)
+        self.assertListEqual(results.payload, ['test-key/file.json\n', 'test-key/file2.json\n'])
+        self.assertTrue(results.stats.truncated)
+        self.assertEqual(results.stats.files_processed, 2)
+        self.assertListEqual(CountingEngine.client.keys, ['test-key/file.json', 'test-key/file2.json'])
+
+        results = ssp.select(sql_query='SELECT * FROM s3object s', max_cost=1.0)
+        self.assertEqual(results.stats.files_processed, 3)
+        self.assertFalse(results.stats.truncated)
+
+    def test_select_stops_at_limit(self):
+        CountingEngine.client = CountingClient(self.client)
+        ssp = SSP(bucket_name='test-bucket', prefix='test-key', engine=CountingEngine)
+
+        for results in [ssp.select(sql_query='SELECT * FROM s3object s LIMIT 2'),
+                        ssp.select(sql_query='SELECT * FROM s3object s', limit=2),
+                        ssp.select(sql_query='SELECT * FROM s3object s LIMIT 10', limit=2)]:
+            self.assertListEqual(results.payload, ['test-key/file.json\n', 'test-key/file2.json\n'])
+            self.assertFalse(results.stats.truncated)
+
+        self.assertListEqual(CountingEngine.client.keys, ['test-key/file.json', 'test-key/file2.json'] * 3)
+
+    def test_objects_split_by_scan_range_are_completed(self):
+        CountingEngine.client = CountingClient(self.client)
+        ssp = SSP(bucket_name='test-bucket', prefix='test-key', engine=CountingEngine)
+
+        results = ssp.select(sql_query='SELECT * FROM s3object s', input_serialization={'JSON': {'Type': 'LINES'}},
+                             scan_range_size=6, max_bytes_scanned=1)
+        self.assertListEqual(results.payload, ['test-key/file.json\ntest-key/file.json\n'])
+        self.assertTrue(results.stats.truncated)
+
+    def test_checkpoint_only_saves_queried_files(self):
+        CountingEngine.client = CountingClient(self.client)
+        ssp = SSP(bucket_name='test-bucket', prefix='test-key', engine=CountingEngine)
+
+        with tempfile.TemporaryDirectory() as path:
+            checkpoint = Checkpoint(path=os.path.join(path, 'checkpoint.json'))
+            ssp.select(sql_query='SELECT * FROM s3object s', checkpoint=checkpoint, max_bytes_scanned=1)
+            self.assertListEqual(list(checkpoint.objects), ['test-key/file.json'])
+
+            results = ssp.select(sql_query='SELECT * FROM s3object s', checkpoint=checkpoint, max_bytes_scanned=1)
+            self.assertListEqual(results.payload, ['test-key/file2.json\n'])
+            self.assertEqual(results.stats.files_skipped, 1)
+            self.assertListEqual(sorted(checkpoint.objects), ['test-key/file.json', 'test-key/file2.json'])
+
+    def test_checkpoint_does_not_save_files_once_the_limit_is_reached(self):
+        CountingEngine.client = CountingClient(self.client)
+        ssp = SSP(bucket_name='test-bucket', prefix='test-key', engine=CountingEngine)
+
+        with tempfile.TemporaryDirectory() as path:
+            checkpoint = Checkpoint(path=os.path.join(path, 'checkpoint.json'))
+            results = ssp.select(sql_query='SELECT * FROM s3object s', checkpoint=checkpoint, limit=1)
+            self.assertListEqual(results.payload, ['test-key/file.json\n'])
+            self.assertDictEqual(checkpoint.objects, {})
+
+            # Below the limit, all the records of the files are returned
+            results = ssp.select(sql_query='SELECT * FROM s3object s', checkpoint=checkpoint, limit=10)
+            self.assertEqual(len(results.payload), 3)
+            self.assertEqual(len(checkpoint.objects), 3)
+
+    def test_threaded_engine_stops_at_budget(self):
+        client = CountingClient(self.client)
+        threaded_engine = ThreadedEngine(bucket_name='test-bucket', prefix='test-key', threads=1, verbose=False)
+
+        budget = Budget(max_bytes_scanned=1)
+        response = threaded_engine.execute(sql_query='SELECT * FROM s3object s', input_serialization={},
+                                           output_serialization={}, s3_client=client, schedule='listing',
+                                           budget=budget)
+        self.assertListEqual([result['payload'] for result in response], ['test-key/file.json\n'])
+        self.assertTrue(budget.truncated)
+        self.assertListEqual(client.keys, ['test-key/file.json'])
+
+
+class TestParallelEngineBudget(unittest.TestCase):
+
+    def test_parallel_engine_stops_at_budget(self):
+        parallel_engine = ParallelEngine(bucket_name='test-bucket', prefix='test', threads=1, verbose=False)
+
+        budget = Budget(max_bytes_scanned=1)
+        response = parallel_engine.execute(sql_query='SELECT * FROM s3object s', input_serialization={},
+                                           output_serialization={}, s3_client=MockPagedS3Client(pages=5),
+                                           budget=budget)
+        self.assertEqual(len(response), 1)
+        self.assertTrue(budget.truncated)
+        self.assertListEqual(list(budget.keys), ['test0.json'])
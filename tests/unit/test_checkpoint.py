@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from moto import mock_s3
+
+from select_plus.ssp import SSP
+from select_plus.src.cache.checkpoint import Checkpoint
+from tests.util.test_wrapper import TestWrapper, CountingClient, CountingEngine
+
+OBJECT = {"key": 'prefix/file.json', "size": 10, "etag": 'abc',
+          "last_modified": datetime(2023, 1, 1, tzinfo=timezone.utc)}
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def test_commit(self):
+        with tempfile.TemporaryDirectory() as path:
+            file_path = os.path.join(path, 'checkpoint.json')
+            checkpoint = Checkpoint(path=file_path)
+            self.assertFalse(checkpoint.is_processed(OBJECT))
+
+            checkpoint.commit([OBJECT])
+            checkpoint = Checkpoint(path=file_path)
+            self.assertTrue(checkpoint.is_processed(OBJECT))
+            self.assertFalse(checkpoint.is_processed({**OBJECT, "etag": 'def'}))
+            self.assertFalse(checkpoint.is_processed({**OBJECT, "key": 'prefix/new.json'}))
+
+            checkpoint.reset()
+            self.assertFalse(Checkpoint(path=file_path).is_processed(OBJECT))
+
+    def test_commit_removes_deleted_objects(self):
+        with tempfile.TemporaryDirectory() as path:
+            checkpoint = Checkpoint(path=os.path.join(path, 'checkpoint.json'))
+            checkpoint.commit([OBJECT, {**OBJECT, "key": 'prefix/deleted.json'}])
+            checkpoint.commit([OBJECT])
+
+            self.assertListEqual(list(checkpoint.objects), ['prefix/file.json'])
+
+
+@mock_s3
+class TestIncrementalSelect(TestWrapper):
+
+    def test_select_with_checkpoint(self):
+        CountingEngine.client = CountingClient(self.client)
+        ssp = SSP(bucket_name='test-bucket', prefix='test-key', engine=CountingEngine)
+
+        with tempfile.TemporaryDirectory() as path:
+            checkpoint = Checkpoint(path=os.path.join(path, 'checkpoint.json'))
+
+            results = ssp.select(sql_query='SELECT * FROM s3object s', checkpoint=checkpoint)
+            self.assertListEqual(results.payload, ['test-key/file.json\n'])
+
+            # Nothing new
+            results = ssp.select(sql_query='SELECT * FROM s3object s', checkpoint=checkpoint)
+            self.assertListEqual(results.payload, [])
+            self.assertEqual(results.stats.files_skipped, 1)
+
+            # One new and one changed object
+            self.s3.put_object(bucket_name='test-bucket', key='test-key/new.json', body='{"test": 1}')
+            self.s3.put_object(bucket_name='test-bucket', key='test-key/file.json', body='{"test": 2}')
+            results = ssp.select(sql_query='SELECT * FROM s3object s', checkpoint=Checkpoint(path=checkpoint.path))
+            self.assertListEqual(results.payload, ['test-key/file.json\n', 'test-key/new.json\n'])
+            self.assertEqual(results.stats.files_skipped, 0)
+
+        self.assertListEqual(CountingEngine.client.keys,
+                             ['test-key/file.json', 'test-key/file.json', 'test-key/new.json'])
+
+    def test_failed_select_does_not_move_checkpoint(self):
+        class FailingClient(CountingClient):
+            def select_object_content(self, Key: str, **kwargs):
+                raise RuntimeError('Select failed')
+
+        CountingEngine.client = FailingClient(self.client)
+        ssp = SSP(bucket_name='test-bucket', prefix='test-key', engine=CountingEngine)
+
+        with tempfile.TemporaryDirectory() as path:
+            checkpoint = Checkpoint(path=os.path.join(path, 'checkpoint.json'))
+            self.assertRaises(RuntimeError, ssp.select, sql_query='SELECT * FROM s3object s', checkpoint=checkpoint)
+            self.assertDictEqual(checkpoint.objects, {})
+            self.assertFalse(os.path.exists(checkpoint.path))
@@ -0,0 +1,189 @@
+import pickle
+import threading
+import time
+import unittest
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from moto import mock_s3
+
+from select_plus.src.engine.engine import EngineWrapper
+from select_plus.src.engine.threaded_engine import ThreadedEngine
+from select_plus.src.engine.parallel_engine import ParallelEngine
+from select_plus.src.utils.concurrency import ConcurrencyLimiter
+from tests.util.test_wrapper import TestWrapper, CountingClient, MockPagedS3Client
+
+
+def throttling_error(code: str = 'SlowDown', status: int = 503) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": 'Please reduce your request rate.'},
+                        "ResponseMetadata": {"HTTPStatusCode": status}}, 'SelectObjectContent')
+
+
+class ThrottlingClient(CountingClient):
+    """
+    Throttles (SlowDown) the selects above "capacity" requests in flight, like S3 under too many requests.
+    """
+
+    def __init__(self, client, capacity: int):
+        super().__init__(client)
+        self.capacity = capacity
+        self.in_flight = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def select_object_content(self, Key: str, **kwargs):
+        with self.lock:
+            self.in_flight += 1
+            throttled = self.in_flight > self.capacity
+            self.throttled += throttled
+        try:
+            if throttled:
+                raise throttling_error()
+            time.sleep(0.02)
+            return super().select_object_content(Key=Key, **kwargs)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+class FirstAttemptThrottlingClient(MockPagedS3Client):
+    """
+    Throttles the first select of each key, in each process.
+    """
+
+    def __init__(self, pages: int):
+        super().__init__(pages)
+        self.throttled_keys = set()
+
+    def select_object_content(self, *args, **kwargs):
+        if kwargs['Key'] not in self.throttled_keys:
+            self.throttled_keys.add(kwargs['Key'])
+            raise throttling_error()
+        return super().select_object_content(*args, **kwargs)
+
+
+class TestConcurrencyLimiter(unittest.TestCase):
+
+    def test_increases_when_the_limit_holds_requests_back(self):
+        limiter = ConcurrencyLimiter(initial_limit=1)
+        for _ in range(5):
+            self.assertEqual(limiter.call(lambda: 'ok'), ('ok', 0))
+
+        # Once the limit is above the requests in flight, it is not raised any more
+        self.assertEqual(limiter.limit, 2)
+        self.assertEqual(limiter.increases, 1)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_decreases_once_per_burst_of_throttles(self):
+        limiter = ConcurrencyLimiter(initial_limit=8)
+        burst = [limiter._acquire() for _ in range(4)]
+        for started in burst:
+            limiter._release(started, throttled=True)
+        self.assertEqual(limiter.limit, 4)
+
+        limiter._release(limiter._acquire(), throttled=True)
+        self.assertEqual(limiter.limit, 2)
+        self.assertEqual(limiter.decreases, 2)
+        self.assertEqual(limiter.throttles, 5)
+
+    def test_call_retries_throttled_requests(self):
+        limiter = ConcurrencyLimiter(backoff_base=0, max_retries=2)
+        errors = [throttling_error(), throttling_error('InternalError', 500)]
+
+        def select():
+            if errors:
+                raise errors.pop(0)
+            return 'ok'
+
+        self.assertEqual(limiter.call(select), ('ok', 1))
+        self.assertEqual(limiter.retries, 2)
+
+        errors.extend([throttling_error()] * 3)
+        self.assertRaises(ClientError, limiter.call, select)
+
+        errors.append(throttling_error('AccessDenied', 403))
+        self.assertRaises(ClientError, limiter.call, select)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_client_retries(self):
+        self.assertTrue(ConcurrencyLimiter.client_retries(boto3.client('s3', region_name='us-east-1')))
+        self.assertTrue(ConcurrencyLimiter.client_retries(
+            boto3.client('s3', region_name='us-east-1', config=Config(retries={"mode": 'standard'}))))
+        self.assertFalse(ConcurrencyLimiter.client_retries(
+            boto3.client('s3', region_name='us-east-1', config=Config(retries={"max_attempts": 0}))))
+        self.assertFalse(ConcurrencyLimiter.client_retries(MockPagedS3Client(pages=1)))
+
+    def test_pickle(self):
+        limiter = pickle.loads(pickle.dumps(ConcurrencyLimiter(initial_limit=4)))
+        self.assertEqual(limiter.call(lambda: 1), (1, 0))
+        self.assertEqual(limiter.limit, 4)
+
+
+@mock_s3
+class TestThrottledSelect(TestWrapper):
+
+    def test_threaded_engine_backs_off_when_throttled(self):
+        for i in range(11):
+            self.s3.put_object(bucket_name='test-bucket', key=f'test-key/file-{i}.json', body='{"test": 1}')
+        client = ThrottlingClient(self.client, capacity=2)
+        threaded_engine = ThreadedEngine(bucket_name='test-bucket', prefix='test-key', threads=8, verbose=False)
+        limiter = ConcurrencyLimiter(initial_limit=8, backoff_base=0)
+
+        results = EngineWrapper().execute(sql_query='SELECT * FROM s3object s', extra_func=None,
+                                          extra_func_args=None, engine=threaded_engine, input_serialization={},
+                                          output_serialization={}, s3_client=client, limiter=limiter)
+
+        self.assertEqual(results.stats.files_processed, 12)
+        self.assertEqual(len(set(results.payload)), 12)
+        self.assertGreater(client.throttled, 0)
+        self.assertEqual(results.stats.throttles, client.throttled)
+        self.assertGreater(results.stats.concurrency_decreases, 0)
+        self.assertEqual(results.stats.concurrency_limit, limiter.limit)
+        self.assertLessEqual(results.stats.max_in_flight, 8)
+
+
+class TestParallelEngineLimiter(unittest.TestCase):
+
+    def test_client_with_retries_is_refused(self):
+        parallel_engine = ParallelEngine(bucket_name='test-bucket', prefix='test', threads=2, verbose=False)
+        self.assertRaises(RuntimeError, parallel_engine.execute, sql_query='SELECT * FROM s3object s',
+                          input_serialization={}, output_serialization={},
+                          s3_client=boto3.client('s3', region_name='us-east-1'), limiter=ConcurrencyLimiter())
+
+    def test_decisions_of_the_copies_are_reported(self):
+        parallel_engine = ParallelEngine(bucket_name='test-bucket', prefix='test', threads=2, verbose=False)
+        limiter = ConcurrencyLimiter(backoff_base=0)
+
+        results = EngineWrapper().execute(sql_query='SELECT * FROM s3object s', extra_func=None,
+                                          extra_func_args=None, engine=parallel_engine, input_serialization={},
+                                          output_serialization={}, s3_client=FirstAttemptThrottlingClient(pages=4),
+                                          limiter=limiter)
+
+        self.assertEqual(results.stats.files_processed, 4)
+        self.assertEqual(results.stats.throttles, 4)
+        # Each first attempt is throttled and retried, and each throttle lowers the limit of its process
+        self.assertEqual(limiter.requests, 8)
+        self.assertEqual(limiter.retries, 4)
+        self.assertEqual(results.stats.concurrency_increases, 0)
+        self.assertEqual(results.stats.concurrency_decreases, 4)
+        # A process sends one request at a time
+        self.assertIn(results.stats.max_in_flight, [1, 2])
+        # 8 halved once per throttle in each process, added up: the files may be split 4-0, 3-1 or 2-2
+        self.assertIn(results.stats.concurrency_limit, [1, 4, 5])
+
+    def test_merge_adds_up_the_copies(self):
+        limiter = ConcurrencyLimiter(initial_limit=8)
+        copy = pickle.loads(pickle.dumps(limiter))
+        self.assertEqual(copy.limit, 8)
+
+        counters = {'requests': 2, 'increases': 1, 'decreases': 1, 'throttles': 1, 'retries': 1, 'limit': 4,
+                    'max_in_flight': 1}
+        limiter.merge([(1, counters), (2, counters), (1, {**counters, 'limit': 2}),
+                       (3, {**counters, 'requests': 0, 'limit': 100})])
+
+        self.assertEqual(limiter.requests, 6)
+        self.assertEqual(limiter.increases, 3)
+        self.assertEqual(limiter.decreases, 3)
+        # The last limit of processes 1 and 2, process 3 made no request
+        self.assertEqual(limiter.limit, 6)
+        self.assertEqual(limiter.max_in_flight, 2)
@@ -12,7 +12,7 @@ class TestCost(unittest.TestCase):
             data_returned=10000,
             files_requested=10
         )
-        self.assertEqual(result, 2.07007e-07)
+        self.assertAlmostEqual(result, 4.207e-06, places=15)
 
     def test_compute_stack(self):
         cost = Cost()
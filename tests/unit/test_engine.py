@@ -32,7 +32,7 @@ class TestEngineWrapper(TestWrapper):
                                           engine=self.mock_engine,
                                           input_serialization={},
                                           output_serialization={})
-        self.assertEqual(response.stats.cost, 6.77e-11)
+        self.assertAlmostEqual(response.stats.cost, 4.00067e-07, places=15)
 
     def test_response_files_processed_is_correct(self):
         engine_wrapper = EngineWrapper()
@@ -0,0 +1,129 @@
+import unittest
+from moto import mock_s3
+
+from select_plus.ssp import SSP
+from select_plus.src.aws.s3 import S3
+from select_plus.src.utils.cost import Cost
+from select_plus.src.utils.estimator import CostEstimator
+from tests.util.test_wrapper import TestWrapper, CountingClient
+
+
+class RatioClient:
+    """
+    Scans half of each byte range and returns a tenth of it, except for the keys containing "large", which
+    return half of it.
+    """
+
+    def __init__(self):
+        self.scan_ranges = []
+
+    def select_object_content(self, Key: str, ScanRange: dict = None, **kwargs):
+        self.scan_ranges.append(ScanRange)
+        size = ScanRange['End'] - ScanRange['Start'] + 1 if ScanRange else int(Key.split('-')[-1])
+        returned = size // 2 if 'large' in Key else size // 10
+        return {"Payload": [
+            {"Records": {"Payload": b''}},
+            {"Stats": {"Details": {"BytesScanned": size // 2, "BytesProcessed": size, "BytesReturned": returned}}}
+        ]}
+
+
+def make_objects(sizes: list, name: str = 'file') -> list:
+    return [{"key": f'{name}{i}-{size}', "size": size} for i, size in enumerate(sizes)]
+
+
+class TestCostEstimator(unittest.TestCase):
+
+    def test_estimate_without_query(self):
+        estimator = CostEstimator(s3=S3(client=RatioClient()), bucket_name='bucket')
+        objects = make_objects([1000, 3000])
+
+        estimate = estimator.estimate(objects=objects)
+        self.assertEqual(estimate.cost, Cost().compute_block(data_scanned=4000, data_returned=4000, files_requested=2))
+        self.assertEqual(estimate.cost_lower, Cost().compute_block(data_scanned=4000, data_returned=0,
+                                                                   files_requested=2))
+        self.assertEqual(estimate.sampled_files, 0)
+
+        # A Parquet query may only scan a few columns
+        estimate = estimator.estimate(objects=objects, input_serialization={'Parquet': {}})
+        self.assertEqual(estimate.cost_lower, Cost().compute_block(data_scanned=0, data_returned=0,
+                                                                   files_requested=2))
+
+    def test_estimate_extrapolates_sample(self):
+        estimator = CostEstimator(s3=S3(client=RatioClient()), bucket_name='bucket')
+        objects = make_objects([1000] * 20)
+
+        estimate = estimator.estimate(objects=objects, sql_query='SELECT s.a FROM s3object s',
+                                      input_serialization={'Parquet': {}}, output_serialization={}, sample_size=4,
+                                      seed=1)
+
+        self.assertEqual(estimate.sampled_files, 4)
+        self.assertEqual(estimate.bytes_scanned, 10000)
+        self.assertEqual(estimate.bytes_returned, 2000)
+        self.assertAlmostEqual(estimate.cost, Cost().compute_block(data_scanned=10000, data_returned=2000,
+                                                                   files_requested=20), places=15)
+        # All the sampled files have the same ratios
+        self.assertAlmostEqual(estimate.cost_lower, estimate.cost, places=15)
+        self.assertAlmostEqual(estimate.cost_upper, estimate.cost, places=15)
+        self.assertAlmostEqual(estimate.sample_cost, Cost().compute_block(data_scanned=2000, data_returned=400,
+                                                                          files_requested=4), places=15)
+
+    def test_estimate_bounds(self):
+        estimator = CostEstimator(s3=S3(client=RatioClient()), bucket_name='bucket')
+        objects = make_objects([1000] * 10) + make_objects([1000] * 10, name='large')
+
+        estimate = estimator.estimate(objects=objects, sql_query='SELECT * FROM s3object s',
+                                      input_serialization={'Parquet': {}}, output_serialization={}, sample_size=6,
+                                      seed=3)
+        self.assertLess(estimate.cost_lower, estimate.cost)
+        self.assertGreater(estimate.cost_upper, estimate.cost)
+
+        # Sampling all the files measures them exactly
+        estimate = estimator.estimate(objects=objects, sql_query='SELECT * FROM s3object s',
+                                      input_serialization={'Parquet': {}}, output_serialization={}, sample_size=20)
+        self.assertEqual(estimate.bytes_returned, 6000)
+        self.assertAlmostEqual(estimate.cost_lower, estimate.cost, places=15)
+        self.assertAlmostEqual(estimate.cost_upper, estimate.cost, places=15)
+
+    def test_ratios_are_weighted_by_size(self):
+        estimator = CostEstimator(s3=S3(client=RatioClient()), bucket_name='bucket')
+        objects = make_objects([100], name='large') + make_objects([10000])
+
+        estimate = estimator.estimate(objects=objects, sql_query='SELECT * FROM s3object s',
+                                      input_serialization={'Parquet': {}}, output_serialization={}, sample_size=2)
+
+        # 50 bytes returned by the small file and 1000 by the large one, not a mean of their ratios (0.5 and 0.1)
+        self.assertAlmostEqual(estimate.bytes_returned, 1050)
+        self.assertAlmostEqual(estimate.bytes_scanned, 5050)
+
+    def test_large_files_are_sampled_with_scan_range(self):
+        client = RatioClient()
+        estimator = CostEstimator(s3=S3(client=client), bucket_name='bucket')
+        objects = make_objects([100, 10000])
+
+        estimate = estimator.estimate(objects=objects, sql_query='SELECT * FROM s3object s',
+                                      input_serialization={'JSON': {'Type': 'LINES'}}, output_serialization={},
+                                      sample_size=2, sample_bytes=1000)
+
+        self.assertIn({"Start": 0, "End": 999}, client.scan_ranges)
+        self.assertIn(None, client.scan_ranges)
+        self.assertEqual(estimate.bytes_scanned, 5050)
+
+    def test_invalid_confidence_raises(self):
+        estimator = CostEstimator(s3=S3(client=RatioClient()), bucket_name='bucket')
+        self.assertRaises(RuntimeError, estimator.estimate, objects=make_objects([1000]), sql_query='SELECT 1',
+                          confidence=1.5)
+
+
+@mock_s3
+class TestSSPEstimate(TestWrapper):
+
+    def test_estimate_with_query(self):
+        ssp = SSP(bucket_name='test-bucket', prefix='test-key')
+
+        estimate = ssp.estimate(sql_query='SELECT * FROM s3object s', s3_client=CountingClient(self.client))
+
+        self.assertEqual(estimate.files, 1)
+        self.assertEqual(estimate.sampled_files, 1)
+        self.assertEqual(estimate.bytes_scanned, 1)
+        self.assertAlmostEqual(estimate.cost, Cost().compute_block(data_scanned=1, data_returned=1,
+                                                                   files_requested=1), places=15)
@@ -0,0 +1,143 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from moto import mock_s3
+
+from select_plus.src.utils.filters import ObjectFilter, AllFilters
+from select_plus.src.engine.sequential_engine import SequentialEngine
+from select_plus.src.aws.s3 import S3
+from select_plus.ssp import SSP
+from select_plus.src.cache.checkpoint import Checkpoint
+from tests.util.test_wrapper import TestWrapper, CountingClient, CountingEngine
+
+
+def make_object(key: str, size: int = 10, last_modified: datetime = datetime(2023, 1, 15, tzinfo=timezone.utc)):
+    return {"key": key, "size": size, "etag": 'abc', "last_modified": last_modified}
+
+
+class TestObjectFilter(unittest.TestCase):
+
+    def test_glob(self):
+        object_filter = ObjectFilter(glob=['*.json', '*.csv'])
+        self.assertTrue(object_filter(make_object('data/day=1/file.json')))
+        self.assertTrue(object_filter(make_object('data/file.csv')))
+        self.assertFalse(object_filter(make_object('data/_SUCCESS')))
+
+    def test_regex(self):
+        object_filter = ObjectFilter(regex=r'file\d+\.json$')
+        self.assertTrue(object_filter(make_object('data/file12.json')))
+        self.assertFalse(object_filter(make_object('data/file.json')))
+
+    def test_size(self):
+        object_filter = ObjectFilter(min_size=1, max_size=100)
+        self.assertTrue(object_filter(make_object('file.json', size=100)))
+        self.assertFalse(object_filter(make_object('_SUCCESS', size=0)))
+        self.assertFalse(object_filter(make_object('file.json', size=101)))
+
+    def test_modified(self):
+        object_filter = ObjectFilter(modified_after=datetime(2023, 1, 10), modified_before=datetime(2023, 1, 20))
+        self.assertTrue(object_filter(make_object('file.json')))
+        self.assertFalse(object_filter(make_object('file.json', last_modified=datetime(2023, 1, 5,
+                                                                                       tzinfo=timezone.utc))))
+        self.assertFalse(object_filter(make_object('file.json', last_modified=None)))
+
+    def test_partitions(self):
+        object_filter = ObjectFilter(partitions={'year': 2023, 'month': ['01', '02'], 'day': lambda day: day < '15'})
+        self.assertTrue(object_filter(make_object('data/year=2023/month=01/day=02/file.json')))
+        self.assertFalse(object_filter(make_object('data/year=2023/month=03/day=02/file.json')))
+        self.assertFalse(object_filter(make_object('data/year=2023/month=01/day=20/file.json')))
+        self.assertFalse(object_filter(make_object('data/year=2023/month=01/file.json')))
+        # The file name is not a partition
+        self.assertFalse(object_filter(make_object('data/year=2023/month=01/day=02')))
+
+    def test_match_prefix(self):
+        object_filter = ObjectFilter(partitions={'year': '2023', 'month': '01'})
+        self.assertTrue(object_filter.match_prefix('data/'))
+        self.assertTrue(object_filter.match_prefix('data/year=2023/'))
+        self.assertTrue(object_filter.match_prefix('data/year=2023/month=01/'))
+        self.assertFalse(object_filter.match_prefix('data/year=2022/'))
+        self.assertFalse(object_filter.match_prefix('data/year=2023/month=02/'))
+
+    def test_all_filters(self):
+        object_filter = ObjectFilter(partitions={'year': '2023'}) & (lambda s3_object: s3_object['size'] > 5)
+        self.assertIsInstance(object_filter, AllFilters)
+        self.assertTrue(object_filter(make_object('data/year=2023/file.json')))
+        self.assertFalse(object_filter(make_object('data/year=2023/file.json', size=1)))
+        self.assertFalse(object_filter.match_prefix('data/year=2022/'))
+
+
+@mock_s3
+class TestObjectFilterWithS3(TestWrapper):
+
+    def setUp(self) -> None:
+        super().setUp()
+        for year in ['2022', '2023']:
+            for month in ['01', '02']:
+                self.s3.put_object(bucket_name='test-bucket', key=f'data/year={year}/month={month}/file.json',
+                                   body='{"test": 1}')
+                self.s3.put_object(bucket_name='test-bucket', key=f'data/year={year}/month={month}/_SUCCESS',
+                                   body='')
+
+    def test_engine_only_makes_tasks_for_matching_objects(self):
+        object_filter = ObjectFilter(partitions={'year': '2023'}, min_size=1)
+        for list_concurrency in [None, 4]:
+            sequential_engine = SequentialEngine(
+                bucket_name='test-bucket',
+                prefix='data/',
+                threads=1,
+                verbose=False,
+                list_concurrency=list_concurrency
+            )
+            tasks = sequential_engine._list_tasks(S3(client=self.client), input_serialization={},
+                                                  object_filter=object_filter)
+            self.assertListEqual([task['key'] for task in tasks],
+                                 ['data/year=2023/month=01/file.json', 'data/year=2023/month=02/file.json'])
+
+    def test_pruned_prefixes_are_not_listed(self):
+        listed_prefixes = []
+
+        class RecordingClient:
+            def __init__(self, client):
+                self.client = client
+
+            def get_paginator(self, *args, **kwargs):
+                paginator = self.client.get_paginator(*args, **kwargs)
+
+                class RecordingPaginator:
+                    @staticmethod
+                    def paginate(**kwargs):
+                        listed_prefixes.append(kwargs['Prefix'])
+                        return paginator.paginate(**kwargs)
+
+                return RecordingPaginator()
+
+        object_filter = ObjectFilter(partitions={'year': '2023'})
+        response = S3(client=RecordingClient(self.client)).list_objects(
+            bucket_name='test-bucket', prefix='data', list_concurrency=4, prefix_filter=object_filter.match_prefix
+        )
+
+        self.assertEqual(response['total_files'], 4)
+        self.assertNotIn('data/year=2022/', listed_prefixes)
+        self.assertIn('data/year=2023/', listed_prefixes)
+
+    def test_no_matching_prefix_does_not_raise(self):
+        object_filter = ObjectFilter(partitions={'year': '2030'})
+        response = S3(client=self.client).list_objects(bucket_name='test-bucket', prefix='data/', list_concurrency=4,
+                                                       prefix_filter=object_filter.match_prefix)
+        self.assertEqual(response['total_files'], 0)
+
+    def test_select_with_object_filter_and_checkpoint(self):
+        CountingEngine.client = CountingClient(self.client)
+        ssp = SSP(bucket_name='test-bucket', prefix='data/', engine=CountingEngine,
+                  object_filter=ObjectFilter(partitions={'year': '2023'}, glob='*.json'))
+
+        with tempfile.TemporaryDirectory() as path:
+            checkpoint = Checkpoint(path=os.path.join(path, 'checkpoint.json'))
+            results = ssp.select(sql_query='SELECT * FROM s3object s', checkpoint=checkpoint)
+
+        self.assertListEqual(results.payload, ['data/year=2023/month=01/file.json\n',
+                                               'data/year=2023/month=02/file.json\n'])
+        # Only the files matching the filter are saved as processed
+        self.assertListEqual(list(checkpoint.objects), ['data/year=2023/month=01/file.json',
+                                                        'data/year=2023/month=02/file.json'])
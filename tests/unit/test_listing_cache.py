@@ -0,0 +1,96 @@
+import time
+import pickle
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from moto import mock_s3
+
+from select_plus.src.cache.listing_cache import ListingCache
+from select_plus.src.engine.sequential_engine import SequentialEngine
+from select_plus.src.aws.s3 import S3
+from tests.util.test_wrapper import TestWrapper
+
+OBJECTS = [
+    {"key": 'prefix/file0.json', "size": 10, "etag": 'abc', "last_modified": datetime(2023, 1, 1, tzinfo=timezone.utc)},
+    {"key": 'prefix/file1.json', "size": 20, "etag": 'def', "last_modified": datetime(2023, 1, 2, tzinfo=timezone.utc)}
+]
+
+
+class TestListingCache(unittest.TestCase):
+
+    def test_get_and_put(self):
+        listing_cache = ListingCache()
+        self.assertIsNone(listing_cache.get(bucket_name='bucket', prefix='prefix'))
+
+        listing_cache.put(bucket_name='bucket', prefix='prefix', objects=OBJECTS)
+        self.assertListEqual(listing_cache.get(bucket_name='bucket', prefix='prefix'), OBJECTS)
+        self.assertIsNone(listing_cache.get(bucket_name='other-bucket', prefix='prefix'))
+
+    def test_ttl(self):
+        listing_cache = ListingCache(ttl=0.05)
+        listing_cache.put(bucket_name='bucket', prefix='prefix', objects=OBJECTS)
+        time.sleep(0.1)
+        self.assertIsNone(listing_cache.get(bucket_name='bucket', prefix='prefix'))
+
+    def test_least_recently_used_is_evicted(self):
+        listing_cache = ListingCache(max_entries=2)
+        listing_cache.put(bucket_name='bucket', prefix='a', objects=OBJECTS)
+        listing_cache.put(bucket_name='bucket', prefix='b', objects=OBJECTS)
+        listing_cache.get(bucket_name='bucket', prefix='a')
+        listing_cache.put(bucket_name='bucket', prefix='c', objects=OBJECTS)
+
+        self.assertIsNotNone(listing_cache.get(bucket_name='bucket', prefix='a'))
+        self.assertIsNone(listing_cache.get(bucket_name='bucket', prefix='b'))
+        self.assertIsNotNone(listing_cache.get(bucket_name='bucket', prefix='c'))
+
+    def test_directory(self):
+        with tempfile.TemporaryDirectory() as path:
+            ListingCache(path=path).put(bucket_name='bucket', prefix='prefix', objects=OBJECTS)
+
+            listing_cache = ListingCache(path=path)
+            self.assertListEqual(listing_cache.get(bucket_name='bucket', prefix='prefix'), OBJECTS)
+
+            listing_cache.invalidate()
+            self.assertIsNone(ListingCache(path=path).get(bucket_name='bucket', prefix='prefix'))
+
+    def test_directory_least_recently_used_is_evicted(self):
+        with tempfile.TemporaryDirectory() as path:
+            listing_cache = ListingCache(max_entries=1, path=path)
+            listing_cache.put(bucket_name='bucket', prefix='a', objects=OBJECTS)
+            listing_cache.put(bucket_name='bucket', prefix='b', objects=OBJECTS)
+
+            listing_cache = ListingCache(path=path)
+            self.assertIsNone(listing_cache.get(bucket_name='bucket', prefix='a'))
+            self.assertListEqual(listing_cache.get(bucket_name='bucket', prefix='b'), OBJECTS)
+
+    def test_pickles_without_listings(self):
+        listing_cache = ListingCache()
+        listing_cache.put(bucket_name='bucket', prefix='prefix', objects=OBJECTS)
+
+        listing_cache = pickle.loads(pickle.dumps(listing_cache))
+        self.assertIsNone(listing_cache.get(bucket_name='bucket', prefix='prefix'))
+
+    def test_invalid_arguments_raise(self):
+        self.assertRaises(RuntimeError, ListingCache, ttl=0)
+        self.assertRaises(RuntimeError, ListingCache, max_entries=0)
+
+
+@mock_s3
+class TestListingCacheWithEngine(TestWrapper):
+
+    def test_engine_uses_listing_cache(self):
+        listing_cache = ListingCache()
+        S3(client=self.client).list_objects(bucket_name='test-bucket', prefix='test-key', listing_cache=listing_cache)
+        self.s3.put_object(bucket_name='test-bucket', key='test-key/new.json', body=b'{"test": 1}')
+
+        sequential_engine = SequentialEngine(
+            bucket_name='test-bucket',
+            prefix='test-key',
+            threads=1,
+            verbose=False,
+            listing_cache=listing_cache
+        )
+        tasks = sequential_engine._list_tasks(S3(client=self.client), input_serialization={})
+
+        self.assertListEqual(tasks, [{'key': 'test-key/file.json', 'size': 11,
+                                     'etag': '96db854b55b71e6b6298e93df0b6a176'}])
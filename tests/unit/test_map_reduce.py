@@ -0,0 +1,128 @@
+import operator
+import os
+import unittest
+from moto import mock_s3
+
+from select_plus.ssp import SSP
+from select_plus.src.utils.map_reduce import MapReduce
+from select_plus.src.engine.threaded_engine import ThreadedEngine
+from select_plus.src.engine.parallel_engine import ParallelEngine
+from tests.util.test_wrapper import TestWrapper, CountingClient, CountingEngine, MockPagedS3Client
+
+STATS = {"bytes_scanned": 1, "bytes_processed": 1, "bytes_returned": 1}
+
+
+def process_ids(payload: str) -> set:
+    return {os.getpid()}
+
+
+class TestMapReduce(unittest.TestCase):
+
+    def test_fold_tasks_keeps_the_parts(self):
+        map_reduce = MapReduce(combine_func=operator.add)
+        tasks = [{"key": 'a'}, {"key": 'b', "scan_range": {"Start": 0, "End": 9}}, {"key": 'c'}, {"key": 'd'}]
+        results = [{"payload": 1, "stats": STATS}, {"payload": 'part', "stats": STATS},
+                   {"payload": 2, "stats": STATS, "cache_hit": True}, None]
+
+        accumulator, folded = map_reduce.fold_tasks(tasks, results)
+
+        self.assertEqual(accumulator, (3,))
+        self.assertListEqual(folded, [{"payload": None, "stats": STATS, "combined": True}, results[1],
+                                      {"payload": None, "stats": STATS, "combined": True, "cache_hit": True}, None])
+
+        # The joined object is mapped and folded in its own accumulator
+        map_reduce.add(accumulator)
+        map_reduce.fold_remaining([folded[0], {"payload": 10, "stats": STATS}])
+        self.assertListEqual(map_reduce.accumulators, [(3,), (10,)])
+        self.assertEqual(map_reduce.result(), 13)
+
+    def test_reduce_func(self):
+        map_reduce = MapReduce(combine_func=operator.add, reduce_func=max)
+        for values in [[1], [2, 3], []]:
+            accumulator = None
+            for value in values:
+                accumulator, _ = map_reduce.fold(accumulator, {"payload": value, "stats": STATS})
+            map_reduce.add(accumulator)
+
+        self.assertListEqual(map_reduce.accumulators, [(1,), (5,)])
+        self.assertEqual(map_reduce.result(), 5)
+        self.assertIsNone(MapReduce(combine_func=operator.add).result())
+
+
+@mock_s3
+class TestSSPMapReduce(TestWrapper):
+
+    def setUp(self) -> None:
+        super().setUp()
+        for name in ['file2.json', 'file3.json']:
+            self.s3.put_object(bucket_name='test-bucket', key=f'test-key/{name}', body='{"test": 1}')
+
+    def test_select_map_reduce(self):
+        CountingEngine.client = CountingClient(self.client)
+        ssp = SSP(bucket_name='test-bucket', prefix='test-key', engine=CountingEngine)
+
+        results = ssp.select(sql_query='SELECT * FROM s3object s', map_func=len, combine_func=operator.add)
+
+        self.assertEqual(results.value, len('test-key/file.json\n') + 2 * len('test-key/file2.json\n'))
+        self.assertListEqual(results.payload, [])
+        self.assertEqual(results.stats.files_processed, 3)
+        self.assertEqual(results.stats.bytes_scanned, 3)
+
+    def test_select_map_reduce_with_scan_ranges(self):
+        CountingEngine.client = CountingClient(self.client)
+        ssp = SSP(bucket_name='test-bucket', prefix='test-key', engine=CountingEngine)
+
+        results = ssp.select(sql_query='SELECT * FROM s3object s', input_serialization={'JSON': {'Type': 'LINES'}},
+                             scan_range_size=6, map_func=str.splitlines, combine_func=operator.add)
+
+        # Each part of a file returns the key of the file
+        self.assertListEqual(sorted(results.value), ['test-key/file.json'] * 2 + ['test-key/file2.json'] * 2 +
+                             ['test-key/file3.json'] * 2)
+        self.assertEqual(results.stats.files_processed, 3)
+
+    def test_invalid_arguments(self):
+        ssp = SSP(bucket_name='test-bucket', prefix='test-key', engine=CountingEngine)
+        self.assertRaises(RuntimeError, ssp.select, sql_query='SELECT * FROM s3object s', map_func=len)
+        self.assertRaises(RuntimeError, ssp.select, sql_query='SELECT * FROM s3object s', map_func=len,
+                          combine_func=operator.add, extra_func=len)
+        self.assertRaises(RuntimeError, ssp.select, sql_query='SELECT s.a FROM s3object s ORDER BY s.a',
+                          map_func=len, combine_func=operator.add)
+
+    def test_threaded_engine_folds_per_thread(self):
+        client = CountingClient(self.client)
+        threaded_engine = ThreadedEngine(bucket_name='test-bucket', prefix='test-key', threads=2, verbose=False)
+
+        map_reduce = MapReduce(combine_func=operator.add)
+        response = threaded_engine.execute(sql_query='SELECT * FROM s3object s', input_serialization={},
+                                           output_serialization={}, s3_client=client, extra_func=len,
+                                           map_reduce=map_reduce)
+
+        self.assertTrue(all(result['combined'] and result['payload'] is None for result in response))
+        self.assertLessEqual(len(map_reduce.accumulators), 2)
+        self.assertEqual(map_reduce.result(), len('test-key/file.json\n') + 2 * len('test-key/file2.json\n'))
+
+
+class TestParallelEngineMapReduce(unittest.TestCase):
+
+    def test_one_accumulator_per_process(self):
+        parallel_engine = ParallelEngine(bucket_name='test-bucket', prefix='test', threads=2, verbose=False)
+
+        for session in [False, True]:
+            if session:
+                parallel_engine.start()
+            try:
+                for _ in range(2 if session else 1):
+                    map_reduce = MapReduce(combine_func=operator.or_)
+                    response = parallel_engine.execute(sql_query='SELECT * FROM s3object s', input_serialization={},
+                                                       output_serialization={}, s3_client=MockPagedS3Client(pages=8),
+                                                       extra_func=process_ids, map_reduce=map_reduce)
+
+                    self.assertEqual(len(response), 8)
+                    self.assertTrue(all(result['payload'] is None for result in response))
+                    # Each accumulator holds the objects of one process, and each process sent one accumulator
+                    process_sets = [accumulator[0] for accumulator in map_reduce.accumulators]
+                    self.assertTrue(1 <= len(process_sets) <= 2)
+                    self.assertTrue(all(len(processes) == 1 for processes in process_sets))
+                    self.assertEqual(len(map_reduce.result()), len(process_sets))
+            finally:
+                parallel_engine.shutdown()
@@ -250,4 +250,51 @@ class TestModels(TestWrapper):
         )
 
         expected_result = [[{'ticker': 'VUSA.L'}], [{'ticker': 'VUSA.L'}]]
-        self.assertListEqual(expected_result, er.payload_dict)
\ No newline at end of file
+        self.assertListEqual(expected_result, er.payload_dict)
+
+    def test_engine_results_payload_dict_json_literals(self):
+        er = EngineResults(
+            payload=['{"ticker":"VUSA.L","active":true,"price":null}\n', '{"ticker":"VUSA.L","active":false}\n'],
+            stats=EngineResultsStats(
+                cost=0,
+                files_processed=0,
+                bytes_scanned=0,
+                bytes_returned=0,
+                bytes_processed=0
+            )
+        )
+
+        expected_result = [{"ticker": "VUSA.L", "active": True, "price": None}, {"ticker": "VUSA.L", "active": False}]
+        self.assertListEqual(expected_result, er.payload_dict)
+
+    def test_engine_results_payload_dict_record_delimiter(self):
+        er = EngineResults(
+            payload=['{"ticker":"VUSA.L"};{"ticker":"VUSA.L"};'],
+            stats=EngineResultsStats(
+                cost=0,
+                files_processed=0,
+                bytes_scanned=0,
+                bytes_returned=0,
+                bytes_processed=0
+            ),
+            output_serialization={'JSON': {'RecordDelimiter': ';'}}
+        )
+
+        expected_result = [{"ticker": "VUSA.L"}, {"ticker": "VUSA.L"}]
+        self.assertListEqual(expected_result, er.payload_dict)
+
+    def test_engine_results_payload_csv_quoted(self):
+        er = EngineResults(
+            payload=['1,"a,b"\n', '2,"c\nd"\n'],
+            stats=EngineResultsStats(
+                cost=0,
+                files_processed=0,
+                bytes_scanned=0,
+                bytes_returned=0,
+                bytes_processed=0
+            ),
+            output_serialization={'CSV': {'QuoteFields': 'ASNEEDED'}}
+        )
+
+        self.assertListEqual([['1', 'a,b'], ['2', 'c\nd']], er.payload_csv)
+        self.assertDictEqual({'_1': ['1', '2'], '_2': ['a,b', 'c\nd']}, er.payload_columns())
@@ -1,6 +1,7 @@
 from moto import mock_s3
-from tests.util.test_wrapper import TestWrapper
+from tests.util.test_wrapper import TestWrapper, MockPagedS3Client
 from select_plus.src.engine.parallel_engine import ParallelEngine
+from select_plus.src.aws.s3 import S3
 
 
 # Do not put this function inside the test class. It cannot be pickled
@@ -8,6 +9,17 @@ def func(n: int):
     return n * n
 
 
+_offset = {}
+
+
+def init_offset(offset: int):
+    _offset['value'] = offset
+
+
+def offset_func(n: int):
+    return n + _offset['value']
+
+
 @mock_s3
 class TestParallelEngine(TestWrapper):
 
@@ -42,7 +54,7 @@ class TestParallelEngine(TestWrapper):
         expected_response = [1, 4, 9, 16]
         self.assertListEqual(expected_response, response)
 
-    def test_make_func_args(self):
+    def test_list_tasks(self):
         parallel_engine = ParallelEngine(
             bucket_name='test-bucket',
             prefix='test-key',
@@ -50,30 +62,157 @@ class TestParallelEngine(TestWrapper):
             verbose=False
         )
 
-        args_list = parallel_engine._make_func_args(
+        tasks = parallel_engine._list_tasks(S3(client=self.client), input_serialization={})
+        self.assertListEqual(tasks, [{'key': 'test-key/file.json', 'size': 11,
+                                     'etag': '96db854b55b71e6b6298e93df0b6a176'}])
+
+    def test_make_query_context(self):
+        parallel_engine = ParallelEngine(
+            bucket_name='test-bucket',
+            prefix='test-key',
+            threads=1,
+            verbose=False
+        )
+
+        query_context = parallel_engine._make_query_context(
             sql_query='SELECT * FROM s3object s',
             extra_func=None,
             extra_func_args={'test': 1},
-            s3_client=self.client,
+            s3_client=None,
             input_serialization={},
             output_serialization={}
         )
 
-        args_list[0]['s3_client'] = None
-
-        expected_args = [
-            {
-                'key': 'test-key/file.json',
-                'sql_query': 'SELECT * FROM s3object s',
-                'extra_func': None,
-                's3_client': None,
-                'extra_func_args': {'test': 1},
-                'input_serialization': {},
-                'output_serialization': {}
-            }
-        ]
-
-        self.assertListEqual(args_list, expected_args)
+        expected_context = {
+            'sql_query': 'SELECT * FROM s3object s',
+            'extra_func': None,
+            's3_client': None,
+            'extra_func_args': {'test': 1},
+            'input_serialization': {},
+            'output_serialization': {}
+        }
+
+        self.assertDictEqual(query_context, expected_context)
+
+    def test_chunksize(self):
+        parallel_engine = ParallelEngine(
+            bucket_name='test',
+            prefix='test',
+            threads=8,
+            verbose=False
+        )
+
+        self.assertEqual(parallel_engine._chunksize(0), 1)
+        self.assertEqual(parallel_engine._chunksize(10), 1)
+        self.assertEqual(parallel_engine._chunksize(32), 1)
+        self.assertEqual(parallel_engine._chunksize(33), 2)
+        self.assertEqual(parallel_engine._chunksize(20000), 625)
+
+    def test_make_batches_by_listing(self):
+        parallel_engine = ParallelEngine(
+            bucket_name='test',
+            prefix='test',
+            threads=1,
+            verbose=False
+        )
+
+        tasks = [{'key': f'{i}.json', 'size': i} for i in range(6)]
+        self.assertListEqual(parallel_engine._make_batches(tasks, 'listing'), [[0, 1], [2, 3], [4, 5]])
+        self.assertEqual(len(parallel_engine._make_batches(tasks, 'size')), 4)
+        self.assertRaises(RuntimeError, parallel_engine._make_batches, tasks, 'wrong')
+
+    def test_execute_callable_with_initializer(self):
+        parallel_engine = ParallelEngine(
+            bucket_name='test',
+            prefix='test',
+            threads=2,
+            verbose=False
+        )
+
+        response = parallel_engine.execute_callable(
+            func=offset_func,
+            args=[1, 2, 3, 4],
+            initializer=init_offset,
+            initargs=(10,)
+        )
+
+        self.assertListEqual([11, 12, 13, 14], response)
+
+    def test_execute_with_mock_client(self):
+        parallel_engine = ParallelEngine(
+            bucket_name='test',
+            prefix='test',
+            threads=2,
+            verbose=False
+        )
+
+        response = parallel_engine.execute(
+            sql_query='',
+            s3_client=self.mock_s3_client,
+            input_serialization={},
+            output_serialization={}
+        )
+        expected_response = [{'payload': 'test', 'stats': {'bytes_scanned': 1, 'bytes_processed': 2, 'bytes_returned': 3}}]
+        self.assertListEqual(expected_response, response)
+
+    def test_execute_in_session(self):
+        parallel_engine = ParallelEngine(
+            bucket_name='test',
+            prefix='test',
+            threads=2,
+            verbose=False
+        )
+
+        parallel_engine.start()
+        try:
+            pool = parallel_engine._workers
+            for _ in range(2):
+                response = parallel_engine.execute(
+                    sql_query='',
+                    s3_client=self.mock_s3_client,
+                    input_serialization={},
+                    output_serialization={}
+                )
+                expected_response = [
+                    {'payload': 'test', 'stats': {'bytes_scanned': 1, 'bytes_processed': 2, 'bytes_returned': 3}}
+                ]
+                self.assertListEqual(expected_response, response)
+            self.assertIs(pool, parallel_engine._workers)
+        finally:
+            parallel_engine.shutdown()
+        self.assertIsNone(parallel_engine._workers)
+
+    def test_execute_with_listing_pages(self):
+        for schedule in ['size', 'listing']:
+            parallel_engine = ParallelEngine(
+                bucket_name='test',
+                prefix='test',
+                threads=2,
+                verbose=False
+            )
+
+            response = parallel_engine.execute(
+                sql_query='',
+                s3_client=MockPagedS3Client(pages=3),
+                input_serialization={},
+                output_serialization={},
+                schedule=schedule
+            )
+            expected_response = [
+                {'payload': 'test', 'stats': {'bytes_scanned': 1, 'bytes_processed': 2, 'bytes_returned': 3}}
+            ] * 3
+            self.assertListEqual(expected_response, response)
+
+    def test_execute_with_unknown_schedule_raises(self):
+        parallel_engine = ParallelEngine(
+            bucket_name='test',
+            prefix='test',
+            threads=2,
+            verbose=False
+        )
+
+        self.assertRaises(RuntimeError, parallel_engine.execute, sql_query='', s3_client=self.mock_s3_client,
+                          input_serialization={}, output_serialization={}, schedule='random')
 
     # Test cannot be executed because boto3 client cannot be pickled
     # def test_execute(self):
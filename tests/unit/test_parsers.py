@@ -0,0 +1,99 @@
+import unittest
+
+from select_plus.src.utils.parsers import JSONParser, CSVParser, record_delimiter, record_count, take_records, \
+    serialize_records, can_split
+
+
+class TestParsers(unittest.TestCase):
+
+    def test_record_delimiter_default(self):
+        self.assertEqual(record_delimiter(None), '\n')
+        self.assertEqual(record_delimiter({'JSON': {}}), '\n')
+
+    def test_record_delimiter_from_output_serialization(self):
+        self.assertEqual(record_delimiter({'JSON': {'RecordDelimiter': '|'}}), '|')
+        self.assertEqual(record_delimiter({'CSV': {'RecordDelimiter': '\r\n'}}), '\r\n')
+
+    def test_can_split(self):
+        self.assertTrue(can_split({'CompressionType': 'NONE', 'CSV': {}}))
+        self.assertTrue(can_split({'JSON': {'Type': 'LINES'}}))
+        self.assertFalse(can_split({'JSON': {'Type': 'DOCUMENT'}}))
+        self.assertFalse(can_split({'CompressionType': 'GZIP', 'CSV': {}}))
+        self.assertFalse(can_split({'CSV': {'AllowQuotedRecordDelimiter': True}}))
+        self.assertFalse(can_split({'Parquet': {}}))
+
+    def test_json_parser_literals(self):
+        parser = JSONParser()
+        result = parser.parse('{"a":true,"b":false,"c":null}\n{"a":"x\\ny"}\n')
+        self.assertListEqual(result, [{'a': True, 'b': False, 'c': None}, {'a': 'x\ny'}])
+
+    def test_json_parser_custom_delimiter(self):
+        parser = JSONParser(delimiter='|')
+        result = parser.parse('{"a":"1|2"}|{"a":2}|')
+        self.assertListEqual(result, [{'a': '1|2'}, {'a': 2}])
+
+    def test_json_parser_does_not_evaluate_code(self):
+        parser = JSONParser()
+        self.assertRaises(ValueError, parser.parse, '__import__("os").getcwd()\n')
+
+    def test_json_parser_iter_records(self):
+        parser = JSONParser()
+        result = list(parser.iter_records(['{"a":1}\n', '', '{"a":2}\n{"a":3}\n']))
+        self.assertListEqual(result, [{'a': 1}, {'a': 2}, {'a': 3}])
+
+    def test_csv_parser_quoted_fields(self):
+        parser = CSVParser()
+        result = parser.parse('1,"a,b","multi\nline"\n2,"say ""hi""",\n')
+        self.assertListEqual(result, [['1', 'a,b', 'multi\nline'], ['2', 'say "hi"', '']])
+
+    def test_csv_parser_from_output_serialization(self):
+        parser = CSVParser.from_output_serialization(
+            {'CSV': {'RecordDelimiter': '|', 'FieldDelimiter': ';', 'QuoteCharacter': "'", 'QuoteEscapeCharacter': '\\'}}
+        )
+        result = parser.parse("1;'a;b'|2;'it\\'s'|")
+        self.assertListEqual(result, [['1', 'a;b'], ['2', "it's"]])
+
+    def test_csv_parser_quoted_record_delimiter(self):
+        parser = CSVParser(delimiter=';')
+        self.assertListEqual(parser.parse('1,"a;b";2,c;'), [['1', 'a;b'], ['2', 'c']])
+        self.assertListEqual(parser.split_records('1,"a;""b"";";2,c;'), ['1,"a;""b"";"', '2,c'])
+        self.assertDictEqual(parser.parse_columns(['1,"a;b";', '2,c;']), {'_1': ['1', '2'], '_2': ['a;b', 'c']})
+
+        parser = CSVParser(delimiter='|', quote_character="'", quote_escape_character='\\')
+        self.assertListEqual(parser.parse("'it\\'s|'|2|"), [["it's|"], ['2']])
+
+    def test_csv_parser_columns(self):
+        parser = CSVParser()
+        result = parser.parse_columns(['1,2\n3,4\n', '5,6\n'])
+        self.assertDictEqual(result, {'_1': ['1', '3', '5'], '_2': ['2', '4', '6']})
+
+    def test_csv_parser_columns_with_header(self):
+        parser = CSVParser()
+        result = parser.parse_columns(['a,b\n1,2\n', '3,4\n'], header=True)
+        self.assertDictEqual(result, {'a': ['1', '3'], 'b': ['2', '4']})
+
+    def test_csv_parser_columns_empty(self):
+        parser = CSVParser()
+        self.assertDictEqual(parser.parse_columns(['']), {})
+
+    def test_record_count(self):
+        self.assertEqual(record_count('{"a":1}\n{"a":2}\n', {'JSON': {}}), 2)
+        self.assertEqual(record_count('1|2|', {'JSON': {'RecordDelimiter': '|'}}), 2)
+        # A quoted CSV field may hold the record delimiter
+        self.assertEqual(record_count('1,"x\ny"\n2,z\n', {'CSV': {}}), 2)
+        self.assertEqual(record_count('1,"a;b";2,c;', {'CSV': {'RecordDelimiter': ';'}}), 2)
+
+    def test_take_records(self):
+        self.assertEqual(take_records('{"a":1}\n{"a":2}\n', 1, {'JSON': {}}), '{"a":1}\n')
+        self.assertEqual(take_records('{"a":1}\n', 5, {'JSON': {}}), '{"a":1}\n')
+        self.assertEqual(take_records('{"a":1}\n', 0, {'JSON': {}}), '')
+        self.assertEqual(take_records('1,"x\ny"\n2,z\n3,w\n', 2, {'CSV': {}}), '1,"x\ny"\n2,z\n')
+        self.assertEqual(take_records('1,"a;b";2,c;3,d;', 2, {'CSV': {'RecordDelimiter': ';'}}), '1,"a;b";2,c;')
+
+    def test_serialize_records(self):
+        records = [{"a": 1, "b": 'x,"y"'}, {"a": None, "b": 'z'}]
+        self.assertEqual(serialize_records(records, {'JSON': {'RecordDelimiter': '|'}}),
+                         '{"a":1,"b":"x,\\"y\\""}|{"a":null,"b":"z"}|')
+        csv_block = serialize_records(records, {'CSV': {}})
+        self.assertEqual(csv_block, '1,"x,""y"""\n,z\n')
+        self.assertListEqual(CSVParser().parse(csv_block), [['1', 'x,"y"'], ['', 'z']])
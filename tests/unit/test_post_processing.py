@@ -0,0 +1,203 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from moto import mock_s3
+
+from select_plus.ssp import SSP
+from select_plus.src.sinks.sinks import DirectorySink
+from select_plus.src.utils import post_processing
+from select_plus.src.utils.post_processing import ClientSideQuery, SortKey
+from tests.util.test_wrapper import TestWrapper, CountingClient, CountingEngine
+
+GROUP_QUERY = 'SELECT s.country, COUNT(*) AS n, SUM(s.amount) AS total, AVG(s.amount) AS mean FROM s3object s ' \
+              'WHERE s.amount > 0 GROUP BY s.country ORDER BY total DESC'
+
+
+class RecordsClient(CountingClient):
+    """
+    Returns the same records as S3 Select for the "s3_query" of GROUP_QUERY.
+    """
+    records = {
+        "test-key/file.json": '{"_1":"fr","_2":10}\n{"_1":"de","_2":5}\n',
+        "test-key/file2.json": '{"_1":"fr","_2":1}\n{"_1":"it","_2":null}\n'
+    }
+
+    def select_object_content(self, Key: str, **kwargs):
+        self.keys.append(Key)
+        return {"Payload": [
+            {"Records": {"Payload": self.records[Key].encode()}},
+            {"Stats": {"Details": {"BytesScanned": 1, "BytesProcessed": 1, "BytesReturned": 1}}}
+        ]}
+
+
+class TestClientSideQuery(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertIsNone(ClientSideQuery.parse('SELECT * FROM s3object s LIMIT 5'))
+        self.assertIsNone(ClientSideQuery.parse("SELECT * FROM s3object s WHERE s.a = 'ORDER BY x'"))
+
+        query = ClientSideQuery.parse(GROUP_QUERY)
+        self.assertEqual(query.s3_query, 'SELECT s.country AS _1, s.amount AS _2 FROM s3object s WHERE s.amount > 0')
+        self.assertListEqual(query.names, ['country', 'n', 'total', 'mean'])
+
+        query = ClientSideQuery.parse('SELECT s.a AS x FROM s3object s ORDER BY s.b DESC, x LIMIT 10')
+        self.assertEqual(query.s3_query, 'SELECT s.a AS _1, s.b AS _2 FROM s3object s')
+        self.assertEqual(query.limit, 10)
+
+    def test_invalid_queries(self):
+        self.assertRaises(RuntimeError, ClientSideQuery, 'SELECT s.a, COUNT(*) FROM s3object s GROUP BY s.b')
+        self.assertRaises(RuntimeError, ClientSideQuery, 'SELECT COUNT(*) FROM s3object s ORDER BY 1')
+        self.assertRaises(RuntimeError, ClientSideQuery, 'SELECT * FROM s3object s GROUP BY s.a')
+
+    def test_group_by(self):
+        query = ClientSideQuery(GROUP_QUERY)
+        partials = [query.reduce(payload) for payload in RecordsClient.records.values()]
+
+        self.assertListEqual(list(query.merge(partials)), [
+            {"country": 'fr', "n": 2, "total": 11, "mean": 5.5},
+            {"country": 'de', "n": 1, "total": 5, "mean": 5.0},
+            {"country": 'it', "n": 1, "total": None, "mean": None}
+        ])
+
+    def test_group_by_sums_csv_fields(self):
+        query = ClientSideQuery('SELECT s._1, SUM(s._2) FROM s3object s GROUP BY s._1', csv=True)
+        partial = query.reduce('{"_1":"a","_2":"1"}\n{"_1":"a","_2":"2.5"}\n')
+        self.assertListEqual(list(query.merge([partial])), [{"_1": 'a', "_2": 3.5}])
+
+    def test_group_by_compares_csv_fields_as_numbers(self):
+        query = ClientSideQuery('SELECT s._1, MIN(s._2), MAX(s._2), SUM(s._2) FROM s3object s GROUP BY s._1',
+                                csv=True)
+        partials = [query.reduce('{"_1":"a","_2":"10"}\n{"_1":"a","_2":"9"}\n'),
+                    query.reduce('{"_1":"a","_2":"100"}\n{"_1":"a","_2":"n/a"}\n')]
+        self.assertListEqual(list(query.merge(partials)), [{"_1": 'a', "_2": 9, "_3": 'n/a', "_4": 119}])
+
+    def test_order_by_sorts_csv_fields_as_numbers(self):
+        query = ClientSideQuery('SELECT s._1 FROM s3object s ORDER BY s._1', csv=True)
+        partials = [query.reduce('{"_1":"10"}\n{"_1":"9"}\n'), query.reduce('{"_1":"100"}\n{"_1":"2.5"}\n')]
+        self.assertListEqual([record['_1'] for record in query.merge(partials)], ['2.5', '9', '10', '100'])
+
+        query = ClientSideQuery('SELECT s._1, COUNT(*) AS n FROM s3object s GROUP BY s._1 ORDER BY s._1 DESC',
+                                csv=True)
+        partial = query.reduce('{"_1":"9"}\n{"_1":"10"}\n{"_1":"10"}\n')
+        self.assertListEqual(list(query.merge([partial])), [{"_1": '10', "n": 2}, {"_1": '9', "n": 1}])
+
+    def test_only_decimal_csv_fields_are_numbers(self):
+        query = ClientSideQuery('SELECT s._1 FROM s3object s ORDER BY s._1', csv=True)
+        partial = query.reduce('{"_1":"Zoe"}\n{"_1":"Nan"}\n{"_1":"Adam"}\n{"_1":"Infinity"}\n{"_1":"1e5"}\n')
+        self.assertListEqual([record['_1'] for record in query.merge([partial])],
+                             ['1e5', 'Adam', 'Infinity', 'Nan', 'Zoe'])
+
+        query = ClientSideQuery('SELECT s.a, MAX(s.b) FROM s3object s GROUP BY s.a', csv=True)
+        partial = query.reduce('{"_1":"x","_2":"Nan"}\n{"_1":"x","_2":"Bob"}\n')
+        self.assertListEqual(list(query.merge([partial])), [{"a": 'x', "_2": 'Nan'}])
+
+        # The strings of JSON objects are not numbers
+        query = ClientSideQuery('SELECT s.a FROM s3object s ORDER BY s.a')
+        partial = query.reduce('{"_1":"10"}\n{"_1":"9"}\n{"_1":2}\n')
+        self.assertListEqual([record['a'] for record in query.merge([partial])], [2, '10', '9'])
+
+    def test_order_by_merges_sorted_runs(self):
+        query = ClientSideQuery('SELECT s.a FROM s3object s ORDER BY s.b DESC, a LIMIT 3')
+        partials = [query.reduce('{"_1":"x","_2":1}\n{"_1":"y","_2":3}\n'),
+                    query.reduce('{"_1":"z","_2":2}\n{"_1":"w","_2":3}\n{"_1":"v","_2":null}\n')]
+
+        self.assertListEqual(list(query.merge(partials)), [{"a": 'w'}, {"a": 'y'}, {"a": 'z'}])
+
+    def test_order_by_spills_large_runs(self):
+        query = ClientSideQuery('SELECT * FROM s3object s ORDER BY s.meta.b LIMIT 2')
+        with mock.patch.object(post_processing, 'SORT_BUFFER_RECORDS', 2):
+            spilled = query.reduce('{"meta":{"b":3}}\n{"meta":{"b":1}}\n{"meta":{"b":4}}\n')
+            in_memory = query.reduce('{"meta":{"b":2}}\n')
+
+        self.assertIsInstance(spilled, str)
+        self.assertIsInstance(in_memory, list)
+        self.assertTrue(os.path.exists(spilled))
+        self.assertListEqual([record['meta']['b'] for record in query.merge([spilled, in_memory])], [1, 2])
+        self.assertFalse(os.path.exists(spilled))
+
+    def test_order_by_without_limit_returns_run_files(self):
+        query = ClientSideQuery('SELECT s.a FROM s3object s ORDER BY s.a')
+        with tempfile.TemporaryDirectory() as path, mock.patch.object(tempfile, 'tempdir', path), \
+                mock.patch.object(post_processing, 'MERGE_RUNS', 2):
+            partials = [query.reduce(f'{{"_1":{value}}}\n{{"_1":{value + 10}}}\n') for value in range(5)]
+            self.assertIsInstance(partials[0], str)
+            self.assertListEqual(query.reduce(''), [])
+            self.assertEqual(len(os.listdir(path)), 5)
+
+            # 5 runs are merged into 3, then 2 runs, before the last merge
+            self.assertListEqual([record['a'] for record in query.merge(partials)],
+                                 [0, 1, 2, 3, 4, 10, 11, 12, 13, 14])
+            self.assertListEqual(os.listdir(path), [])
+
+    def test_order_by_sorts_runs_of_the_buffer_size(self):
+        query = ClientSideQuery('SELECT s.a FROM s3object s ORDER BY s.a LIMIT 4')
+        payload = ''.join(f'{{"_1":{value}}}\n' for value in [5, 3, 9, 1, 7, 2, 8])
+        with tempfile.TemporaryDirectory() as path, mock.patch.object(tempfile, 'tempdir', path), \
+                mock.patch.object(post_processing, 'SORT_BUFFER_RECORDS', 2):
+            run = query.reduce(payload)
+            # The runs of 2 records are merged into one run, cut to the LIMIT
+            self.assertListEqual(os.listdir(path), [os.path.basename(run)])
+            self.assertListEqual(list(query._read_run(run)), [[[1], {"a": 1}], [[2], {"a": 2}], [[3], {"a": 3}],
+                                                              [[5], {"a": 5}]])
+
+            self.assertListEqual(list(query.merge([run, query.reduce('{"_1":0}\n')])),
+                                 [{"a": 0}, {"a": 1}, {"a": 2}, {"a": 3}])
+            self.assertListEqual(os.listdir(path), [])
+
+    def test_merge_removes_runs_when_stopped(self):
+        query = ClientSideQuery('SELECT s.a FROM s3object s ORDER BY s.a')
+        with tempfile.TemporaryDirectory() as path, mock.patch.object(tempfile, 'tempdir', path), \
+                mock.patch.object(post_processing, 'SORT_BUFFER_RECORDS', 1):
+            partials = [query.reduce('{"_1":1}\n{"_1":3}\n'), query.reduce('{"_1":2}\n')]
+            self.assertEqual(len(os.listdir(path)), 2)
+
+            records = query.merge(partials)
+            next(records)
+            records.close()
+            self.assertListEqual(os.listdir(path), [])
+
+            # A payload that cannot be parsed leaves no run behind
+            self.assertRaises(Exception, query.reduce, '{"_1":1}\n{"_1":2}\n{"_1":')
+            self.assertListEqual(os.listdir(path), [])
+
+    def test_distinct(self):
+        query = ClientSideQuery('SELECT DISTINCT s.a FROM s3object s LIMIT 3')
+        partials = [query.reduce('{"_1":1}\n{"_1":1}\n{"_1":2}\n'), query.reduce('{"_1":2}\n{"_1":3}\n{"_1":4}\n')]
+        self.assertListEqual(list(query.merge(partials)), [{"a": 1}, {"a": 2}, {"a": 3}])
+
+    def test_sort_key(self):
+        keys = [SortKey([value], [False]) for value in [2, None, 1]]
+        self.assertListEqual([key.values[0] for key in sorted(keys)], [None, 1, 2])
+        keys = [SortKey([value], [True]) for value in [2, None, 1]]
+        self.assertListEqual([key.values[0] for key in sorted(keys)], [2, 1, None])
+
+
+@mock_s3
+class TestClientSideSelect(TestWrapper):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.s3.put_object(bucket_name='test-bucket', key='test-key/file2.json', body='{"test": 1}')
+        CountingEngine.client = RecordsClient(self.client)
+
+    def test_select_group_by(self):
+        ssp = SSP(bucket_name='test-bucket', prefix='test-key', engine=CountingEngine)
+        results = ssp.select(sql_query=GROUP_QUERY, limit=2)
+
+        self.assertListEqual(results.payload_dict, [{"country": 'fr', "n": 2, "total": 11, "mean": 5.5},
+                                                    {"country": 'de', "n": 1, "total": 5, "mean": 5.0}])
+        self.assertEqual(results.stats.files_processed, 2)
+
+    def test_select_order_by_to_sink(self):
+        ssp = SSP(bucket_name='test-bucket', prefix='test-key', engine=CountingEngine)
+        with tempfile.TemporaryDirectory() as path:
+            results = ssp.select(sql_query='SELECT s.country, s.amount FROM s3object s ORDER BY amount',
+                                 output_serialization={'CSV': {}}, sink=DirectorySink(path))
+
+            self.assertListEqual(results.payload, [os.path.join(path, 'results', 'part-00000.csv')])
+            self.assertListEqual(results.payload_csv, [['it', ''], ['fr', '1'], ['de', '5'], ['fr', '10']])
+
+    def test_extra_func_is_not_supported(self):
+        ssp = SSP(bucket_name='test-bucket', prefix='test-key', engine=CountingEngine)
+        self.assertRaises(RuntimeError, ssp.select, sql_query=GROUP_QUERY, extra_func=len)
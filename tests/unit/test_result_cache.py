@@ -0,0 +1,129 @@
+import os
+import time
+import pickle
+import tempfile
+import unittest
+from moto import mock_s3
+
+from select_plus.src.cache.result_cache import BaseResultCache, DirectoryResultCache, SQLiteResultCache
+from select_plus.src.engine.engine import EngineWrapper
+from select_plus.src.engine.sequential_engine import SequentialEngine
+from tests.util.test_wrapper import TestWrapper
+
+RESPONSE = {"payload": '{"a": 1}\n', "stats": {"bytes_scanned": 100, "bytes_processed": 100, "bytes_returned": 9}}
+
+
+class TestResultCache(unittest.TestCase):
+
+    def test_make_key(self):
+        key = BaseResultCache.make_key(bucket_name='bucket', key='file.json', etag='abc', sql_query='SELECT 1',
+                                       input_serialization={}, output_serialization={})
+        same_key = BaseResultCache.make_key(bucket_name='bucket', key='file.json', etag='abc', sql_query='SELECT 1',
+                                            input_serialization={}, output_serialization={})
+        new_version = BaseResultCache.make_key(bucket_name='bucket', key='file.json', etag='def',
+                                               sql_query='SELECT 1', input_serialization={}, output_serialization={})
+        new_query = BaseResultCache.make_key(bucket_name='bucket', key='file.json', etag='abc', sql_query='SELECT 2',
+                                             input_serialization={}, output_serialization={})
+
+        self.assertEqual(key, same_key)
+        self.assertNotEqual(key, new_version)
+        self.assertNotEqual(key, new_query)
+
+    def test_directory_result_cache(self):
+        with tempfile.TemporaryDirectory() as path:
+            result_cache = DirectoryResultCache(path=path)
+            self.assertIsNone(result_cache.get('key'))
+
+            result_cache.put('key', RESPONSE)
+            self.assertDictEqual(DirectoryResultCache(path=path).get('key'), RESPONSE)
+
+    def test_directory_result_cache_evicts_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as path:
+            result_cache = DirectoryResultCache(path=path, max_size=250)
+            for cache_key in ['a', 'b']:
+                result_cache.put(cache_key, RESPONSE)
+                time.sleep(0.01)
+            result_cache.get('a')
+            time.sleep(0.01)
+            result_cache.put('c', RESPONSE)
+
+            self.assertIsNotNone(result_cache.get('a'))
+            self.assertIsNone(result_cache.get('b'))
+            self.assertIsNotNone(result_cache.get('c'))
+
+    def test_sqlite_result_cache(self):
+        with tempfile.TemporaryDirectory() as path:
+            file_path = os.path.join(path, 'results.db')
+            result_cache = SQLiteResultCache(path=file_path)
+            self.assertIsNone(result_cache.get('key'))
+
+            result_cache.put('key', RESPONSE)
+            self.assertDictEqual(pickle.loads(pickle.dumps(result_cache)).get('key'), RESPONSE)
+
+    def test_sqlite_result_cache_evicts_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as path:
+            result_cache = SQLiteResultCache(path=os.path.join(path, 'results.db'), max_size=200)
+            for cache_key in ['a', 'b']:
+                result_cache.put(cache_key, RESPONSE)
+                time.sleep(0.01)
+            result_cache.get('a')
+            time.sleep(0.01)
+            result_cache.put('c', RESPONSE)
+
+            self.assertIsNotNone(result_cache.get('a'))
+            self.assertIsNone(result_cache.get('b'))
+            self.assertIsNotNone(result_cache.get('c'))
+
+
+@mock_s3
+class TestResultCacheWithEngine(TestWrapper):
+
+    def test_unchanged_objects_are_read_from_cache(self):
+        class CountingClient:
+            def __init__(self, client):
+                self.client = client
+                self.selects = 0
+
+            def get_paginator(self, *args, **kwargs):
+                return self.client.get_paginator(*args, **kwargs)
+
+            def select_object_content(self, **kwargs):
+                self.selects += 1
+                return {"Payload": [
+                    {"Records": {"Payload": b'{"test": 1}\n'}},
+                    {"Stats": {"Details": {"BytesScanned": 1000, "BytesProcessed": 1000, "BytesReturned": 12}}}
+                ]}
+
+        client = CountingClient(self.client)
+        sequential_engine = SequentialEngine(
+            bucket_name='test-bucket',
+            prefix='test-key',
+            threads=1,
+            verbose=False
+        )
+
+        with tempfile.TemporaryDirectory() as path:
+            result_cache = DirectoryResultCache(path=path)
+            results = []
+            for _ in range(2):
+                results.append(EngineWrapper().execute(sql_query='SELECT * FROM s3object s', extra_func=None,
+                                                       extra_func_args=None, engine=sequential_engine,
+                                                       input_serialization={}, output_serialization={},
+                                                       s3_client=client, result_cache=result_cache))
+
+            # A new version of the object is queried again
+            self.s3.put_object(bucket_name='test-bucket', key='test-key/file.json', body='{"test": 2}')
+            results.append(EngineWrapper().execute(sql_query='SELECT * FROM s3object s', extra_func=None,
+                                                   extra_func_args=None, engine=sequential_engine,
+                                                   input_serialization={}, output_serialization={},
+                                                   s3_client=client, result_cache=result_cache))
+
+        self.assertEqual(client.selects, 2)
+        self.assertListEqual([result.payload for result in results], [['{"test": 1}\n']] * 3)
+
+        self.assertEqual(results[0].stats.cache_hits, 0)
+        self.assertEqual(results[0].stats.cost_saved, 0)
+        self.assertEqual(results[1].stats.cache_hits, 1)
+        self.assertEqual(results[1].stats.bytes_scanned, 0)
+        self.assertEqual(results[1].stats.cost_saved, results[0].stats.cost)
+        self.assertEqual(results[2].stats.cache_hits, 0)
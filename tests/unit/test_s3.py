@@ -1,6 +1,10 @@
+import time
+import threading
+from datetime import datetime
 from moto import mock_s3
 
 from select_plus.src.aws.s3 import S3
+from select_plus.src.cache.listing_cache import ListingCache
 from tests.util.test_wrapper import TestWrapper
 
 
@@ -32,11 +36,94 @@ class TestS3(TestWrapper):
     def test_list_objects_raises_without_files_present(self):
         self.assertRaises(RuntimeError, self.s3.list_objects, bucket_name='test-bucket', prefix='some-wrong-prefix')
 
+    def test_iter_objects_yields_pages(self):
+        for i in range(2000):
+            self.s3.put_object(bucket_name='test-bucket',
+                               key=f'test-key/test{i}.json',
+                               body=b'{"test": 1}')
+
+        pages = list(self.s3.iter_objects(bucket_name='test-bucket', prefix='test-key'))
+
+        self.assertListEqual([len(page) for page in pages], [1000, 1000, 1])
+        self.assertEqual(pages[0][0]['key'], 'test-key/file.json')
+        self.assertEqual(pages[0][0]['size'], 11)
+
+    def test_iter_objects_raises_without_files_present(self):
+        pages = self.s3.iter_objects(bucket_name='test-bucket', prefix='some-wrong-prefix')
+        self.assertRaises(RuntimeError, list, pages)
+
+    def test_iter_objects_by_prefix_keeps_listing_order(self):
+        self.s3.put_object(bucket_name='test-bucket', key='large_json/file.json', body=b'{"test": 1}')
+        for prefix in range(5):
+            for i in range(3):
+                self.s3.put_object(bucket_name='test-bucket', key=f'large_json/{prefix}/file{i}.json',
+                                   body=b'{"test": 1}')
+
+        expected = self.s3.list_objects(bucket_name='test-bucket', prefix='large')
+        for list_concurrency in [2, 8]:
+            objects_in_bucket = self.s3.list_objects(bucket_name='test-bucket', prefix='large',
+                                                     list_concurrency=list_concurrency)
+            self.assertDictEqual(objects_in_bucket, expected)
+        self.assertEqual(expected['total_files'], 16)
+
+    def test_iter_objects_by_prefix_raises_without_files_present(self):
+        pages = self.s3.iter_objects(bucket_name='test-bucket', prefix='some-wrong-prefix', list_concurrency=4)
+        self.assertRaises(RuntimeError, list, pages)
+
+    def test_iter_objects_by_prefix_bounds_concurrency(self):
+        class SlowListingClient:
+            def __init__(self):
+                self.lock = threading.Lock()
+                self.running = 0
+                self.max_running = 0
+
+            def get_paginator(self, *args, **kwargs):
+                return self
+
+            def paginate(self, Bucket: str, Prefix: str, Delimiter: str = None):
+                if Delimiter:
+                    yield {'CommonPrefixes': [{'Prefix': f'{Prefix}{i}/'} for i in range(8)]}
+                    return
+
+                with self.lock:
+                    self.running += 1
+                    self.max_running = max(self.max_running, self.running)
+                time.sleep(0.05)
+                with self.lock:
+                    self.running -= 1
+                yield {'Contents': [{'Key': f'{Prefix}file.json', 'Size': 1}]}
+
+        client = SlowListingClient()
+        s3 = S3(client=client)
+        pages = list(s3.iter_objects(bucket_name='test-bucket', prefix='data/', list_concurrency=3))
+
+        self.assertListEqual([page[0]['key'] for page in pages], [f'data/{i}/file.json' for i in range(8)])
+        self.assertEqual(client.max_running, 3)
+
     def test_list_objects_response(self):
         objects_in_bucket = self.s3.list_objects(bucket_name='test-bucket',
                                                  prefix='test')
-        expected_response = {'keys': ['test-key/file.json'], 'total_file_size': 11, 'total_files': 1}
+        last_modified = objects_in_bucket['objects'][0].pop('last_modified')
+        expected_response = {'keys': ['test-key/file.json'], 'total_file_size': 11, 'total_files': 1,
+                             'objects': [{'key': 'test-key/file.json', 'size': 11,
+                                          'etag': '96db854b55b71e6b6298e93df0b6a176'}]}
         self.assertEqual(objects_in_bucket, expected_response)
+        self.assertIsInstance(last_modified, datetime)
+
+    def test_list_objects_with_listing_cache(self):
+        listing_cache = ListingCache(ttl=60)
+        objects_in_bucket = self.s3.list_objects(bucket_name='test-bucket', prefix='test',
+                                                 listing_cache=listing_cache)
+
+        # Listed from the cache: the new object is not seen until the listing is invalidated
+        self.s3.put_object(bucket_name='test-bucket', key='test-key/new.json', body=b'{"test": 1}')
+        self.assertDictEqual(self.s3.list_objects(bucket_name='test-bucket', prefix='test',
+                                                  listing_cache=listing_cache), objects_in_bucket)
+
+        listing_cache.invalidate(bucket_name='test-bucket', prefix='test')
+        objects_in_bucket = self.s3.list_objects(bucket_name='test-bucket', prefix='test',
+                                                 listing_cache=listing_cache)
+        self.assertEqual(objects_in_bucket['total_files'], 2)
 
     # NO IMPLEMENTATION ON MOTO FOR S3 SELECT YET
     # A mocked class has been created to make sure the functionality is correct in the S3 class
@@ -55,3 +142,61 @@ class TestS3(TestWrapper):
                              'stats': {'bytes_scanned': 1, 'bytes_processed': 2, 'bytes_returned': 3}}
 
         self.assertDictEqual(response, expected_response)
+
+    def test_select_iter_json(self):
+        s3 = S3(client=self.mock_s3_client)
+
+        response = list(s3.select_iter(
+            bucket_name='test-bucket',
+            key='test/test.json',
+            sql_string='SELECT * FROM s3object[*] s',
+            input_serialization={},
+            output_serialization={}
+        ))
+
+        expected_response = [
+            {'payload': 'test'},
+            {'stats': {'bytes_scanned': 1, 'bytes_processed': 2, 'bytes_returned': 3}}
+        ]
+
+        self.assertListEqual(response, expected_response)
+
+    def test_select_iter_holds_back_split_records(self):
+        class SplitRecordsClient:
+            @staticmethod
+            def select_object_content(*args, **kwargs):
+                payload = [
+                    {"Records": {"Payload": b'{"a":1}\n{"a":'}},
+                    {"Records": {"Payload": '2}\n{"b":"é'.encode()[:-1]}},
+                    {"Records": {"Payload": 'é"}\n'.encode()[1:]}},
+                    {"End": {}}
+                ]
+                return {"Payload": payload}
+
+        s3 = S3(client=SplitRecordsClient())
+
+        response = list(s3.select_iter(
+            bucket_name='test-bucket',
+            key='test/test.json',
+            sql_string='SELECT * FROM s3object[*] s',
+            input_serialization={},
+            output_serialization={'JSON': {}}
+        ))
+
+        expected_response = [{'payload': '{"a":1}\n'}, {'payload': '{"a":2}\n'}, {'payload': '{"b":"é"}\n'}]
+        self.assertListEqual(response, expected_response)
+
+    def test_client_is_reused(self):
+        S3.clear_clients()
+        self.assertIs(S3().client, S3().client)
+
+    def test_client_is_cached_per_pool_size(self):
+        S3.clear_clients()
+        self.assertIsNot(S3(max_pool_connections=10).client, S3(max_pool_connections=50).client)
+        self.assertEqual(S3(max_pool_connections=50).client.meta.config.max_pool_connections, 50)
+
+    def test_injected_client_is_not_cached(self):
+        S3.clear_clients()
+        s3 = S3(client=self.mock_s3_client)
+        self.assertIs(s3.client, self.mock_s3_client)
+        self.assertDictEqual(S3._clients, {})
@@ -1,6 +1,9 @@
 from moto import mock_s3
-from tests.util.test_wrapper import TestWrapper
+from tests.util.test_wrapper import TestWrapper, MockPagedS3Client
+from select_plus.src.engine.engine import EngineWrapper
 from select_plus.src.engine.sequential_engine import SequentialEngine
+from select_plus.src.utils.budget import Budget
+from select_plus.src.utils.cost import Cost
 
 
 @mock_s3
@@ -91,3 +94,71 @@ class TestSequentialEngine(TestWrapper):
         ]
 
         self.assertListEqual(expected_response, result)
+
+    def test_execute_with_scan_ranges(self):
+        self.s3.put_object(bucket_name='test-bucket', key='test-key/large.json', body='{"a":1}\n{"a":2}\n{"a":3}\n')
+
+        class ScanRangeClient:
+            def __init__(self, client):
+                self.client = client
+
+            def get_paginator(self, *args, **kwargs):
+                return self.client.get_paginator(*args, **kwargs)
+
+            @staticmethod
+            def select_object_content(Key: str, ScanRange: dict = None, **kwargs):
+                payload = f'{Key}:{ScanRange["Start"]}-{ScanRange["End"]}\n' if ScanRange else f'{Key}\n'
+                return {"Payload": [
+                    {"Records": {"Payload": payload.encode()}},
+                    {"Stats": {"Details": {"BytesScanned": 1, "BytesProcessed": 1, "BytesReturned": 1}}}
+                ]}
+
+        sequential_engine = SequentialEngine(
+            bucket_name='test-bucket',
+            prefix='test-key',
+            threads=1,
+            verbose=False
+        )
+
+        result = sequential_engine.execute(
+            sql_query='',
+            s3_client=ScanRangeClient(self.client),
+            input_serialization={'CompressionType': 'NONE', 'JSON': {'Type': 'LINES'}},
+            output_serialization={},
+            scan_range_size=11
+        )
+
+        expected_response = [
+            {'payload': 'test-key/file.json\n', 'stats': {'bytes_scanned': 1, 'bytes_processed': 1, 'bytes_returned': 1}},
+            {'payload': 'test-key/large.json:0-10\ntest-key/large.json:11-21\ntest-key/large.json:22-23\n',
+             'stats': {'bytes_scanned': 3, 'bytes_processed': 3, 'bytes_returned': 3, 'requests': 3}}
+        ]
+        self.assertListEqual(expected_response, result)
+
+        # Each part is billed as a request, as by the budget
+        budget = Budget(max_cost=1.0)
+        results = EngineWrapper().execute(sql_query='', extra_func=None, extra_func_args=None, engine=sequential_engine,
+                                          input_serialization={'CompressionType': 'NONE', 'JSON': {'Type': 'LINES'}},
+                                          output_serialization={}, s3_client=ScanRangeClient(self.client),
+                                          scan_range_size=11, budget=budget)
+        self.assertEqual(results.stats.cost, Cost().compute_block(data_scanned=4, data_returned=4, files_requested=4))
+        self.assertEqual(results.stats.cost, budget.spent)
+
+    def test_execute_queries_while_listing(self):
+        client = MockPagedS3Client(pages=3)
+        sequential_engine = SequentialEngine(
+            bucket_name='test',
+            prefix='test',
+            threads=1,
+            verbose=False
+        )
+
+        result = sequential_engine.execute(
+            sql_query='',
+            s3_client=client,
+            input_serialization={},
+            output_serialization={}
+        )
+
+        self.assertEqual(len(result), 3)
+        self.assertListEqual(client.events, ['page-0', 'test0.json', 'page-1', 'test1.json', 'page-2', 'test2.json'])
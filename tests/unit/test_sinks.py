@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+from moto import mock_s3
+
+from select_plus.src.engine.engine import EngineWrapper
+from select_plus.src.engine.sequential_engine import SequentialEngine
+from select_plus.src.sinks.sinks import DirectorySink, ParquetSink
+from tests.util.test_wrapper import TestWrapper
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+@mock_s3
+class TestSinks(TestWrapper):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_directory_sink_text(self):
+        sink = DirectorySink(path=self.path)
+        reference = sink.write('prefix/file.json', '{"a":1}\n', {'JSON': {}})
+
+        self.assertEqual(reference, os.path.join(self.path, 'prefix%2F/file.json.json'))
+        self.assertEqual(sink.read(reference), '{"a":1}\n')
+        self.assertEqual(sink.write('prefix/file.csv', '1\n', {'CSV': {}}),
+                         os.path.join(self.path, 'prefix%2F/file.csv.csv'))
+
+    def test_directory_sink_bytes(self):
+        sink = DirectorySink(path=self.path)
+        reference = sink.write('prefix/file.json', b'arrow', {'JSON': {}})
+
+        self.assertEqual(reference, os.path.join(self.path, 'prefix%2F/file.json.arrow'))
+        self.assertEqual(sink.read(reference), b'arrow')
+
+    def test_directory_sink_raises_on_other_payloads(self):
+        sink = DirectorySink(path=self.path)
+        self.assertRaises(RuntimeError, sink.write, 'file.json', {'a': 1}, {'JSON': {}})
+
+    def test_directory_sink_writes_every_key_to_its_own_file(self):
+        sink = DirectorySink(path=self.path)
+        keys = ['data/', 'data/a', 'data/a/b.json', 'data/a.json/b', '../file.json', '/x', 'results/part-00000']
+        references = [sink.write(key, key, {'JSON': {}}) for key in keys]
+
+        self.assertEqual(len(set(references)), len(keys))
+        self.assertListEqual([sink.read(reference) for reference in references], keys)
+        root = os.path.abspath(self.path)
+        self.assertTrue(all(os.path.commonpath([root, os.path.abspath(reference)]) == root
+                            for reference in references))
+
+        # The merged records are apart from the results of the objects
+        self.assertEqual(sink.write_merged('part-00000', 'merged', {'JSON': {}}),
+                         os.path.join(self.path, 'results', 'part-00000.json'))
+        self.assertEqual(sink.read(references[-1]), 'results/part-00000')
+
+    @unittest.skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_parquet_sink(self):
+        sink = ParquetSink(path=self.path)
+        reference = sink.write('prefix/file.json', '{"a":1}\n{"a":2}\n', {'JSON': {}})
+
+        self.assertEqual(reference, os.path.join(self.path, 'prefix%2F/file.json.parquet'))
+        self.assertDictEqual(sink.read(reference).to_pydict(), {'a': [1, 2]})
+
+    def test_engine_writes_to_sink(self):
+        sink = DirectorySink(path=self.path)
+        sequential_engine = SequentialEngine(bucket_name='test', prefix='test', threads=1, verbose=False)
+
+        results = EngineWrapper().execute(
+            sql_query='',
+            extra_func=None,
+            extra_func_args=None,
+            engine=sequential_engine,
+            input_serialization={},
+            output_serialization={},
+            s3_client=self.mock_s3_client,
+            sink=sink
+        )
+
+        self.assertListEqual(results.payload, [os.path.join(self.path, 'test.json.json')])
+        self.assertListEqual(list(results.iter_payload()), ['test'])
+        self.assertEqual(results.stats.bytes_scanned, 1)
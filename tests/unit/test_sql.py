@@ -0,0 +1,18 @@
+import unittest
+
+from select_plus.src.utils.sql import parse_limit, with_limit
+
+
+class TestSQL(unittest.TestCase):
+
+    def test_parse_limit(self):
+        self.assertEqual(parse_limit('SELECT * FROM s3object s LIMIT 100'), 100)
+        self.assertEqual(parse_limit('select * from s3object s limit 5;'), 5)
+        self.assertIsNone(parse_limit('SELECT * FROM s3object s'))
+        self.assertIsNone(parse_limit("SELECT * FROM s3object s WHERE s.a = 'LIMIT 5' AND s.b = 1"))
+
+    def test_with_limit(self):
+        self.assertEqual(with_limit('SELECT * FROM s3object s', 10), 'SELECT * FROM s3object s LIMIT 10')
+        self.assertEqual(with_limit('SELECT * FROM s3object s;', 10), 'SELECT * FROM s3object s LIMIT 10')
+        self.assertEqual(with_limit('SELECT * FROM s3object s LIMIT 5', 10), 'SELECT * FROM s3object s LIMIT 5')
+        self.assertEqual(with_limit('SELECT * FROM s3object s LIMIT 50', 10), 'SELECT * FROM s3object s LIMIT 10')
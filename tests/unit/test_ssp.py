@@ -1,7 +1,14 @@
 from moto import mock_s3
 from select_plus.ssp import SSP
 from select_plus.src.engine.engine import EngineResults
-from tests.util.test_wrapper import TestWrapper, MockEngine
+from select_plus.src.engine.threaded_engine import ThreadedEngine
+from tests.util.test_wrapper import TestWrapper, MockEngine, MockPagedS3Client
+
+
+class PagedThreadedEngine(ThreadedEngine):
+
+    def execute(self, **kwargs):
+        return super().execute(s3_client=MockPagedS3Client(pages=3), **kwargs)
 
 
 @mock_s3
@@ -16,7 +23,7 @@ class TestSSP(TestWrapper):
         )
 
         cost = ssp.estimate_cost()
-        self.assertEqual(cost, 3.04e-11)
+        self.assertAlmostEqual(cost, 4.000297e-07, places=15)
 
     def test_select_type(self):
         ssp = SSP(
@@ -60,7 +67,7 @@ class TestSSP(TestWrapper):
         )
         expected_result = results.stats.cost
 
-        self.assertEqual(expected_result, 6.77e-11)
+        self.assertAlmostEqual(expected_result, 4.00067e-07, places=15)
 
     def test_select_files_processed(self):
         ssp = SSP(
@@ -128,3 +135,49 @@ class TestSSP(TestWrapper):
 
         self.assertRaises(RuntimeError, SSP, bucket_name='test-bucket', prefix='test-key', engine=WrongEngine)
 
+    def test_select_iter(self):
+        ssp = SSP(
+            bucket_name='test-bucket',
+            prefix='test-key',
+            verbose=False,
+            engine=MockEngine
+        )
+
+        results = list(ssp.select_iter(
+            sql_query='SELECT * FROM s3object s',
+            s3_client=self.mock_s3_client
+        ))
+        expected_result = [
+            {'key': 'test.json', 'payload': 'test'},
+            {'key': 'test.json', 'stats': {'bytes_scanned': 1, 'bytes_processed': 2, 'bytes_returned': 3}}
+        ]
+
+        self.assertListEqual(results, expected_result)
+
+    def test_session_reuses_engine(self):
+        with SSP(bucket_name='test-bucket', prefix='test-key', engine=MockEngine).open(threads=2) as ssp:
+            engine = ssp._session_engine
+            ssp.select(sql_query='SELECT * FROM s3object s')
+            results = ssp.select(sql_query='SELECT * FROM s3object s')
+            self.assertIs(engine, ssp._session_engine)
+            self.assertEqual(engine.threads, 2)
+            self.assertListEqual(results.payload, ['test'])
+
+        self.assertIsNone(ssp._session_engine)
+
+    def test_session_raises_when_already_open(self):
+        ssp = SSP(bucket_name='test-bucket', prefix='test-key', engine=MockEngine).open()
+        self.assertRaises(RuntimeError, ssp.open)
+        ssp.close()
+
+    def test_select_schedule(self):
+        ssp = SSP(bucket_name='test-bucket', prefix='test-key', engine=PagedThreadedEngine)
+
+        results = ssp.select(sql_query='SELECT * FROM s3object s', schedule='listing')
+
+        self.assertListEqual(results.payload, ['test', 'test', 'test'])
+        self.assertRaises(RuntimeError, ssp.select, sql_query='SELECT * FROM s3object s', schedule='random')
+
+    def test_select_schedule_requires_parallel_or_threaded_engine(self):
+        ssp = SSP(bucket_name='test-bucket', prefix='test-key', engine=MockEngine)
+        self.assertRaises(RuntimeError, ssp.select, sql_query='SELECT * FROM s3object s', schedule='listing')
@@ -0,0 +1,134 @@
+import threading
+from moto import mock_s3
+from tests.util.test_wrapper import TestWrapper, MockPagedS3Client
+from select_plus.src.engine.threaded_engine import ThreadedEngine
+
+
+@mock_s3
+class TestThreadedEngine(TestWrapper):
+
+    def test_execute_with_verbose_flag(self):
+        threaded_engine = ThreadedEngine(
+            bucket_name='test',
+            prefix='test',
+            threads=4,
+            verbose=True
+        )
+
+        response = threaded_engine.execute(
+            sql_query='',
+            s3_client=self.mock_s3_client,
+            input_serialization={},
+            output_serialization={}
+        )
+        expected_response = [{'payload': 'test', 'stats': {'bytes_scanned': 1, 'bytes_processed': 2, 'bytes_returned': 3}}]
+        self.assertListEqual(expected_response, response)
+
+    def test_execute_without_verbose_flag(self):
+        threaded_engine = ThreadedEngine(
+            bucket_name='test',
+            prefix='test',
+            threads=4,
+            verbose=False
+        )
+
+        response = threaded_engine.execute(
+            sql_query='',
+            s3_client=self.mock_s3_client,
+            input_serialization={},
+            output_serialization={}
+        )
+        expected_response = [{'payload': 'test', 'stats': {'bytes_scanned': 1, 'bytes_processed': 2, 'bytes_returned': 3}}]
+        self.assertListEqual(expected_response, response)
+
+    def test_execute_with_extra_function(self):
+        threaded_engine = ThreadedEngine(
+            bucket_name='test',
+            prefix='test',
+            threads=4,
+            verbose=False
+        )
+
+        def extra_func(response, extra_field: str):
+            response = f'{response}-{extra_field}'
+            return response
+
+        result = threaded_engine.execute(
+            sql_query='',
+            s3_client=self.mock_s3_client,
+            extra_func=extra_func,
+            extra_func_args={"extra_field": "test"},
+            input_serialization={},
+            output_serialization={}
+        )
+
+        expected_response = [
+            {'stats': {'bytes_scanned': 1, 'bytes_processed': 2, 'bytes_returned': 3}, 'payload': 'test-test'}
+        ]
+
+        self.assertListEqual(expected_response, result)
+
+    def test_execute_keeps_listing_order(self):
+        for i in range(20):
+            self.s3.put_object(bucket_name='test-bucket', key=f'test-key/file{i:02}.json', body='{"test": 1}')
+
+        threaded_engine = ThreadedEngine(
+            bucket_name='test-bucket',
+            prefix='test-key',
+            threads=8,
+            verbose=False
+        )
+
+        class KeyEchoClient:
+            def __init__(self, client):
+                self.client = client
+
+            def get_paginator(self, *args, **kwargs):
+                return self.client.get_paginator(*args, **kwargs)
+
+            @staticmethod
+            def select_object_content(Key: str, **kwargs):
+                return {"Payload": [{"Records": {"Payload": Key.encode()}}]}
+
+        result = threaded_engine.execute(
+            sql_query='',
+            s3_client=KeyEchoClient(self.client),
+            input_serialization={},
+            output_serialization={}
+        )
+
+        expected_keys = ['test-key/file.json'] + [f'test-key/file{i:02}.json' for i in range(20)]
+        self.assertListEqual(expected_keys, [record['payload'] for record in result])
+
+    def test_execute_queries_while_listing(self):
+        queried = threading.Event()
+
+        class WaitingClient(MockPagedS3Client):
+            def paginate(self, Bucket: str, Prefix: str):
+                for i, page in enumerate(super().paginate(Bucket, Prefix)):
+                    if i > 0:
+                        # The first page must be queried before the next one is listed
+                        self.events.append(queried.wait(timeout=10))
+                    yield page
+
+            def select_object_content(self, *args, **kwargs):
+                queried.set()
+                return super().select_object_content(*args, **kwargs)
+
+        client = WaitingClient(pages=2)
+        threaded_engine = ThreadedEngine(
+            bucket_name='test',
+            prefix='test',
+            threads=4,
+            verbose=False
+        )
+
+        result = threaded_engine.execute(
+            sql_query='',
+            s3_client=client,
+            input_serialization={},
+            output_serialization={}
+        )
+
+        self.assertEqual(len(result), 2)
+        self.assertIn(True, client.events)
@@ -3,6 +3,7 @@ import boto3
 from moto import mock_s3
 from select_plus.src.aws.s3 import S3
 from select_plus.src.engine.base_engine import BaseEngine
+from select_plus.src.engine.sequential_engine import SequentialEngine
 
 
 class MockS3Paginator:
@@ -52,6 +53,55 @@ class MockS3Client:
         return MockS3Paginator()
 
 
+class MockPagedS3Client(MockS3Client):
+    """
+    Lists one object per page and records when each page is listed and each object is queried.
+    """
+
+    def __init__(self, pages: int):
+        self.pages = pages
+        self.events = []
+
+    def get_paginator(self, *args, **kwargs):
+        return self
+
+    def paginate(self, Bucket: str, Prefix: str):
+        for i in range(self.pages):
+            self.events.append(f'page-{i}')
+            yield {'KeyCount': 1, 'Contents': [{"Key": f'test{i}.json', "Size": 123}]}
+
+    def select_object_content(self, *args, **kwargs):
+        self.events.append(kwargs['Key'])
+        return super().select_object_content(*args, **kwargs)
+
+
+class CountingClient:
+    """
+    Lists the objects with the moto client and counts the selects (not implemented by moto).
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.keys = []
+
+    def get_paginator(self, *args, **kwargs):
+        return self.client.get_paginator(*args, **kwargs)
+
+    def select_object_content(self, Key: str, **kwargs):
+        self.keys.append(Key)
+        return {"Payload": [
+            {"Records": {"Payload": f'{Key}\n'.encode()}},
+            {"Stats": {"Details": {"BytesScanned": 1, "BytesProcessed": 1, "BytesReturned": 1}}}
+        ]}
+
+
+class CountingEngine(SequentialEngine):
+    client = None
+
+    def execute(self, **kwargs):
+        return super().execute(s3_client=self.client, **kwargs)
+
+
 class MockEngine(BaseEngine):
     def execute(self, sql_query: str, input_serialization: dict, output_serialization: dict,
                 extra_func: callable = None, extra_func_args: dict = None, s3_client=None):